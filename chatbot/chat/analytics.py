@@ -0,0 +1,183 @@
+# chat/analytics.py
+
+import atexit
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import serialization
+from .llm_schemas import Status
+from .models import ClassificationRollup
+
+
+def truncate_hour(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def bucket_key(timestamp: datetime, topic_category, status) -> tuple:
+    """Rollup bucket of one AI reply; NULL columns count under ''."""
+    return truncate_hour(timestamp), topic_category or '', status or ''
+
+
+def add_counts(counts: Counter) -> int:
+    """Adds {bucket_key: n} to the rollup table, one UPDATE (or INSERT) per bucket."""
+    with transaction.atomic():
+        for (hour, topic_category, status), count in counts.items():
+            updated = ClassificationRollup.objects.filter(
+                hour=hour, topic_category=topic_category, status=status).update(count=F('count') + count)
+            if not updated:
+                ClassificationRollup.objects.create(hour=hour, topic_category=topic_category, status=status,
+                                                    count=count)
+    return len(counts)
+
+
+# --- 1. Incremental Rollups ---
+
+class RollupAccumulator:
+    """
+    Counts AI replies per (hour, topic_category, status) in memory as they are logged
+    and adds the counts to ClassificationRollup from a background thread every
+    `flush_interval` seconds: one UPDATE per touched bucket instead of a write per
+    message. Counts not yet flushed when a process dies are lost; `manage.py
+    rollup_analytics` recomputes closed hours exactly from Message.
+    """
+
+    def __init__(self, flush_interval: float = 10.0, start: bool = True):
+        self.flush_interval = flush_interval
+        self._pending = Counter()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.recorded = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+
+        if start:
+            self._thread = threading.Thread(target=self._run, name='analytics-rollups', daemon=True)
+            self._thread.start()
+            atexit.register(self.shutdown)
+
+    def record(self, timestamp: datetime, topic_category, status):
+        with self._lock:
+            self._pending[bucket_key(timestamp, topic_category, status)] += 1
+            self.recorded += 1
+
+    def flush(self) -> int:
+        """Writes the pending counts; returns the number of buckets touched."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, Counter()
+            if not pending:
+                return 0
+            try:
+                touched = add_counts(pending)
+                self.flushes += 1
+                return touched
+            except Exception as e:
+                # Put the counts back so the next flush retries them
+                print(f"Analytics rollup flush failed, retrying later: {e}")
+                self.failed_flushes += 1
+                with self._lock:
+                    self._pending.update(pending)
+                return 0
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            close_old_connections()
+            self.flush()
+
+    def shutdown(self):
+        """Stops the background thread and writes any pending counts."""
+        self._stop.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            pending = sum(self._pending.values())
+        return {"recorded": self.recorded, "pending": pending, "flushes": self.flushes,
+                "failed_flushes": self.failed_flushes}
+
+
+_accumulator = None
+_accumulator_lock = threading.Lock()
+
+
+def get_rollup_accumulator() -> RollupAccumulator | None:
+    """Returns the process-wide accumulator, or None when ANALYTICS_ROLLUPS_ENABLED is off."""
+    global _accumulator
+    if not getattr(settings, 'ANALYTICS_ROLLUPS_ENABLED', False):
+        return None
+    with _accumulator_lock:
+        if _accumulator is None:
+            _accumulator = RollupAccumulator(getattr(settings, 'ANALYTICS_FLUSH_INTERVAL', 10.0))
+        return _accumulator
+
+
+def record_messages(messages):
+    """Counts the AI replies among logged Message rows (user messages carry no classification)."""
+    accumulator = get_rollup_accumulator()
+    if accumulator is None:
+        return
+    for message in messages:
+        if message.sender == 'ai':
+            accumulator.record(message.timestamp, message.topic_category, message.status)
+
+
+# --- 2. Stats Read Path ---
+
+def build_stats(hours: int, now: datetime | None = None) -> dict:
+    """
+    Topic x status counts and escalation rates for the last `hours` hours (the current,
+    still open hour included), read from the rollup table only.
+    """
+    end = truncate_hour(now or timezone.now()) + timedelta(hours=1)
+    start = end - timedelta(hours=hours)
+    rows = (
+        ClassificationRollup.objects.filter(hour__gte=start, hour__lt=end)
+        .order_by('hour').values_list('hour', 'topic_category', 'status', 'count')
+    )
+
+    def empty_bucket():
+        return {"total": 0, "escalations": 0, "escalation_rate": 0.0, "by_topic_status": {}}
+
+    def add(bucket, topic_category, status, count):
+        bucket["total"] += count
+        if status == Status.ESCALATE.value:
+            bucket["escalations"] += count
+        by_status = bucket["by_topic_status"].setdefault(topic_category or 'none', {})
+        by_status[status or 'none'] = by_status.get(status or 'none', 0) + count
+
+    totals, hourly = empty_bucket(), {}
+    for hour, topic_category, status, count in rows:
+        add(totals, topic_category, status, count)
+        add(hourly.setdefault(hour, empty_bucket()), topic_category, status, count)
+
+    for bucket in [totals, *hourly.values()]:
+        bucket["escalation_rate"] = round(bucket["escalations"] / bucket["total"], 4) if bucket["total"] else 0.0
+    return {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "totals": totals,
+        "hourly": [{"hour": hour.isoformat(), **bucket} for hour, bucket in hourly.items()],
+    }
+
+
+def get_stats_payload(hours: int) -> bytes:
+    """Encoded build_stats() result, cached for ANALYTICS_STATS_CACHE_TTL seconds."""
+    cache = caches[getattr(settings, 'ANALYTICS_CACHE_ALIAS', 'default')]
+    key = f"analytics:stats:{hours}"
+    payload = cache.get(key)
+    if payload is None:
+        payload = serialization.dumps(build_stats(hours))
+        cache.set(key, payload, getattr(settings, 'ANALYTICS_STATS_CACHE_TTL', 30))
+    return payload
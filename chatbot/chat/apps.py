@@ -1,5 +1,24 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ChatConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'  # Matches 0001_initial
     name = 'chat'
+
+    def ready(self):
+        from . import signals  # noqa: F401 (registers the Message signal handlers)
+
+        # Load the knowledge base early when retrieval is enabled so its section index is
+        # embedded on a background thread before the first requests need it
+        if settings.RAG_RETRIEVAL_ENABLED:
+            from .knowledge_base import get_knowledge_base
+
+            get_knowledge_base()
+
+        # Heavy clients and artifacts are built lazily; optionally start building them right
+        # away on a background thread so the first requests do not pay for it
+        if getattr(settings, 'WARMUP_ON_STARTUP', False):
+            from .warmup import start_background_warm_up
+
+            start_background_warm_up()
@@ -0,0 +1,90 @@
+# chat/archive.py
+
+import json
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from . import serialization
+from .models import ConversationArchive, Message
+
+# Column order of one archived message in the payload
+ARCHIVED_FIELDS = ('id', 'sender', 'text', 'timestamp', 'topic_category', 'status', 'knowledge_base_version')
+
+
+def encode_messages(messages) -> bytes:
+    """zlib-compressed JSON array of [id, sender, text, timestamp, topic_category, status, kb_version] rows."""
+    rows = [
+        [message.pk, message.sender, message.text, message.timestamp.isoformat(), message.topic_category,
+         message.status, message.knowledge_base_version]
+        for message in messages
+    ]
+    return zlib.compress(serialization.dumps(rows), 9)
+
+
+def decode_rows(payload) -> list[dict]:
+    """The archived messages of a payload as {field: value} dicts, timestamps parsed."""
+    rows = []
+    for row in json.loads(zlib.decompress(payload)):
+        fields = dict(zip(ARCHIVED_FIELDS, row))
+        fields['timestamp'] = parse_datetime(fields['timestamp'])
+        rows.append(fields)
+    return rows
+
+
+def decode_messages(conversation, payload) -> list[Message]:
+    """Rebuilds the unsaved Message rows of an archive payload, keeping their original ids."""
+    return [Message(conversation=conversation, **fields) for fields in decode_rows(payload)]
+
+
+def archive_conversation(conversation) -> int:
+    """
+    Moves a conversation's Message rows into its ConversationArchive blob (merging with
+    any earlier archive) and marks it archived, in one transaction. Returns the number
+    of messages moved. Deleting the rows cascades to their Reclassification results,
+    so callers skip reclassified conversations.
+    """
+    with transaction.atomic():
+        live = list(conversation.messages.order_by('timestamp', 'pk'))
+        if not live:
+            return 0
+        existing = ConversationArchive.objects.filter(conversation=conversation).first()
+        messages = (decode_messages(conversation, existing.payload) if existing else []) + live
+        ConversationArchive.objects.update_or_create(
+            conversation=conversation,
+            defaults={'payload': encode_messages(messages), 'message_count': len(messages)},
+        )
+        conversation.messages.all().delete()
+        type(conversation).objects.filter(pk=conversation.pk).update(archived=True)
+    conversation.archived = True
+    return len(live)
+
+
+def rehydrate(conversation) -> int:
+    """
+    Moves an archived conversation's messages back into the Message table with their
+    original ids and clears the flag; returns the number restored. Safe to call twice.
+    """
+    restored = 0
+    with transaction.atomic():
+        archive = ConversationArchive.objects.filter(conversation=conversation).first()
+        if archive is not None:
+            messages = decode_messages(conversation, archive.payload)
+            Message.objects.bulk_create(messages, batch_size=500, ignore_conflicts=True)
+            archive.delete()
+            restored = len(messages)
+        type(conversation).objects.filter(pk=conversation.pk).update(archived=False)
+    conversation.archived = False
+    return restored
+
+
+arehydrate = sync_to_async(rehydrate)
+
+
+def load_messages(conversation) -> list[Message]:
+    """Every message of a conversation in time order, whether archived or live, without rehydrating."""
+    archive = ConversationArchive.objects.filter(conversation=conversation).first()
+    archived = decode_messages(conversation, archive.payload) if archive else []
+    return archived + list(conversation.messages.order_by('timestamp', 'pk'))
@@ -0,0 +1,71 @@
+# chat/batch.py
+
+import json
+
+from django.conf import settings
+
+from . import archive
+from .models import Conversation, RECENT_TURNS
+
+# Same window as the single-message views: the last 10 messages of each conversation
+HISTORY_TURNS = RECENT_TURNS
+
+
+def parse_batch_request(body):
+    """
+    Parses a batch classify body: {"items": [{"session_id": ..., "user_message": ...}, ...]}.
+    Returns (items, error); items is a list of (session_id, user_message, item_error)
+    tuples in request order, and error is a body-level error dict or None.
+    """
+    try:
+        data = json.loads(body)
+    except json.JSONDecodeError:
+        return None, {"error": "Invalid JSON format in request body"}
+
+    items = data.get('items') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return None, {"status": "error", "message": "Expected a non-empty 'items' list."}
+
+    max_items = getattr(settings, 'BATCH_MAX_ITEMS', 1000)
+    if len(items) > max_items:
+        return None, {"status": "error", "message": f"A batch may contain at most {max_items} items."}
+
+    parsed = []
+    for item in items:
+        item = item if isinstance(item, dict) else {}
+        session_id = item.get('session_id')
+        user_message = str(item.get('user_message') or '').strip()
+        if not user_message or not session_id:
+            parsed.append((session_id, None, {"status": "error", "message": "Missing message or session ID."}))
+        else:
+            parsed.append((str(session_id), user_message, None))
+    return parsed, None
+
+
+async def aload_conversations(session_ids: list[str]) -> dict:
+    """Fetches (creating any missing) Conversation rows for all session_ids in bulk."""
+    conversations = {
+        conversation.session_id: conversation
+        async for conversation in Conversation.objects.filter(session_id__in=session_ids)
+    }
+    missing = [session_id for session_id in session_ids if session_id not in conversations]
+    if missing:
+        # ignore_conflicts covers sessions created concurrently by another request; it also
+        # means primary keys are not returned, so the new rows are read back
+        await Conversation.objects.abulk_create(
+            [Conversation(session_id=session_id) for session_id in missing], ignore_conflicts=True)
+        async for conversation in Conversation.objects.filter(session_id__in=missing):
+            conversations[conversation.session_id] = conversation
+    for conversation in conversations.values():
+        if conversation.archived:
+            await archive.arehydrate(conversation)
+    return conversations
+
+
+def load_histories(conversations: dict) -> dict:
+    """
+    Returns {session_id: [line, ...]} in chronological order, read from each
+    conversation's recent-turns snapshot (no query). The lists are copies, so callers
+    may extend them while classifying.
+    """
+    return {session_id: list(conversation.recent_turns) for session_id, conversation in conversations.items()}
@@ -0,0 +1,201 @@
+# chat/benchmarks/driver.py
+
+import asyncio
+import json
+import resource
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from django.db.backends.signals import connection_created
+from django.db import connections
+from django.test import AsyncClient, Client
+
+CORPORA_DIR = Path(__file__).resolve().parent / 'corpora'
+
+
+# --- 1. Corpora ---
+
+def load_corpus(name_or_path: str) -> list[dict]:
+    """
+    Loads a JSON-lines corpus of {"session": label, "turns": [message, ...]} records,
+    by path or by name from chat/benchmarks/corpora/.
+    """
+    path = Path(name_or_path)
+    if not path.exists():
+        path = CORPORA_DIR / f"{name_or_path}.jsonl"
+    with open(path) as corpus_file:
+        return [json.loads(line) for line in corpus_file if line.strip()]
+
+
+def expand_corpus(corpus: list[dict], total_conversations: int) -> list[tuple[str, list[str]]]:
+    """Replays the corpus round-robin, giving every replayed conversation a fresh session_id."""
+    return [
+        (f"bench-{corpus[i % len(corpus)]['session']}-{uuid.uuid4().hex[:12]}", corpus[i % len(corpus)]['turns'])
+        for i in range(total_conversations)
+    ]
+
+
+# --- 2. Measurement ---
+
+_active_timer = None
+
+
+def _dispatch_execute(execute, sql, params, many, context):
+    """Execute wrapper installed on every connection; forwards to the active DBTimer, if any."""
+    timer = _active_timer
+    if timer is None:
+        return execute(sql, params, many, context)
+    return timer(execute, sql, params, many, context)
+
+
+def _install_dispatcher(sender=None, connection=None, **kwargs):
+    if _dispatch_execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_dispatch_execute)
+
+
+# Connections are per thread (and the async ORM reuses a long-lived executor thread), so
+# the dispatcher is attached to each connection as it is opened rather than per run.
+connection_created.connect(_install_dispatcher)
+
+
+class DBTimer:
+    """Accumulates wall time spent executing SQL, across all threads, while active."""
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.queries = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.seconds += elapsed
+                self.queries += 1
+
+    def __enter__(self):
+        global _active_timer
+        for connection in connections.all(initialized_only=True):
+            _install_dispatcher(connection=connection)
+        _active_timer = self
+        return self
+
+    def __exit__(self, *exc):
+        global _active_timer
+        _active_timer = None
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process (one worker) in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def summarize(mode: str, concurrency: int, latencies: list[float], statuses: Counter,
+              wall_seconds: float, db_timer: DBTimer) -> dict:
+    """Builds the report row for one run (latencies in seconds)."""
+    latencies_ms = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    requests = len(latencies)
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": sum(count for status, count in statuses.items() if status >= 500 or status == 0),
+        "rps": requests / wall_seconds if wall_seconds else 0.0,
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p95_ms": float(np.percentile(latencies_ms, 95)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+        "db_ms_per_request": db_timer.seconds * 1000 / requests if requests else 0.0,
+        "db_queries_per_request": db_timer.queries / requests if requests else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def _payload(session_id: str, message: str) -> str:
+    return json.dumps({"user_message": message, "session_id": session_id})
+
+
+# --- 3. Drivers ---
+
+def run_wsgi(conversations, concurrency: int, path: str = '/api/classify/') -> dict:
+    """
+    Drives the sync (WSGI) handler in-process with `concurrency` threads, mirroring a
+    gunicorn deployment with that many sync workers/threads. Conversations run
+    concurrently; the turns within one conversation are sent in order.
+    """
+    latencies, statuses, lock = [], Counter(), threading.Lock()
+    local = threading.local()
+
+    def replay(conversation):
+        session_id, turns = conversation
+        client = getattr(local, 'client', None) or Client()
+        local.client = client
+        for message in turns:
+            started = time.perf_counter()
+            try:
+                status = client.post(path, _payload(session_id, message), content_type='application/json').status_code
+            except Exception:
+                status = 0
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                statuses[status] += 1
+
+    with DBTimer() as db_timer:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(replay, conversations))
+        wall = time.perf_counter() - started
+    return summarize('wsgi', concurrency, latencies, statuses, wall, db_timer)
+
+
+def run_asgi(conversations, concurrency: int, path: str = '/api/classify/async/') -> dict:
+    """Drives the ASGI handler in-process on one event loop with `concurrency` conversations in flight."""
+    latencies, statuses = [], Counter()
+
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+        client = AsyncClient()
+
+        async def replay(conversation):
+            session_id, turns = conversation
+            async with semaphore:
+                for message in turns:
+                    started = time.perf_counter()
+                    try:
+                        response = await client.post(path, _payload(session_id, message),
+                                                     content_type='application/json')
+                        status = response.status_code
+                    except Exception:
+                        status = 0
+                    latencies.append(time.perf_counter() - started)
+                    statuses[status] += 1
+
+        await asyncio.gather(*(replay(conversation) for conversation in conversations))
+
+    with DBTimer() as db_timer:
+        started = time.perf_counter()
+        asyncio.run(main())
+        wall = time.perf_counter() - started
+    return summarize('asgi', concurrency, latencies, statuses, wall, db_timer)
+
+
+def format_report(rows: list[dict]) -> str:
+    """Renders report rows as a fixed-width table."""
+    columns = ["mode", "concurrency", "requests", "errors", "rps", "p50_ms", "p95_ms", "p99_ms",
+               "db_ms_per_request", "db_queries_per_request", "peak_rss_mb"]
+    lines = ["  ".join(f"{column:>12}" for column in columns)]
+    for row in rows:
+        lines.append("  ".join(
+            f"{row[column]:>12.1f}" if isinstance(row[column], float) else f"{row[column]:>12}" for column in columns
+        ))
+    return "\n".join(lines)
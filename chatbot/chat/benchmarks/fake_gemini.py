@@ -0,0 +1,151 @@
+# chat/benchmarks/fake_gemini.py
+
+import asyncio
+import hashlib
+import random
+import time
+from types import SimpleNamespace
+
+import numpy as np
+from google.genai.errors import APIError
+
+from chat.llm_schemas import ClassificationOutput, TopicCategory, Status
+
+# Canned outputs returned by the fake client, picked deterministically per request contents
+DEFAULT_OUTPUTS = [
+    ClassificationOutput(topic=TopicCategory.LAB, status=Status.CLASSIFIED,
+                         response_message="Your lab appointment is confirmed. Please remember the 12-hour fast.",
+                         confidence=0.93, justification="Mentions lab appointment."),
+    ClassificationOutput(topic=TopicCategory.TWIN_APPOINTMENT, status=Status.CLASSIFIED,
+                         response_message="Your coaching session is confirmed. Your coach will call you at the scheduled time.",
+                         confidence=0.9, justification="Mentions a coaching session."),
+    ClassificationOutput(topic=TopicCategory.OTHERS, status=Status.ESCALATE,
+                         response_message="I'm sorry, I'm unable to help with that. I can forward this to a specialist and they'll respond via text within 1 business day.",
+                         confidence=0.8, justification="Unrelated request."),
+]
+
+
+class LatencyModel:
+    """Log-normal latency distribution parameterised by its median and p95, in milliseconds."""
+
+    def __init__(self, median_ms: float = 800.0, p95_ms: float = 1600.0, seed: int | None = None):
+        self.median_ms = median_ms
+        # p95 of a log-normal is median * exp(1.645 * sigma)
+        self.sigma = np.log(p95_ms / median_ms) / 1.645 if p95_ms > median_ms > 0 else 0.0
+        self._rng = random.Random(seed)
+
+    def sample(self) -> float:
+        """Returns one latency sample in seconds."""
+        if self.median_ms <= 0:
+            return 0.0
+        return self.median_ms * float(np.exp(self._rng.gauss(0.0, self.sigma))) / 1000.0
+
+
+class FakeGeminiClient:
+    """
+    Local stand-in for genai.Client covering the calls the classify path makes:
+    models.generate_content / generate_content_stream / embed_content, their aio
+    counterparts, and caches.create / delete. Latency follows `latency`, a fraction
+    `error_rate` of calls (plus the first `fail_first` calls) raise a 503 APIError,
+    and responses are canned ClassificationOutput JSON. Calls are counted in .calls.
+    """
+
+    def __init__(self, latency: LatencyModel | None = None, error_rate: float = 0.0,
+                 outputs: list[ClassificationOutput] | None = None, embedding_dim: int = 768,
+                 seed: int | None = None, fail_first: int = 0):
+        self.latency = latency or LatencyModel(seed=seed)
+        self.error_rate = error_rate
+        self.outputs = outputs or DEFAULT_OUTPUTS
+        self.embedding_dim = embedding_dim
+        self.calls = 0
+        self.fail_first = fail_first
+        self._rng = random.Random(seed)
+
+        self.models = SimpleNamespace(
+            generate_content=self._generate_content,
+            generate_content_stream=self._generate_content_stream,
+            embed_content=self._embed_content,
+        )
+        self.caches = SimpleNamespace(create=lambda **kwargs: SimpleNamespace(name="cachedContents/fake"),
+                                      delete=lambda **kwargs: None)
+        self.aio = SimpleNamespace(
+            models=SimpleNamespace(
+                generate_content=self._agenerate_content,
+                generate_content_stream=self._agenerate_content_stream,
+                embed_content=self._aembed_content,
+            ),
+            caches=SimpleNamespace(create=self._acreate_cache, delete=self._adelete_cache),
+        )
+
+    # --- Helpers ---
+
+    def _maybe_fail(self):
+        self.calls += 1
+        if self.calls <= self.fail_first or self._rng.random() < self.error_rate:
+            raise APIError(503, {"error": {"code": 503, "message": "Fake upstream unavailable", "status": "UNAVAILABLE"}})
+
+    def _output_for(self, contents) -> str:
+        digest = hashlib.md5(str(contents).encode('utf-8')).digest()
+        return self.outputs[digest[0] % len(self.outputs)].model_dump_json()
+
+    def _embeddings_for(self, contents):
+        texts = contents if isinstance(contents, list) else [contents]
+        embeddings = []
+        for text in texts:
+            seed = int.from_bytes(hashlib.md5(str(text).encode('utf-8')).digest()[:4], 'little')
+            values = np.random.default_rng(seed).standard_normal(self.embedding_dim).tolist()
+            embeddings.append(SimpleNamespace(values=values))
+        return SimpleNamespace(embeddings=embeddings)
+
+    @staticmethod
+    def _chunks(text: str, size: int = 12):
+        return [text[i:i + size] for i in range(0, len(text), size)]
+
+    # --- Sync API ---
+
+    def _generate_content(self, *, model, contents, config=None):
+        time.sleep(self.latency.sample())
+        self._maybe_fail()
+        return SimpleNamespace(text=self._output_for(contents), usage_metadata=None)
+
+    def _generate_content_stream(self, *, model, contents, config=None):
+        delay = self.latency.sample()
+        self._maybe_fail()
+        chunks = self._chunks(self._output_for(contents))
+        for chunk in chunks:
+            time.sleep(delay / len(chunks))
+            yield SimpleNamespace(text=chunk)
+
+    def _embed_content(self, *, model, contents, config=None):
+        time.sleep(self.latency.sample() / 4)
+        self._maybe_fail()
+        return self._embeddings_for(contents)
+
+    # --- Async API ---
+
+    async def _agenerate_content(self, *, model, contents, config=None):
+        await asyncio.sleep(self.latency.sample())
+        self._maybe_fail()
+        return SimpleNamespace(text=self._output_for(contents), usage_metadata=None)
+
+    async def _agenerate_content_stream(self, *, model, contents, config=None):
+        delay = self.latency.sample()
+        self._maybe_fail()
+        chunks = self._chunks(self._output_for(contents))
+
+        async def stream():
+            for chunk in chunks:
+                await asyncio.sleep(delay / len(chunks))
+                yield SimpleNamespace(text=chunk)
+        return stream()
+
+    async def _aembed_content(self, *, model, contents, config=None):
+        await asyncio.sleep(self.latency.sample() / 4)
+        self._maybe_fail()
+        return self._embeddings_for(contents)
+
+    async def _acreate_cache(self, **kwargs):
+        return SimpleNamespace(name="cachedContents/fake")
+
+    async def _adelete_cache(self, **kwargs):
+        return None
@@ -0,0 +1,184 @@
+# chat/fast_path.py
+
+import re
+import threading
+
+from django.conf import settings
+
+from .knowledge_base import CONFIRMATION_FILLER_WORDS, CONFIRMATION_PHRASES, CORRECTION_PHRASES, \
+    GENERIC_ACK_PHRASES, REQUEST_PHRASES, RULE_INDICATORS
+from .llm_schemas import ClassificationOutput, TopicCategory, Status, PYTHON_ESCALATION_MESSAGES, \
+    PYTHON_FAST_PATH_MESSAGES
+
+# --- 1. Aho-Corasick Multi-Pattern Matcher ---
+
+class AhoCorasickMatcher:
+    """
+    Single-pass multi-pattern matcher. The automaton is built once from a mapping of
+    label -> phrases; match() scans the text once and returns the set of labels whose
+    phrases occur on word boundaries (so "quest" does not fire inside "question").
+    """
+
+    def __init__(self, patterns: dict[str, list[str]]):
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._output: list[list[tuple[str, int]]] = [[]]  # (label, pattern length)
+
+        for label, phrases in patterns.items():
+            for phrase in phrases:
+                self._add(phrase.lower(), label)
+        self._build_failure_links()
+
+    def _add(self, phrase: str, label: str):
+        node = 0
+        for char in phrase:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            node = next_node
+        self._output[node].append((label, len(phrase)))
+
+    def _build_failure_links(self):
+        queue = list(self._goto[0].values())
+        for node in queue:
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def match(self, text: str) -> set[str]:
+        """Returns the labels of all phrases found in text (case-insensitive, word-bounded)."""
+        text = text.lower()
+        labels = set()
+        node = 0
+        for end, char in enumerate(text):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            for label, length in self._output[node]:
+                start = end - length + 1
+                before_ok = start == 0 or not text[start - 1].isalnum()
+                after_ok = end + 1 == len(text) or not text[end + 1].isalnum()
+                if before_ok and after_ok:
+                    labels.add(label)
+        return labels
+
+
+# --- 2. Fast-Path Classifier ---
+
+_NORMALIZE_RE = re.compile(r"[^\w\s-]")
+_GENERIC_ACKS = frozenset(GENERIC_ACK_PHRASES)
+_MATCHER = AhoCorasickMatcher(RULE_INDICATORS)
+
+_stats_lock = threading.Lock()
+FAST_PATH_STATS = {"hits": 0, "misses": 0}
+
+
+def normalize_message(text: str) -> str:
+    """Lowercases, strips punctuation and collapses whitespace."""
+    return " ".join(_NORMALIZE_RE.sub(" ", text.lower()).split())
+
+
+# Cue phrases are matched against normalized text, so they are normalized the same way
+_CUE_MATCHER = AhoCorasickMatcher({
+    "confirmation": [normalize_message(phrase) for phrase in CONFIRMATION_PHRASES],
+    "correction": [normalize_message(phrase) for phrase in CORRECTION_PHRASES],
+    "request": [normalize_message(phrase) for phrase in REQUEST_PHRASES],
+})
+
+# Word sequences a fast-path confirmation may be made of
+_CONFIRMATION_VOCABULARY = frozenset(
+    tuple(normalize_message(phrase).split())
+    for phrases in (CONFIRMATION_PHRASES, CONFIRMATION_FILLER_WORDS, *RULE_INDICATORS.values())
+    for phrase in phrases
+)
+_LONGEST_PHRASE = max(len(phrase) for phrase in _CONFIRMATION_VOCABULARY)
+
+
+def is_plain_confirmation(user_message: str, normalized: str) -> bool:
+    """
+    English (ASCII), short, non-question text with a confirmation cue and no
+    negation/correction or interrogative/request cue. Anything else may need an
+    escalation rule.
+    """
+    if not user_message.isascii() or '?' in user_message:
+        return False
+    if len(normalized.split()) > getattr(settings, 'FAST_PATH_MAX_WORDS', 12):
+        return False
+    return _CUE_MATCHER.match(normalized) == {"confirmation"}
+
+
+def is_made_of_cues(normalized: str) -> bool:
+    """True when every word belongs to a confirmation cue, a rule indicator or a filler word."""
+    words = normalized.split()
+    position = 0
+    while position < len(words):
+        for length in range(min(_LONGEST_PHRASE, len(words) - position), 0, -1):
+            if tuple(words[position:position + length]) in _CONFIRMATION_VOCABULARY:
+                position += length
+                break
+        else:
+            return False
+    return True
+
+
+def _record(hit: bool):
+    with _stats_lock:
+        FAST_PATH_STATS["hits" if hit else "misses"] += 1
+
+
+def classify(user_message: str, history_context: str) -> ClassificationOutput | None:
+    """
+    Returns a ClassificationOutput for high-confidence messages, or None to defer to the LLM.
+    - A generic acknowledgement as the first message maps to the generic_ack no-response case.
+    - Plain confirmations (see is_plain_confirmation) made only of confirmation cues,
+      rule indicators and filler words, whose indicators all belong to one topic, are
+      classified directly with a canned reply. Corrections, negations, questions and
+      requests, non-English text and ambiguous or multi-topic messages go to the LLM,
+      which applies the escalation rules.
+    """
+    if not getattr(settings, 'FAST_PATH_ENABLED', True):
+        return None
+
+    normalized = normalize_message(user_message)
+
+    if not history_context and normalized in _GENERIC_ACKS:
+        _record(True)
+        return ClassificationOutput(
+            topic=TopicCategory.OTHERS,
+            status=Status(PYTHON_ESCALATION_MESSAGES["generic_ack"]["status"]),
+            response_message=PYTHON_ESCALATION_MESSAGES["generic_ack"]["message"],
+            confidence=1.0,
+            justification="Fast path: generic acknowledgement as the first message.",
+        )
+
+    if is_plain_confirmation(user_message, normalized) and is_made_of_cues(normalized):
+        labels = _MATCHER.match(normalized)
+        if len(labels) == 1:
+            topic = TopicCategory(labels.pop())
+            _record(True)
+            return ClassificationOutput(
+                topic=topic,
+                status=Status.CLASSIFIED,
+                response_message=PYTHON_FAST_PATH_MESSAGES[topic.value],
+                confidence=0.95,
+                justification=f"Fast path: plain confirmation matching only {topic.value} rule indicators.",
+            )
+
+    _record(False)
+    return None
+
+
+def get_stats() -> dict:
+    """Returns fast-path hit/miss counters and the hit rate."""
+    with _stats_lock:
+        hits, misses = FAST_PATH_STATS["hits"], FAST_PATH_STATS["misses"]
+    total = hits + misses
+    return {"hits": hits, "misses": misses, "hit_rate": hits / total if total else 0.0}
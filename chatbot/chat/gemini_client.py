@@ -0,0 +1,39 @@
+# chat/gemini_client.py
+
+import threading
+
+from django.conf import settings
+
+# google.genai (with its pydantic type models and HTTP stack) takes most of a worker's
+# import time, so it is only imported when the first request or warm-up needs the client.
+# One client, and so one connection pool, serves classification and embedding calls.
+
+_client = None
+_initialized = False
+_lock = threading.Lock()
+
+
+def get_client():
+    """Returns the process-wide genai.Client, created on first use, or None if it cannot be created."""
+    global _client, _initialized
+    if _client is None and not _initialized:
+        with _lock:
+            if _client is None and not _initialized:
+                try:
+                    from google import genai
+
+                    _client = genai.Client(api_key=settings.GEMINI_API_KEY)
+                except Exception as e:
+                    print(f"Error initializing Gemini client: {e}")
+                _initialized = True
+    return _client
+
+
+def __getattr__(name):
+    # `except gemini_client.APIError` is only evaluated once an exception is raised,
+    # so modules can catch SDK errors without importing the SDK at load time
+    if name == 'APIError':
+        from google.genai.errors import APIError
+
+        return APIError
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,194 @@
+# chat/history_cache.py
+
+import random
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import Conversation
+
+
+def format_history_line(sender: str, text: str) -> str:
+    """Formats one message for the LLM prompt: [SENDER]: MESSAGE"""
+    return f"[{sender.upper()}]: {text}"
+
+
+def is_enabled() -> bool:
+    return getattr(settings, 'HISTORY_CACHE_ENABLED', False)
+
+
+def _cache():
+    return caches[getattr(settings, 'HISTORY_CACHE_ALIAS', 'default')]
+
+
+def _key(session_id: str) -> str:
+    return f"history:{session_id}"
+
+
+def _turns() -> int:
+    return getattr(settings, 'HISTORY_CACHE_TURNS', 10)
+
+
+def _ttl() -> int:
+    return getattr(settings, 'HISTORY_CACHE_TTL', 86400)
+
+
+def _version_key(session_id: str) -> str:
+    return f"history:{session_id}:version"
+
+
+def _from_entry(session_id: str, entry: dict):
+    """Rebuilds (conversation, history_context) from a cache entry without touching the DB."""
+    conversation = Conversation(pk=entry["conversation_id"], session_id=session_id)
+    conversation._state.adding = False
+    conversation._state.db = 'default'
+    return conversation, "\n".join(entry["lines"])
+
+
+def _entry(conversation_id: int, lines: list[str], version: int) -> dict:
+    return {"conversation_id": conversation_id, "lines": lines[-_turns():], "version": version}
+
+
+def _initial_version() -> int:
+    # Random, so a version key that expired or was evicted never repeats an older version
+    return random.getrandbits(48)
+
+
+def _valid_entry(values: dict, session_id: str):
+    """The cached entry if it was built at the session's current version, else None."""
+    entry, version = values.get(_key(session_id)), values.get(_version_key(session_id))
+    return entry if entry and version is not None and entry.get("version") == version else None
+
+
+# Every write bumps the session's version with an atomic incr, and an entry is only
+# served while its version is current. Writers rebuild the entry from Conversation.
+# recent_turns after their transaction commits (or, with write-behind, append to an
+# entry exactly one version behind), so concurrent writers can never overwrite each
+# other's turns with a stale read-modify-write: at worst the entry goes invalid and the
+# next read falls back to the DB.
+
+# --- Sync API ---
+
+def get_history(session_id: str):
+    """
+    Returns (cached, version): cached is (conversation, history_context) for an active
+    session, or None on a miss. Pass version to set_history after reading the DB.
+    """
+    cache = _cache()
+    values = cache.get_many([_key(session_id), _version_key(session_id)])
+    entry = _valid_entry(values, session_id)
+    if entry:
+        return _from_entry(session_id, entry), entry["version"]
+    version = values.get(_version_key(session_id))
+    if version is None:
+        cache.add(_version_key(session_id), _initial_version(), _ttl())
+        version = cache.get(_version_key(session_id))
+    return None, version
+
+
+def set_history(conversation, lines: list[str], version: int | None):
+    """Stores the last HISTORY_CACHE_TURNS lines read from the DB at `version` (from get_history)."""
+    if version is None:
+        return
+    cache = _cache()
+    cache.set(_key(conversation.session_id), _entry(conversation.pk, lines, version), _ttl())
+    cache.touch(_version_key(conversation.session_id), _ttl())
+
+
+def _bump(cache, session_id: str) -> int | None:
+    key = _version_key(session_id)
+    cache.add(key, _initial_version(), _ttl())
+    try:
+        return cache.incr(key)
+    except ValueError:  # Evicted between add and incr; readers miss until the next write
+        return None
+
+
+def refresh(conversation):
+    """
+    After a committed Message write: bumps the session version, then re-reads the
+    recent-turns snapshot (which includes every write committed before the bump).
+    """
+    cache = _cache()
+    version = _bump(cache, conversation.session_id)
+    if version is None:
+        return
+    lines = Conversation.objects.filter(pk=conversation.pk).values_list('recent_turns', flat=True).first()
+    if lines is not None:
+        cache.set(_key(conversation.session_id), _entry(conversation.pk, lines, version), _ttl())
+
+
+def append_message(conversation, sender: str, text: str):
+    """
+    Appends a message that is not in the DB yet (write-behind) to a cached session.
+    Only an entry exactly one version behind is extended; otherwise another write got
+    in between, the entry stays invalid and the next read repopulates it from the DB.
+    """
+    cache = _cache()
+    key = _key(conversation.session_id)
+    version = _bump(cache, conversation.session_id)
+    entry = cache.get(key)
+    if version is not None and entry and entry.get("version") == version - 1:
+        lines = entry["lines"] + [format_history_line(sender, text)]
+        cache.set(key, _entry(conversation.pk, lines, version), _ttl())
+
+
+def invalidate(session_id: str):
+    _cache().delete(_key(session_id))
+
+
+# --- Async API ---
+
+async def aget_history(session_id: str):
+    cache = _cache()
+    values = await cache.aget_many([_key(session_id), _version_key(session_id)])
+    entry = _valid_entry(values, session_id)
+    if entry:
+        return _from_entry(session_id, entry), entry["version"]
+    version = values.get(_version_key(session_id))
+    if version is None:
+        await cache.aadd(_version_key(session_id), _initial_version(), _ttl())
+        version = await cache.aget(_version_key(session_id))
+    return None, version
+
+
+async def aset_history(conversation, lines: list[str], version: int | None):
+    if version is None:
+        return
+    cache = _cache()
+    await cache.aset(_key(conversation.session_id), _entry(conversation.pk, lines, version), _ttl())
+    await cache.atouch(_version_key(conversation.session_id), _ttl())
+
+
+async def _abump(cache, session_id: str) -> int | None:
+    key = _version_key(session_id)
+    await cache.aadd(key, _initial_version(), _ttl())
+    try:
+        return await cache.aincr(key)
+    except ValueError:
+        return None
+
+
+async def arefresh_many(conversations):
+    """Async, bulk counterpart of refresh: one snapshot query for every conversation written."""
+    cache = _cache()
+    versions = {conversation.pk: await _abump(cache, conversation.session_id) for conversation in conversations}
+    snapshots = {
+        pk: lines async for pk, lines in
+        Conversation.objects.filter(pk__in=[pk for pk, version in versions.items() if version is not None])
+        .values_list('pk', 'recent_turns')
+    }
+    await cache.aset_many({
+        _key(conversation.session_id): _entry(conversation.pk, snapshots[conversation.pk], versions[conversation.pk])
+        for conversation in conversations if conversation.pk in snapshots
+    }, _ttl())
+
+
+async def aappend_message(conversation, sender: str, text: str):
+    cache = _cache()
+    key = _key(conversation.session_id)
+    version = await _abump(cache, conversation.session_id)
+    entry = await cache.aget(key)
+    if version is not None and entry and entry.get("version") == version - 1:
+        lines = entry["lines"] + [format_history_line(sender, text)]
+        await cache.aset(key, _entry(conversation.pk, lines, version), _ttl())
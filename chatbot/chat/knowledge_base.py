@@ -1,87 +1,217 @@
 # chat/knowledge_base.py
 
-# --- TWIN HEALTH AI ASSISTANT KNOWLEDGE BASE AND CLASSIFICATION RULES ---
-# This variable is injected into the Gemini model's system instruction
-# to ground its responses in the context of the Twin Health program.
-
-LLM_RAG_CONTEXT = """
-# Conversation Topic Assistant - LLM Execution
-
-You are a conversation topic classifier for Twin Health. Your task is to analyze a chain of SMS messages and determine if the conversation is about:
-
-A) LAB: Lab appointments (or) lab results
-B) TWIN_APPOINTMENT: Any non-lab Twin Health appointments
-C) OTHERS: None of the above
-
-## Classification Rules:
-
-### 1) Classify as LAB
-Classify as LAB only when there is explicit mention of laboratory testing, bloodwork, specimen collection, lab results, (or) similar lab-related topics.
-
-i) Look for specific indicators: "lab appointment", "blood test", "lab results", "bloodwork", "labcorp", "quest", "labcorp"
-ii) Also consider phrases like "fasting required", "12-hour fast", "blood draw"
-
-### 2) Classify as TWIN_APPOINTMENT
-Classify as TWIN_APPOINTMENT when the conversation references any non-lab Twin Health appointment.
-
-i) This includes: health screening calls, welcome calls, coaching sessions, doctor consultations, follow-up appointments
-ii) Look for appointment scheduling language without lab-specific indicators
-iii) Consider phrases like "call with your coach", "doctor appointment", "consultation", "program session", "enrollment call"
-
-### 3) Classify as OTHERS
-Classify as OTHERS when:
-
-i) The conversation does not clearly relate to any Twin Health appointment, but is a general inquiry about Twin Health or a greeting.
-ii) The topic is ambiguous and could be about multiple appointment types
-iii) There is insufficient context to make a confident determination
-iv) Any escalation criteria are met (see escalation rules)
-v) The message is generic acknowledgement to the reminder (e.g., "ok", "okay", "thanks") and is the first message in the conversation. In this case, do not respond.
-
-## Escalation Rules:
-
-For non-scheduling cases, set appropriate status and message:
+import hashlib
+import threading
+import time
+from pathlib import Path
 
-### 1) Questions about visit prep (or) unrelated topics (NOT about Twin Health):
-i) message: "I'm sorry, I'm unable to help with that. I can forward this to a specialist and they'll respond via text within 1 business day."
-ii) status: "escalate"
+from django.conf import settings
 
-### 2) General Inquiries about Twin Health:
-i) If the user asks about Twin Health, its mission, technology, or costs, use the "Twin Health Program Overview" below to provide a concise answer.
-ii) status: "classified"
+from .rag_core.ann_index import build_index
+from .rag_core.data_loader import chunk_knowledge_base, embed_texts
 
-### 2) Incorrect appointment info reported:
-i) message: "Thank you, I will forward this to a specialist. If they have questions they will respond within 1 business day."
-ii) status: "escalate"
-
-### 3) Non-English (or) Non-Spanish Language:
-i) message: "I can only converse in English (or) Spanish. I can forward this to a specialist and they'll respond via text within 1 business day."
-ii) status: "escalate"
-
-### 4) System Error:
-i) message: "I'm sorry, there was a system error. I forwarded this to a specialist and they'll respond via text within 1 business day."
-ii) status: "escalate"
-
-## Response Requirements:
-
-- **TONE:** Supportive, professional, and knowledgeable
-- **CONCISENESS:** Keep responses extremely concise, ideally within 1-2 sentences. DO NOT exceed 3 lines
-- **FORMATTING:** Use plain text only. DO NOT use any markdown formatting (like asterisks, hashtags, or dashes) for bolding, italics, or lists
-- For escalations, use the EXACT message text provided above
-- For classified inquiries, set status='classified' and provide a brief, helpful response
-
-## Twin Health Program Overview:
-
-**Core Mission:** Reverse metabolic diseases (Type 2 Diabetes, Obesity) using Digital Twin technology and personalized coaching to reduce or eliminate lifetime medication.
-
-**Digital Twin Technology:** AI-powered digital replica of the member's body and metabolism, built from connected device data and lab results. Provides real-time, personalized recommendations on nutrition, sleep, and activity.
-
-**Care Team:** Physician (medication adjustments), Personal Health Coach (daily support), Certified Diabetes Care and Education Specialist.
-
-**Lab Work:** Mandatory for Digital Twin monitoring (typically at enrollment, 3, 6, and 12 months). Most require 12-hour fast. Scheduled via Labcorp or Quest Diagnostics.
-
-**Appointments:** Welcome Calls, Coaching Sessions (goal review), Doctor Consultations (medical check-ins, lab results). All personalized.
-
-**Program Cost (India):** ₹75,000/year (annual) or ₹22,500 quarterly installments.
-
-**Support Hours:** 24x7 platform monitoring. Sales/General Inquiry: 9am-9pm IST, Monday-Saturday.
-"""
+# --- TWIN HEALTH AI ASSISTANT KNOWLEDGE BASE AND CLASSIFICATION RULES ---
+# The rules and program overview live as markdown sections in KNOWLEDGE_BASE_DIR
+# (chat/knowledge/*.md, concatenated in file-name order) and are injected into the
+# Gemini model's system instruction to ground its responses in the Twin Health program.
+# Edits are picked up by running workers without a redeploy or restart.
+
+class KnowledgeBase:
+    """
+    Immutable snapshot of the knowledge base files and everything derived from them:
+    the full rules text, its content version, the section chunks, the precompiled
+    system instruction and (with RAG retrieval enabled) the chunk search index.
+    """
+
+    def __init__(self, text: str, stamp: tuple = ()):
+        from .prompt_builder import build_system_instruction  # prompt_builder imports this module
+
+        self.text = text
+        self.stamp = stamp
+        # Content hash of the rules; stamped on cache keys and logged AI messages so a
+        # rules edit never serves classifications produced under an older version
+        self.version = hashlib.sha256(text.encode('utf-8')).hexdigest()[:12]
+        self.chunks = chunk_knowledge_base(text)
+        self.system_instruction = build_system_instruction(text)
+        self.index = None  # Search index of the chunks, set once they are embedded
+        self._embed_lock = threading.Lock()
+
+    def embed(self):
+        """Embeds the chunks (re-using the on-disk embedding cache) and builds the RAG index."""
+        with self._embed_lock:
+            if self.index is not None:
+                return  # Already embedded, e.g. by warm-up while the background load was queued
+            vectors = embed_texts(self.chunks) if self.chunks else None
+            if vectors is None:
+                print(f"Knowledge base {self.version}: chunk embedding failed; using the full text as context.")
+                return
+            # Large knowledge bases get an approximate index, persisted per version next to the embeddings
+            cache_dir = getattr(settings, 'EMBEDDING_CACHE_DIR', '')
+            path = Path(cache_dir) / f"ann-{self.version}.npz" if cache_dir else None
+            self.index = build_index(vectors, self.chunks, normalized=True, path=path)
+
+
+def read_knowledge_files(directory: Path) -> tuple[str, tuple]:
+    """Returns (text, stamp): the *.md sections joined in name order and their (name, mtime, size)."""
+    files = sorted(directory.glob('*.md'))
+    if not files:
+        raise FileNotFoundError(f"No knowledge base sections (*.md) found in {directory}.")
+    text = "\n\n".join(path.read_text(encoding='utf-8').strip("\n") for path in files)
+    return text, _stamp(files)
+
+
+def _stamp(files: list[Path]) -> tuple:
+    return tuple((path.name, path.stat().st_mtime_ns, path.stat().st_size) for path in files)
+
+
+class KnowledgeBaseStore:
+    """
+    Serves the current KnowledgeBase snapshot. At most every `check_interval` seconds
+    the section files are stat()ed; on a change the new version is parsed, chunked,
+    compiled and embedded on a background thread while in-flight requests keep using
+    the old snapshot, then swapped in with a single reference assignment. A broken
+    edit (e.g. no sections) is reported and the previous version stays active.
+    """
+
+    def __init__(self, directory, check_interval: float = 5.0, embed: bool = False, background: bool = True):
+        self.directory = Path(directory)
+        self.check_interval = check_interval
+        self.embed = embed
+        self.background = background
+        self._current: KnowledgeBase | None = None
+        self._checked_at = 0.0
+        self._reloading = False
+        self._lock = threading.Lock()
+
+    def _build(self) -> KnowledgeBase:
+        text, stamp = read_knowledge_files(self.directory)
+        return KnowledgeBase(text, stamp)
+
+    def _run(self, target):
+        if self.background:
+            threading.Thread(target=target, daemon=True, name='knowledge-base-reload').start()
+        else:
+            target()
+
+    def get(self) -> KnowledgeBase:
+        current = self._current
+        if current is None:
+            with self._lock:
+                if self._current is None:
+                    # First load parses the files inline (fast); embedding never blocks a request
+                    self._current = self._build()
+                    self._checked_at = time.monotonic()
+                    print(f"Knowledge base {self._current.version} loaded from {self.directory}.")
+                    if self.embed:
+                        self._run(self._current.embed)
+                return self._current
+
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval and not self._reloading:
+            with self._lock:
+                self._checked_at = now
+                if not self._reloading and self._changed(current):
+                    self._reloading = True
+                    self._run(self.reload)
+        return self._current
+
+    def _changed(self, current: KnowledgeBase) -> bool:
+        try:
+            return _stamp(sorted(self.directory.glob('*.md'))) != current.stamp
+        except OSError:
+            return False
+
+    def reload(self):
+        """Builds (and embeds) the new version, then atomically swaps it in."""
+        try:
+            snapshot = self._build()
+            if self.embed:
+                snapshot.embed()
+            previous = self._current
+            self._current = snapshot
+            if previous is None or previous.version != snapshot.version:
+                print(f"Knowledge base reloaded: version {snapshot.version} ({len(snapshot.chunks)} sections).")
+        except Exception as e:
+            print(f"Knowledge base reload failed, keeping the current version: {e}")
+        finally:
+            self._reloading = False
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_knowledge_base_store() -> KnowledgeBaseStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = KnowledgeBaseStore(
+                    settings.KNOWLEDGE_BASE_DIR,
+                    check_interval=getattr(settings, 'KNOWLEDGE_BASE_RELOAD_INTERVAL', 5.0),
+                    embed=getattr(settings, 'RAG_RETRIEVAL_ENABLED', False),
+                )
+    return _store
+
+
+def get_knowledge_base() -> KnowledgeBase:
+    """Returns the current knowledge base snapshot (hot-reloaded from KNOWLEDGE_BASE_DIR)."""
+    return get_knowledge_base_store().get()
+
+
+# --- DETERMINISTIC RULE INDICATORS ---
+# Mirrors the indicator phrases listed in chat/knowledge/02_classification_rules.md. These
+# are compiled once by chat/fast_path.py into a multi-pattern matcher that short-circuits
+# obvious messages before the Gemini call. Keep both in sync when editing the rules.
+
+RULE_INDICATORS = {
+    "LAB": [
+        "lab appointment", "blood test", "lab results", "lab result", "bloodwork",
+        "blood work", "labcorp", "quest", "quest diagnostics", "fasting required",
+        "12-hour fast", "12 hour fast", "blood draw",
+    ],
+    "TWIN_APPOINTMENT": [
+        "health screening call", "welcome call", "coaching session", "doctor consultation",
+        "follow-up appointment", "call with your coach", "call with my coach",
+        "doctor appointment", "consultation", "program session", "enrollment call",
+    ],
+}
+
+# First-message generic acknowledgements of a reminder (rule OTHERS v): do not respond.
+GENERIC_ACK_PHRASES = [
+    "ok", "okay", "k", "kk", "ok thanks", "okay thanks", "ok thank you", "okay thank you",
+    "thanks", "thank you", "thanks a lot", "thank you so much", "thx", "ty", "got it",
+    "noted", "sure", "ok got it",
+]
+
+# The topic fast path only answers plain confirmations: a message needs one of these cues...
+CONFIRMATION_PHRASES = [
+    "yes", "yep", "yeah", "ok", "okay", "sure", "thanks", "thank you", "got it", "confirmed", "confirm",
+    "confirming", "done", "completed", "finished", "booked", "scheduled", "all set", "will be there",
+    "i'll be there", "see you", "works for me", "sounds good", "went well", "on my way", "fasting",
+]
+
+# ...and none of these negation/correction cues, which may call for an escalation
+# (e.g. incorrect information, rule LAB/TWIN_APPOINTMENT ii) and so go to the LLM.
+CORRECTION_PHRASES = [
+    "no", "not", "never", "nope", "wrong", "incorrect", "mistake", "error", "but", "however", "actually",
+    "instead", "cancel", "cancelled", "canceled", "reschedule", "change", "changed", "move", "moved",
+    "postpone", "missed", "miss", "late", "problem", "issue", "help", "can't", "cant", "cannot", "don't",
+    "dont", "didn't", "didnt", "won't", "wont", "isn't", "wasn't", "haven't", "couldn't", "unable",
+]
+
+# ...nor these interrogative, request or complaint cues: a visit-prep question or a
+# request without a "?" (rule LAB/TWIN_APPOINTMENT i) is an escalation, not a confirmation.
+REQUEST_PHRASES = [
+    "do", "does", "did", "what", "which", "who", "why", "how", "when", "where", "can", "could", "should",
+    "would", "may", "is it", "are", "need", "needs", "please", "send", "tell", "want", "if", "or", "drink",
+    "eat", "water", "coffee", "medication", "medicine", "address", "directions", "rude", "bad", "unhappy",
+    "complaint",
+]
+
+# Besides confirmation cues and rule indicators, a plain confirmation may only contain
+# these words (e.g. "Confirmed for my blood draw tomorrow").
+CONFIRMATION_FILLER_WORDS = [
+    "a", "an", "the", "my", "at", "for", "to", "with", "and", "i", "we", "all", "today", "tonight", "tomorrow",
+    "this", "morning", "afternoon", "evening", "week", "appointment", "visit", "again", "just", "already",
+]
@@ -0,0 +1,514 @@
+# chat/llm_resilience.py
+
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+from django.conf import settings
+
+from . import gemini_client, metrics
+from .rag_core.data_loader import RETRYABLE_STATUS_CODES
+
+LLM_ATTEMPTS_TOTAL = metrics.REGISTRY.counter(
+    "chat_llm_attempts_total", "Gemini generate_content attempts by outcome.")
+LLM_REJECTED_TOTAL = metrics.REGISTRY.counter(
+    "chat_llm_rejected_total", "LLM calls failed fast by the resilience layer, by reason.")
+LLM_HEDGES_TOTAL = metrics.REGISTRY.counter(
+    "chat_llm_hedges_total", "Hedged duplicate Gemini requests sent after the hedge delay.")
+
+
+# --- 1. Errors ---
+
+class LLMUnavailable(Exception):
+    """The LLM call was not (or could not be) completed; callers escalate with system_error."""
+    reason = "unavailable"
+
+
+class CircuitOpenError(LLMUnavailable):
+    reason = "circuit_open"
+
+
+class ConcurrencyLimitExceeded(LLMUnavailable):
+    reason = "overloaded"
+
+
+class DeadlineExceeded(LLMUnavailable):
+    reason = "deadline"
+
+
+def is_retryable(error: Exception) -> bool:
+    return isinstance(error, gemini_client.APIError) and getattr(error, 'code', None) in RETRYABLE_STATUS_CODES
+
+
+# --- 2. Adaptive Concurrency Limit (AIMD) ---
+
+class AdaptiveLimiter:
+    """
+    Caps in-flight Gemini calls at a limit that grows by ~1 per limit's worth of
+    successes (additive increase) and halves on an overload signal: a retryable error
+    or a timeout (multiplicative decrease). Calls over the limit wait in FIFO order
+    for a slot (acquire / aacquire, bounded by the caller's timeout); a freed slot is
+    handed straight to the oldest waiter, whether it is a thread or a coroutine.
+    """
+
+    def __init__(self, initial: int = 16, minimum: int = 2, maximum: int = 64):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(initial)
+        self.in_flight = 0
+        self._waiters = deque()  # Callables granting a slot to a queued caller, oldest first
+        self._lock = threading.Lock()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def _has_slot(self) -> bool:
+        return self.in_flight < int(self.limit)
+
+    def _grant_waiters(self):
+        """Hands free slots to queued callers; called with the lock held."""
+        while self._waiters and self._has_slot():
+            self.in_flight += 1
+            try:
+                self._waiters.popleft()()
+            except RuntimeError:
+                self.in_flight -= 1  # The waiter's event loop is gone
+
+    def _cancel_wait(self, grant) -> bool:
+        """Dequeues a waiter that gave up; returns True if it was granted a slot just before."""
+        with self._lock:
+            try:
+                self._waiters.remove(grant)
+                return False
+            except ValueError:
+                return True
+
+    def try_acquire(self) -> bool:
+        """Takes a slot only if one is free and nobody is queued (used for optional hedges)."""
+        with self._lock:
+            if self._waiters or not self._has_slot():
+                return False
+            self.in_flight += 1
+            return True
+
+    def acquire(self, timeout: float) -> bool:
+        """Blocks up to `timeout` seconds for a slot; returns False if none freed up."""
+        granted = threading.Event()
+        with self._lock:
+            if not self._waiters and self._has_slot():
+                self.in_flight += 1
+                return True
+            self._waiters.append(granted.set)
+        return granted.wait(max(timeout, 0)) or self._cancel_wait(granted.set)
+
+    async def aacquire(self, timeout: float) -> bool:
+        """Async counterpart of acquire; waiting never blocks the event loop."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def grant():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(True))
+
+        with self._lock:
+            if not self._waiters and self._has_slot():
+                self.in_flight += 1
+                return True
+            self._waiters.append(grant)
+        try:
+            await asyncio.wait_for(future, max(timeout, 0))
+            return True
+        except asyncio.TimeoutError:
+            return self._cancel_wait(grant)
+        except asyncio.CancelledError:
+            if self._cancel_wait(grant):
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+            self._grant_waiters()
+
+    def on_success(self):
+        with self._lock:
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self._grant_waiters()
+
+    def on_overload(self):
+        with self._lock:
+            self.limit = max(self.minimum, self.limit / 2)
+
+
+# --- 3. Circuit Breaker ---
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive upstream failures and fails fast for
+    `reset_timeout` seconds, then lets a single probe through (half-open): a success
+    closes the circuit, a failure re-opens it.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 0, 1, 2
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    return False
+                self._probe_in_flight = True
+            return self.state != self.OPEN
+
+    def release_probe(self):
+        """Gives back a half-open probe slot whose call was never sent."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    print(f"LLM circuit breaker opened after {self.failures} consecutive failures.")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+# --- 4. Resilient Call Layer ---
+
+class ResilientLLM:
+    """
+    Wraps client.models.generate_content (and its aio and streaming counterparts) with a
+    per-request deadline, jittered exponential-backoff retries of retryable errors, an
+    optional hedged duplicate request after the recent p95 latency, the AIMD limiter and
+    the circuit breaker. Failures surface as APIError (non-retryable) or LLMUnavailable.
+    """
+
+    LATENCY_WINDOW = 200   # recent successful call latencies used for the hedge delay
+    MIN_HEDGE_SAMPLES = 20
+
+    def __init__(self, deadline: float = 20.0, max_retries: int = 2, retry_base_delay: float = 0.25,
+                 hedging: bool = False, hedge_delay: float = 2.0,
+                 limiter: AdaptiveLimiter | None = None, breaker: CircuitBreaker | None = None):
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.hedging = hedging
+        self.default_hedge_delay = hedge_delay
+        self.limiter = limiter or AdaptiveLimiter()
+        self.breaker = breaker or CircuitBreaker()
+        self._latencies = deque(maxlen=self.LATENCY_WINDOW)
+        # Attempts run on this pool so the deadline can be enforced on the blocking SDK call;
+        # the limiter keeps in-flight calls (including abandoned ones) below max_workers
+        self._executor = ThreadPoolExecutor(max_workers=self.limiter.maximum, thread_name_prefix='gemini')
+
+    def hedge_delay(self) -> float | None:
+        """Seconds to wait before sending a duplicate request: the recent p95, or the configured default."""
+        if not self.hedging:
+            return None
+        if len(self._latencies) < self.MIN_HEDGE_SAMPLES:
+            return self.default_hedge_delay
+        return float(np.percentile(list(self._latencies), 95))
+
+    def get_stats(self) -> dict:
+        return {
+            "concurrency_limit": self.limiter.limit,
+            "in_flight": self.limiter.in_flight,
+            "waiting": self.limiter.waiting,
+            "circuit_state": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+        }
+
+    # --- Outcome bookkeeping shared by the sync and async paths ---
+
+    def _record_outcome(self, started: float, error: Exception | None):
+        if error is None:
+            self._latencies.append(time.perf_counter() - started)
+            self.limiter.on_success()
+            self.breaker.record_success()
+            LLM_ATTEMPTS_TOTAL.inc(outcome="success")
+        elif is_retryable(error):
+            self.limiter.on_overload()
+            self.breaker.record_failure()
+            LLM_ATTEMPTS_TOTAL.inc(outcome="retryable_error")
+        else:
+            # The upstream answered (e.g. a 400), so it counts as healthy for the breaker
+            self.breaker.record_success()
+            LLM_ATTEMPTS_TOTAL.inc(outcome="error")
+
+    def _record_timeout(self):
+        self.limiter.on_overload()
+        self.breaker.record_failure()
+        LLM_ATTEMPTS_TOTAL.inc(outcome="timeout")
+
+    def _reject(self, error: LLMUnavailable):
+        LLM_REJECTED_TOTAL.inc(reason=error.reason)
+        raise error
+
+    def _backoff_delay(self, attempt: int) -> float:
+        """Exponential backoff with full jitter."""
+        return random.uniform(0, self.retry_base_delay * (2 ** attempt))
+
+    # --- Sync API ---
+
+    def _call(self, client, request: dict):
+        started = time.perf_counter()
+        try:
+            response = client.models.generate_content(**request)
+        except Exception as e:
+            self._record_outcome(started, e)
+            raise
+        finally:
+            self.limiter.release()
+        self._record_outcome(started, None)
+        return response
+
+    def _submit(self, client, request: dict, deadline: float | None = None):
+        """Starts a call once a slot is free (waiting until `deadline`), or only if one is free now."""
+        acquired = (self.limiter.acquire(deadline - time.monotonic()) if deadline is not None
+                    else self.limiter.try_acquire())
+        if not acquired:
+            return None
+        return self._executor.submit(self._call, client, request)
+
+    def _attempt(self, client, request: dict, deadline: float):
+        primary = self._submit(client, request, deadline)
+        if primary is None:
+            self.breaker.release_probe()
+            self._reject(ConcurrencyLimitExceeded(f"No LLM concurrency slot freed up within {self.deadline}s."))
+        pending, hedge_at = {primary}, None
+        hedge_delay = self.hedge_delay()
+        if hedge_delay is not None:
+            hedge_at = time.monotonic() + hedge_delay
+
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                self._record_timeout()
+                self._reject(DeadlineExceeded(f"No Gemini response within {self.deadline}s."))
+            wake_at = min(deadline, hedge_at) if hedge_at else deadline
+            done, pending = wait(pending, timeout=wake_at - now, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+            if done and not pending:
+                raise done.pop().exception()
+
+            if hedge_at and time.monotonic() >= hedge_at:
+                hedge_at = None
+                hedge = self._submit(client, request)
+                if hedge is not None:
+                    LLM_HEDGES_TOTAL.inc()
+                    pending.add(hedge)
+
+    def generate(self, client, **request):
+        """Calls client.models.generate_content(**request) through the resilience layer."""
+        deadline = time.monotonic() + self.deadline
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                self._reject(CircuitOpenError("LLM circuit breaker is open."))
+            try:
+                return self._attempt(client, request, deadline)
+            except Exception as e:
+                delay = self._backoff_delay(attempt)
+                if attempt == self.max_retries or not is_retryable(e) or time.monotonic() + delay >= deadline:
+                    raise
+                print(f"Retrying Gemini call after retryable error: {e}")
+                time.sleep(delay)
+
+    # --- Async API ---
+
+    async def _acall(self, client, request: dict):
+        started = time.perf_counter()
+        try:
+            response = await client.aio.models.generate_content(**request)
+        except asyncio.CancelledError:
+            # No outcome to record, but a half-open probe must not stay claimed forever
+            self.breaker.release_probe()
+            raise
+        except Exception as e:
+            self._record_outcome(started, e)
+            raise
+        finally:
+            self.limiter.release()
+        self._record_outcome(started, None)
+        return response
+
+    def _asubmit(self, client, request: dict):
+        if not self.limiter.try_acquire():
+            return None
+        return asyncio.ensure_future(self._acall(client, request))
+
+    async def _aattempt(self, client, request: dict, deadline: float):
+        pending = set()
+        try:
+            if not await self.limiter.aacquire(deadline - time.monotonic()):
+                self.breaker.release_probe()
+                self._reject(ConcurrencyLimitExceeded(f"No LLM concurrency slot freed up within {self.deadline}s."))
+            primary = asyncio.ensure_future(self._acall(client, request))
+            pending, hedge_at = {primary}, None
+            hedge_delay = self.hedge_delay()
+            if hedge_delay is not None:
+                hedge_at = time.monotonic() + hedge_delay
+
+            while True:
+                now = time.monotonic()
+                if now >= deadline:
+                    self._record_timeout()
+                    self._reject(DeadlineExceeded(f"No Gemini response within {self.deadline}s."))
+                wake_at = min(deadline, hedge_at) if hedge_at else deadline
+                done, pending = await asyncio.wait(pending, timeout=wake_at - now, return_when=FIRST_COMPLETED)
+
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                if done and not pending:
+                    raise done.pop().exception()
+
+                if hedge_at and time.monotonic() >= hedge_at:
+                    hedge_at = None
+                    hedge = self._asubmit(client, request)
+                    if hedge is not None:
+                        LLM_HEDGES_TOTAL.inc()
+                        pending.add(hedge)
+        except asyncio.CancelledError:
+            # A client disconnect cancels the request; give back a half-open probe slot,
+            # or the breaker would wait forever for an outcome and reject every call
+            self.breaker.release_probe()
+            raise
+        finally:
+            # Unlike threads, losing or timed-out requests can actually be cancelled
+            for task in pending:
+                task.cancel()
+
+    async def agenerate(self, client, **request):
+        """Async counterpart of generate using client.aio."""
+        deadline = time.monotonic() + self.deadline
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                self._reject(CircuitOpenError("LLM circuit breaker is open."))
+            try:
+                return await self._aattempt(client, request, deadline)
+            except Exception as e:
+                delay = self._backoff_delay(attempt)
+                if attempt == self.max_retries or not is_retryable(e) or time.monotonic() + delay >= deadline:
+                    raise
+                print(f"Retrying Gemini call after retryable error: {e}")
+                await asyncio.sleep(delay)
+
+
+    # --- Streaming API ---
+
+    async def _within(self, awaitable, deadline: float):
+        try:
+            return await asyncio.wait_for(awaitable, max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            self._record_timeout()
+            self._reject(DeadlineExceeded(f"Gemini stream did not finish within {self.deadline}s."))
+
+    async def astream(self, client, **request):
+        """
+        Async generator over client.aio.models.generate_content_stream(**request) chunks,
+        under the same deadline (for the whole stream), breaker, limiter and metrics as
+        agenerate. Retryable errors are retried only before the first chunk; once a chunk
+        has been yielded the caller has forwarded partial output, so errors propagate.
+        Streams are not hedged.
+        """
+        deadline = time.monotonic() + self.deadline
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                self._reject(CircuitOpenError("LLM circuit breaker is open."))
+            try:
+                acquired = await self.limiter.aacquire(deadline - time.monotonic())
+            except asyncio.CancelledError:
+                self.breaker.release_probe()
+                raise
+            if not acquired:
+                self.breaker.release_probe()
+                self._reject(ConcurrencyLimitExceeded(f"No LLM concurrency slot freed up within {self.deadline}s."))
+
+            started = time.perf_counter()
+            yielded = False
+            try:
+                stream = await self._within(client.aio.models.generate_content_stream(**request), deadline)
+                chunks = aiter(stream)
+                while True:
+                    try:
+                        chunk = await self._within(anext(chunks), deadline)
+                    except StopAsyncIteration:
+                        break
+                    yielded = True
+                    yield chunk
+                self._record_outcome(started, None)
+                return
+            except LLMUnavailable:
+                raise
+            except Exception as e:
+                self._record_outcome(started, e)
+                delay = self._backoff_delay(attempt)
+                if yielded or attempt == self.max_retries or not is_retryable(e) or time.monotonic() + delay >= deadline:
+                    raise
+                print(f"Retrying Gemini stream after retryable error: {e}")
+            except BaseException:
+                # Cancelled (client disconnect) or closed early (GeneratorExit): no outcome
+                # to record, but a half-open probe slot must be given back
+                self.breaker.release_probe()
+                raise
+            finally:
+                self.limiter.release()
+            await asyncio.sleep(delay)
+
+
+_llm = None
+_llm_lock = threading.Lock()
+
+
+def get_llm() -> ResilientLLM:
+    """Returns the process-wide resilient LLM layer, configured from settings."""
+    global _llm
+    with _llm_lock:
+        if _llm is None:
+            _llm = ResilientLLM(
+                deadline=getattr(settings, 'LLM_DEADLINE_SECONDS', 20.0),
+                max_retries=getattr(settings, 'LLM_MAX_RETRIES', 2),
+                retry_base_delay=getattr(settings, 'LLM_RETRY_BASE_DELAY', 0.25),
+                hedging=getattr(settings, 'LLM_HEDGING_ENABLED', False),
+                hedge_delay=getattr(settings, 'LLM_HEDGE_DELAY_SECONDS', 2.0),
+                limiter=AdaptiveLimiter(
+                    initial=getattr(settings, 'LLM_CONCURRENCY_INITIAL', 16),
+                    minimum=getattr(settings, 'LLM_CONCURRENCY_MIN', 2),
+                    maximum=getattr(settings, 'LLM_CONCURRENCY_MAX', 64),
+                ),
+                breaker=CircuitBreaker(
+                    failure_threshold=getattr(settings, 'LLM_BREAKER_FAILURE_THRESHOLD', 5),
+                    reset_timeout=getattr(settings, 'LLM_BREAKER_RESET_SECONDS', 30.0),
+                ),
+            )
+        return _llm
+
+
+metrics.REGISTRY.register_collector(
+    lambda: {f"chat_llm_{name}": value for name, value in get_llm().get_stats().items()})
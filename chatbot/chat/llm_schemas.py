@@ -54,3 +54,9 @@ PYTHON_ESCALATION_MESSAGES = {
         "status": Status.NO_RESPONSE.value # Use Enum value for consistency
     }
 }
+
+# Canned replies used when chat/fast_path.py classifies a message without calling the LLM.
+PYTHON_FAST_PATH_MESSAGES = {
+    TopicCategory.LAB.value: "Thanks for confirming your lab appointment. Your care team will follow up if anything needs to change.",
+    TopicCategory.TWIN_APPOINTMENT.value: "Thanks for the update on your Twin Health appointment. Your care team will follow up if anything needs to change.",
+}
@@ -0,0 +1,209 @@
+# chat/local_classifier.py
+
+import os
+import tempfile
+import threading
+import time
+import zlib
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from .fast_path import is_plain_confirmation, normalize_message
+from .llm_schemas import ClassificationOutput, PYTHON_FAST_PATH_MESSAGES, Status, TopicCategory
+
+DEFAULT_DIMENSION = 2 ** 18
+
+
+# --- 1. Hashed N-gram Features ---
+
+def _hash(token: str, dimension: int) -> int:
+    # crc32 rather than hash(): feature indices must match across processes and restarts
+    return zlib.crc32(token.encode('utf-8')) % dimension
+
+
+def extract_features(user_message: str, previous_line: str = "", dimension: int = DEFAULT_DIMENSION):
+    """
+    Hashes word unigrams and bigrams of the message, plus the words of the previous
+    history line (prefixed, so "lab" in a reminder is a different feature from "lab"
+    in the reply), into an L2-normalized sparse vector. Returns (indices, values).
+    """
+    words = normalize_message(user_message).split()
+    tokens = words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+    tokens += [f"prev:{word}" for word in normalize_message(previous_line).split()]
+    if not tokens:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+    indices, counts = np.unique([_hash(token, dimension) for token in tokens], return_counts=True)
+    values = counts.astype(np.float32)
+    return indices, values / np.linalg.norm(values)
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    exp = np.exp(logits - logits.max())
+    return exp / exp.sum()
+
+
+# --- 2. Linear Model ---
+
+class LinearTopicModel:
+    """Multinomial logistic regression over hashed n-gram features."""
+
+    def __init__(self, weights: np.ndarray, bias: np.ndarray, classes: list[str]):
+        self.weights = weights.astype(np.float32)  # (classes, dimension)
+        self.bias = bias.astype(np.float32)
+        self.classes = list(classes)
+
+    @property
+    def dimension(self) -> int:
+        return self.weights.shape[1]
+
+    def predict_proba(self, user_message: str, previous_line: str = "") -> np.ndarray:
+        indices, values = extract_features(user_message, previous_line, self.dimension)
+        return _softmax(self.weights[:, indices] @ values + self.bias)
+
+    def predict(self, user_message: str, previous_line: str = "") -> tuple[str, float]:
+        """Returns (topic value, probability) of the most likely topic."""
+        probabilities = self.predict_proba(user_message, previous_line)
+        best = int(np.argmax(probabilities))
+        return self.classes[best], float(probabilities[best])
+
+    def save(self, path):
+        """Writes a compact float16 .npz artifact, atomically replacing any previous one."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=path.parent, suffix='.npz')
+        with os.fdopen(fd, 'wb') as artifact:
+            np.savez_compressed(artifact, weights=self.weights.astype(np.float16), bias=self.bias,
+                                classes=np.array(self.classes))
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path) -> 'LinearTopicModel':
+        with np.load(path) as artifact:
+            return cls(artifact['weights'], artifact['bias'], artifact['classes'].tolist())
+
+
+def train(samples: list[tuple[str, str, str]], dimension: int = DEFAULT_DIMENSION, epochs: int = 8,
+          learning_rate: float = 0.5, seed: int = 0) -> LinearTopicModel:
+    """
+    Trains on (user_message, previous_line, topic) samples with plain SGD on the
+    softmax cross-entropy; only the weights of a sample's non-zero features move.
+    """
+    classes = sorted({topic for _, _, topic in samples})
+    class_index = {topic: i for i, topic in enumerate(classes)}
+    rows = [extract_features(message, previous, dimension) for message, previous, _ in samples]
+    labels = np.array([class_index[topic] for _, _, topic in samples])
+
+    weights = np.zeros((len(classes), dimension), dtype=np.float32)
+    bias = np.zeros(len(classes), dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    for epoch in range(epochs):
+        rate = learning_rate / (1 + epoch)
+        for i in rng.permutation(len(rows)):
+            indices, values = rows[i]
+            gradient = _softmax(weights[:, indices] @ values + bias)
+            gradient[labels[i]] -= 1.0
+            weights[:, indices] -= rate * np.outer(gradient, values)
+            bias -= rate * gradient
+    return LinearTopicModel(weights, bias, classes)
+
+
+# --- 3. Hot-Reloaded Model and Routing ---
+
+class ModelLoader:
+    """
+    Serves the artifact at `path`, re-checking its (inode, mtime) at most every
+    `check_interval` seconds, so a retrained model is picked up by running workers
+    without a restart (the trainer replaces the file atomically).
+    """
+
+    def __init__(self, path, check_interval: float = 5.0):
+        self.path = Path(path)
+        self.check_interval = check_interval
+        self._model = None
+        self._stamp = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> LinearTopicModel | None:
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return self._model
+        with self._lock:
+            self._checked_at = now
+            try:
+                stat = self.path.stat()
+            except FileNotFoundError:
+                self._model, self._stamp = None, None
+                return None
+            stamp = (stat.st_ino, stat.st_mtime_ns)
+            if stamp != self._stamp:
+                try:
+                    self._model = LinearTopicModel.load(self.path)
+                    self._stamp = stamp
+                    print(f"Loaded local classifier from {self.path} (classes: {self._model.classes}).")
+                except Exception as e:
+                    print(f"Failed to load local classifier from {self.path}: {e}")
+            return self._model
+
+
+_loader = None
+_stats_lock = threading.Lock()
+LOCAL_CLASSIFIER_STATS = {"hits": 0, "misses": 0}
+
+
+def get_model_loader() -> ModelLoader:
+    global _loader
+    if _loader is None:
+        _loader = ModelLoader(settings.LOCAL_CLASSIFIER_PATH,
+                              getattr(settings, 'LOCAL_CLASSIFIER_RELOAD_INTERVAL', 5.0))
+    return _loader
+
+
+def _record(hit: bool):
+    with _stats_lock:
+        LOCAL_CLASSIFIER_STATS["hits" if hit else "misses"] += 1
+
+
+def classify(user_message: str, history_context: str) -> ClassificationOutput | None:
+    """
+    Classifies with the local model when it is confident enough, or returns None to
+    defer to Gemini. Only plain confirmations (fast_path.is_plain_confirmation) in
+    topics with a canned reply (LAB, TWIN_APPOINTMENT) are answered locally; the model
+    predicts topic only, so questions, corrections, cancellations, non-English text
+    and OTHERS (escalations, acks) always go to the LLM. The model's probability is
+    reported in `confidence`, on the same scale that LOCAL_CLASSIFIER_THRESHOLD is
+    compared against.
+    """
+    if not getattr(settings, 'LOCAL_CLASSIFIER_ENABLED', False):
+        return None
+    if not is_plain_confirmation(user_message, normalize_message(user_message)):
+        return None
+    model = get_model_loader().get()
+    if model is None:
+        return None
+
+    previous_line = history_context.rsplit("\n", 1)[-1] if history_context else ""
+    topic, probability = model.predict(user_message, previous_line)
+    if topic not in PYTHON_FAST_PATH_MESSAGES or probability < getattr(settings, 'LOCAL_CLASSIFIER_THRESHOLD', 0.9):
+        _record(False)
+        return None
+
+    _record(True)
+    return ClassificationOutput(
+        topic=TopicCategory(topic),
+        status=Status.CLASSIFIED,
+        response_message=PYTHON_FAST_PATH_MESSAGES[topic],
+        confidence=round(probability, 3),
+        justification=f"Local model: {topic} with probability {probability:.2f}.",
+    )
+
+
+def get_stats() -> dict:
+    """Returns local-classifier hit/miss counters and the hit rate."""
+    with _stats_lock:
+        hits, misses = LOCAL_CLASSIFIER_STATS["hits"], LOCAL_CLASSIFIER_STATS["misses"]
+    total = hits + misses
+    return {"hits": hits, "misses": misses, "hit_rate": hits / total if total else 0.0}
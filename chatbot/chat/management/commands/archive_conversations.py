@@ -0,0 +1,63 @@
+# chat/management/commands/archive_conversations.py
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from chat.archive import archive_conversation, rehydrate
+from chat.models import Conversation, ConversationArchive
+
+
+class Command(BaseCommand):
+    help = ("Moves the messages of inactive conversations into compressed ConversationArchive blobs, keeping the "
+            "Message table small. Archived sessions are rehydrated automatically when they become active again. "
+            "Conversations with reclassification results are skipped (deleting their messages would delete them).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--inactive-days', type=int, default=getattr(settings, 'ARCHIVE_INACTIVE_DAYS', 30),
+                            help="Archive conversations with no message for this many days.")
+        parser.add_argument('--limit', type=int, default=0, help="Archive at most N conversations (0 = all).")
+        parser.add_argument('--rehydrate', metavar='SESSION_ID',
+                            help="Move one archived session's messages back instead of archiving.")
+        parser.add_argument('--vacuum', action='store_true',
+                            help="Run VACUUM afterwards so SQLite returns the freed pages to the filesystem.")
+
+    def handle(self, *args, **options):
+        if options['rehydrate']:
+            conversation = Conversation.objects.filter(session_id=options['rehydrate']).first()
+            if conversation is None:
+                raise CommandError(f"No conversation with session_id {options['rehydrate']!r}.")
+            restored = rehydrate(conversation)
+            self.stdout.write(self.style.SUCCESS(f"Restored {restored} messages of {conversation.session_id}."))
+            return
+
+        # --- 1. Inactive, Non-Reclassified Conversations ---
+        cutoff = timezone.now() - timedelta(days=options['inactive_days'])
+        candidates = (
+            Conversation.objects.filter(last_activity__lt=cutoff, messages__isnull=False)
+            .exclude(messages__reclassifications__isnull=False)
+            .distinct().order_by('pk').values_list('pk', flat=True)
+        )
+        if options['limit']:
+            candidates = candidates[:options['limit']]
+
+        # --- 2. Archive One Conversation per Transaction ---
+        conversations = moved = 0
+        for conversation in Conversation.objects.filter(pk__in=list(candidates)).order_by('pk').iterator():
+            count = archive_conversation(conversation)
+            if count:
+                conversations += 1
+                moved += count
+
+        archived = ConversationArchive.objects.filter(conversation__archived=True)
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {moved} messages from {conversations} conversations idle since {cutoff:%Y-%m-%d}; "
+            f"{archived.count()} conversations are archived in total."))
+
+        if options['vacuum'] and connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('VACUUM')
+            self.stdout.write("Vacuumed the SQLite database.")
@@ -0,0 +1,70 @@
+# chat/management/commands/benchmark_ann.py
+
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from chat.rag_core.ann_index import IVFIndex
+from chat.rag_core.vector_store import VectorIndex, recall_at_k
+
+
+def clustered_vectors(count: int, dimension: int, clusters: int, seed: int = 0) -> np.ndarray:
+    """Synthetic stand-in for chunk embeddings: unit vectors scattered around random topics."""
+    rng = np.random.default_rng(seed)
+    topics = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    vectors = topics[rng.integers(clusters, size=count)] + 0.5 * rng.standard_normal((count, dimension)).astype(np.float32)
+    return VectorIndex._normalize(vectors)
+
+
+class Command(BaseCommand):
+    help = ("Benchmarks the IVF approximate index against exact search: build time, per-query latency "
+            "and recall@k for a range of n_probe values.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vectors', help="A .npy matrix of real embeddings (default: synthetic clustered data).")
+        parser.add_argument('--count', type=int, default=100000, help="Synthetic chunk count.")
+        parser.add_argument('--dimension', type=int, default=256, help="Synthetic embedding dimension.")
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--top-k', type=int, default=3)
+        parser.add_argument('--lists', type=int, default=0, help="IVF cells (0 = about 4 * sqrt(count)).")
+        parser.add_argument('--probes', default='1,2,4,8,16,32', help="Comma-separated n_probe values.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['vectors']:
+            vectors = VectorIndex._normalize(np.load(options['vectors'], mmap_mode='r'))
+        else:
+            vectors = clustered_vectors(options['count'], options['dimension'], clusters=max(1, options['count'] // 100),
+                                        seed=options['seed'])
+        rng = np.random.default_rng(options['seed'] + 1)
+        # Queries are perturbed copies of stored rows, like paraphrases of indexed text
+        queries = vectors[rng.integers(len(vectors), size=options['queries'])]
+        queries = VectorIndex._normalize(queries + 0.3 * rng.standard_normal(queries.shape).astype(np.float32))
+        texts = [""] * len(vectors)
+        top_k = options['top_k']
+
+        # --- 1. Exact Baseline ---
+        exact = VectorIndex(vectors, texts, normalized=True)
+        started = time.perf_counter()
+        exact_ids = [exact.search(query, top_k)[1][0] for query in queries]
+        exact_ms = (time.perf_counter() - started) * 1000 / len(queries)
+
+        # --- 2. Build the IVF Index ---
+        n_lists = options['lists'] or int(4 * np.sqrt(len(vectors)))
+        started = time.perf_counter()
+        index = IVFIndex(vectors.shape[1], n_lists, seed=options['seed'])
+        index.add(vectors, texts, normalized=True)
+        if not index.trained:
+            index.train()
+        self.stdout.write(f"{len(vectors)} vectors x {vectors.shape[1]} dims; built {len(index._cell_ids)} cells "
+                          f"in {time.perf_counter() - started:.1f}s. Exact search: {exact_ms:.2f} ms/query.")
+
+        # --- 3. Recall and Latency per n_probe ---
+        self.stdout.write(f"{'n_probe':>8}  {'recall@' + str(top_k):>9}  {'ms/query':>9}  {'speedup':>8}")
+        for n_probe in (int(value) for value in options['probes'].split(',')):
+            started = time.perf_counter()
+            approximate_ids = [index.search(query, top_k, n_probe=n_probe)[1][0] for query in queries]
+            ann_ms = (time.perf_counter() - started) * 1000 / len(queries)
+            self.stdout.write(f"{n_probe:>8}  {recall_at_k(approximate_ids, exact_ids):>9.3f}  {ann_ms:>9.2f}  "
+                              f"{exact_ms / ann_ms:>7.1f}x")
@@ -0,0 +1,54 @@
+# chat/management/commands/benchmark_quantization.py
+
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from chat.management.commands.benchmark_ann import clustered_vectors
+from chat.rag_core.vector_store import QuantizedVectorIndex, VectorIndex, recall_at_k
+
+
+class Command(BaseCommand):
+    help = ("Benchmarks quantized vector storage against exact float32 search: resident bytes, per-query latency "
+            "and recall@k for float16 and int8 codes, with and without a full-precision rerank.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vectors', help="A .npy matrix of real embeddings (default: synthetic clustered data).")
+        parser.add_argument('--count', type=int, default=20000, help="Synthetic chunk count.")
+        parser.add_argument('--dimension', type=int, default=768, help="Synthetic embedding dimension.")
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--top-k', type=int, default=3)
+        parser.add_argument('--rerank', type=int, default=20, help="Candidates re-scored at full precision.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['vectors']:
+            vectors = VectorIndex._normalize(np.load(options['vectors'], mmap_mode='r'))
+        else:
+            vectors = clustered_vectors(options['count'], options['dimension'], clusters=max(1, options['count'] // 100),
+                                        seed=options['seed'])
+        rng = np.random.default_rng(options['seed'] + 1)
+        queries = vectors[rng.integers(len(vectors), size=options['queries'])]
+        queries = VectorIndex._normalize(queries + 0.3 * rng.standard_normal(queries.shape).astype(np.float32))
+        texts = [""] * len(vectors)
+        top_k = options['top_k']
+
+        exact = VectorIndex(vectors, texts, normalized=True)
+        indexes = [("float32", exact)] + [
+            (f"{precision}{' +rerank' if rerank else ''}", QuantizedVectorIndex(vectors, texts, True, precision, rerank))
+            for precision in ('float16', 'int8') for rerank in (0, options['rerank'])
+        ]
+
+        exact_ids = exact.search(queries, top_k)[1]
+        self.stdout.write(f"{len(vectors)} vectors x {vectors.shape[1]} dims, {len(queries)} queries.")
+        self.stdout.write(f"{'storage':>15}  {'index MB':>9}  {'rerank MB':>9}  {'recall@' + str(top_k):>9}  "
+                          f"{'delta':>7}  {'ms/query':>9}")
+        for name, index in indexes:
+            started = time.perf_counter()
+            ids = [index.search(query, top_k)[1][0] for query in queries]
+            ms = (time.perf_counter() - started) * 1000 / len(queries)
+            footprint = index.memory_footprint()
+            recall = recall_at_k(ids, exact_ids)
+            self.stdout.write(f"{name:>15}  {footprint['index_bytes'] / 1e6:>9.2f}  {footprint['rerank_bytes'] / 1e6:>9.2f}  "
+                              f"{recall:>9.3f}  {recall - 1:>+7.3f}  {ms:>9.2f}")
@@ -0,0 +1,54 @@
+# chat/management/commands/benchmark_serialization.py
+
+import json
+import timeit
+
+from django.core.management.base import BaseCommand
+from django.http import JsonResponse
+
+from chat.llm_schemas import ClassificationOutput, PYTHON_ESCALATION_MESSAGES, Status, TopicCategory
+from chat.serialization import classification_output_response, escalation_response
+
+SAMPLE_OUTPUT = ClassificationOutput(
+    topic=TopicCategory.LAB,
+    status=Status.CLASSIFIED,
+    response_message="Thanks for the update on your lab work. Remember most Twin Health labs require a 12-hour "
+                     "fast and are scheduled via Labcorp or Quest Diagnostics.",
+    confidence=0.93,
+    justification="The user confirms a scheduled blood draw, which is a LAB topic.",
+)
+
+
+def legacy_success(raw: str):
+    return JsonResponse(ClassificationOutput(**json.loads(raw)).model_dump(), status=200)
+
+
+def lean_success(raw: str):
+    return classification_output_response(ClassificationOutput.model_validate_json(raw))
+
+
+class Command(BaseCommand):
+    help = ("Microbenchmarks the classify response pipeline: LLM JSON text -> validated output -> HTTP response, "
+            "legacy (json.loads, model_dump, JsonResponse) against lean (model_validate_json, bytes, HttpResponse).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=20000, help="Calls per measurement.")
+
+    def measure(self, function, number) -> float:
+        """Best-of-5 microseconds per call."""
+        return min(timeit.repeat(function, number=number, repeat=5)) / number * 1e6
+
+    def handle(self, *args, **options):
+        number = options['number']
+        raw = SAMPLE_OUTPUT.model_dump_json()
+        error = PYTHON_ESCALATION_MESSAGES["system_error"]
+        cases = [
+            ("success", lambda: legacy_success(raw), lambda: lean_success(raw)),
+            ("system_error", lambda: JsonResponse(error, status=503), lambda: escalation_response("system_error", 503)),
+        ]
+
+        self.stdout.write(f"{'path':>14}  {'legacy us':>10}  {'lean us':>10}  {'saved us':>9}")
+        for name, legacy, lean in cases:
+            assert json.loads(legacy().content) == json.loads(lean().content)
+            legacy_us, lean_us = self.measure(legacy, number), self.measure(lean, number)
+            self.stdout.write(f"{name:>14}  {legacy_us:>10.2f}  {lean_us:>10.2f}  {legacy_us - lean_us:>9.2f}")
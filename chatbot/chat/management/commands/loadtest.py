@@ -0,0 +1,79 @@
+# chat/management/commands/loadtest.py
+
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+
+from chat import response_cache
+from chat.benchmarks.driver import load_corpus, expand_corpus, run_wsgi, run_asgi, format_report
+from chat.benchmarks.fake_gemini import FakeGeminiClient, LatencyModel
+
+
+class Command(BaseCommand):
+    help = ("Offline load test of the classify endpoints against a local fake Gemini client. "
+            "Runs on a throwaway test database and never spends API quota.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', default='reminder_replies',
+                            help="Corpus name in chat/benchmarks/corpora/ or a path to a .jsonl file.")
+        parser.add_argument('--conversations', type=int, default=200,
+                            help="Number of conversations replayed per run.")
+        parser.add_argument('--concurrency', default='1,8,32',
+                            help="Comma-separated concurrency levels.")
+        parser.add_argument('--mode', choices=['wsgi', 'asgi', 'both'], default='both')
+        parser.add_argument('--latency-median-ms', type=float, default=800.0)
+        parser.add_argument('--latency-p95-ms', type=float, default=1600.0)
+        parser.add_argument('--error-rate', type=float, default=0.0)
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--llm-only', action='store_true',
+                            help="Disable the fast path and response cache so every turn reaches the (fake) LLM.")
+        parser.add_argument('--json', dest='json_path', help="Also write the report rows to this JSON file.")
+
+    def handle(self, *args, **options):
+        corpus = load_corpus(options['corpus'])
+        levels = [int(level) for level in options['concurrency'].split(',')]
+        modes = ['wsgi', 'asgi'] if options['mode'] == 'both' else [options['mode']]
+        fake_client = FakeGeminiClient(
+            latency=LatencyModel(options['latency_median_ms'], options['latency_p95_ms'], seed=options['seed']),
+            error_rate=options['error_rate'],
+            seed=options['seed'],
+        )
+
+        overrides = {'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver']}
+        if options['llm_only']:
+            overrides.update(FAST_PATH_ENABLED=False, RESPONSE_CACHE_BACKEND='none')
+
+        temp_dir = None
+        if connection.vendor == 'sqlite':
+            # A file-backed database mirrors production locking (in-memory SQLite fails fast instead)
+            temp_dir = tempfile.mkdtemp(prefix='loadtest-')
+            connection.settings_dict['TEST']['NAME'] = os.path.join(temp_dir, 'loadtest.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        rows = []
+        try:
+            with override_settings(**overrides), \
+                    mock.patch('chat.gemini_client._client', fake_client), \
+                    mock.patch.object(response_cache, '_response_cache', None):
+                for mode in modes:
+                    runner = run_wsgi if mode == 'wsgi' else run_asgi
+                    for level in levels:
+                        conversations = expand_corpus(corpus, options['conversations'])
+                        rows.append(runner(conversations, level))
+                        self.stdout.write(format_report(rows[-1:]).splitlines()[-1])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            if temp_dir:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+
+        self.stdout.write("")
+        self.stdout.write(format_report(rows))
+        if options['json_path']:
+            with open(options['json_path'], 'w') as report_file:
+                json.dump(rows, report_file, indent=2)
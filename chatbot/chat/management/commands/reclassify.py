@@ -0,0 +1,189 @@
+# chat/management/commands/reclassify.py
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+
+from chat import views
+from chat.batch import HISTORY_TURNS
+from chat.gemini_client import get_client
+from chat.history_cache import format_history_line
+from chat.knowledge_base import get_knowledge_base
+from chat.models import Conversation, Message, Reclassification, ReclassificationCheckpoint
+from chat.prompt_builder import build_request_contents, get_generation_config
+
+
+def extract_turns(messages: list[Message]) -> list[tuple]:
+    """
+    Rebuilds every user turn of one conversation as the live view saw it. Returns
+    (message, history_context, old_topic_category, old_status) tuples; the old
+    classification is read from the AI reply logged right after the turn, if any.
+    """
+    turns = []
+    for position, message in enumerate(messages):
+        if message.sender != 'user':
+            continue
+        history_context = "\n".join(
+            format_history_line(previous.sender, previous.text)
+            for previous in messages[max(0, position - HISTORY_TURNS):position]
+        )
+        reply = messages[position + 1] if position + 1 < len(messages) else None
+        if reply is not None and reply.sender == 'ai':
+            turns.append((message, history_context, reply.topic_category, reply.status))
+        else:
+            turns.append((message, history_context, None, None))
+    return turns
+
+
+def classify_turn(turn):
+    """Classifies one rebuilt turn with Gemini; runs on a worker thread (no DB access)."""
+    message, history_context, _, _ = turn
+    contents = build_request_contents(history_context, message.text)
+    generation_config = get_generation_config(get_client(), views.get_rules_context(message.text))
+    return views.generate_classification(contents, generation_config)
+
+
+class Command(BaseCommand):
+    help = ("Re-scores stored user turns against the current knowledge base and GEMINI_MODEL, writing results "
+            "to the Reclassification side table. Resumable: progress is checkpointed per page of conversations, "
+            "and turns that failed (e.g. while the circuit breaker was open) are retried on the next run.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--run-id', help="Run name (default: <GEMINI_MODEL>-<knowledge base version>).")
+        parser.add_argument('--workers', type=int, default=8, help="Concurrent Gemini calls.")
+        parser.add_argument('--page-size', type=int, default=100, help="Conversations per page/checkpoint.")
+        parser.add_argument('--limit', type=int, default=0, help="Stop after roughly this many turns (0 = all).")
+        parser.add_argument('--restart', action='store_true', help="Discard the run's checkpoint and results first.")
+        parser.add_argument('--report', action='store_true', help="Only print the old -> new diff for the run.")
+
+    def handle(self, *args, **options):
+        if not get_client():
+            raise CommandError("The Gemini client is not initialized (check GEMINI_API_KEY).")
+
+        run_id = options['run_id'] or f"{settings.GEMINI_MODEL}-{get_knowledge_base().version}"
+        if options['report']:
+            self.report(run_id)
+            return
+
+        if options['restart']:
+            Reclassification.objects.filter(run_id=run_id).delete()
+            ReclassificationCheckpoint.objects.filter(run_id=run_id).delete()
+        checkpoint, created = ReclassificationCheckpoint.objects.get_or_create(run_id=run_id)
+        if not created:
+            self.stdout.write(f"Resuming {run_id} after conversation {checkpoint.last_conversation_id} "
+                              f"({checkpoint.processed_turns} turns done).")
+
+        started = time.perf_counter()
+        processed_this_run = 0
+        page_size = options['page_size']
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            # --- 1. Retry the Turns that Failed in Earlier Runs ---
+            retry = list(
+                Message.objects.filter(pk__in=checkpoint.failed_message_ids)
+                .order_by('conversation_id').values_list('pk', 'conversation_id')
+            )
+            checkpoint.failed_message_ids = [pk for pk, _ in retry]  # Forget messages deleted since
+            retry_conversation_ids = list(dict.fromkeys(conversation_id for _, conversation_id in retry))
+            if retry_conversation_ids:
+                self.stdout.write(f"Retrying {len(retry)} failed turns in {len(retry_conversation_ids)} conversations.")
+            for position in range(0, len(retry_conversation_ids), page_size):
+                processed_this_run += self.process_page(
+                    executor, run_id, checkpoint, retry_conversation_ids[position:position + page_size], advance=False)
+
+            while not options['limit'] or processed_this_run < options['limit']:
+                # --- 2. Keyset Pagination over Conversations ---
+                conversation_ids = list(
+                    Conversation.objects.filter(pk__gt=checkpoint.last_conversation_id)
+                    .order_by('pk').values_list('pk', flat=True)[:page_size]
+                )
+                if not conversation_ids:
+                    break
+
+                processed_this_run += self.process_page(executor, run_id, checkpoint, conversation_ids, advance=True)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f"Conversation {conversation_ids[-1]}: {checkpoint.processed_turns} turns done, "
+                                  f"{checkpoint.failed_turns} failed ({processed_this_run / elapsed:.1f} turns/s).")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Run {run_id}: {checkpoint.processed_turns} turns reclassified, {checkpoint.failed_turns} failed "
+            f"(retried on the next run)."))
+
+    def process_page(self, executor, run_id, checkpoint, conversation_ids, advance: bool) -> int:
+        """
+        Classifies the not yet reclassified turns of a page of conversations, writes the
+        results and records the failed turns for a later retry; returns the turns tried.
+        `advance` moves the keyset checkpoint past the page (not for retry pages).
+        """
+        turns = self.load_turns(run_id, conversation_ids)
+
+        # --- Classify with the Worker Pool ---
+        results, failed_ids = [], []
+        for turn, outcome in zip(turns, executor.map(self.safe_classify, turns)):
+            message, _, old_topic, old_status = turn
+            if outcome is None:
+                failed_ids.append(message.pk)
+                continue
+            results.append(Reclassification(
+                run_id=run_id, message=message,
+                old_topic_category=old_topic, old_status=old_status,
+                new_topic_category=outcome.topic.value, new_status=outcome.status.value,
+                new_response_message=outcome.response_message,
+            ))
+
+        # --- Write Results and Update the Checkpoint Together ---
+        tried = {turn[0].pk for turn in turns}
+        with transaction.atomic():
+            Reclassification.objects.bulk_create(results, batch_size=500, ignore_conflicts=True)
+            if advance:
+                checkpoint.last_conversation_id = conversation_ids[-1]
+            checkpoint.failed_message_ids = [
+                pk for pk in checkpoint.failed_message_ids if pk not in tried] + failed_ids
+            checkpoint.processed_turns += len(results)
+            checkpoint.failed_turns = len(checkpoint.failed_message_ids)
+            checkpoint.save()
+        return len(turns)
+
+    def load_turns(self, run_id, conversation_ids):
+        """Streams one page of messages in conversation order and rebuilds its turns."""
+        already_done = set(
+            Reclassification.objects.filter(run_id=run_id, message__conversation_id__in=conversation_ids)
+            .values_list('message_id', flat=True)
+        )
+        messages = (
+            Message.objects.filter(conversation_id__in=conversation_ids)
+            .order_by('conversation_id', 'timestamp', 'pk')
+            .only('id', 'conversation_id', 'sender', 'text', 'topic_category', 'status')
+            .iterator(chunk_size=2000)
+        )
+        turns = []
+        for _, conversation_messages in groupby(messages, key=lambda message: message.conversation_id):
+            turns += [turn for turn in extract_turns(list(conversation_messages)) if turn[0].pk not in already_done]
+        return turns
+
+    def safe_classify(self, turn):
+        try:
+            return classify_turn(turn)
+        except Exception as e:
+            self.stderr.write(f"Message {turn[0].pk} failed: {e}")
+            return None
+
+    def report(self, run_id):
+        """Prints the old -> new topic/status transitions for a run, aggregated in the database."""
+        rows = (
+            Reclassification.objects.filter(run_id=run_id)
+            .values('old_topic_category', 'old_status', 'new_topic_category', 'new_status')
+            .annotate(count=Count('id')).order_by('-count')
+        )
+        total = changed = 0
+        for row in rows:
+            total += row['count']
+            is_changed = (row['old_topic_category'], row['old_status']) != (row['new_topic_category'], row['new_status'])
+            changed += row['count'] if is_changed else 0
+            self.stdout.write(f"{row['count']:>8}  {row['old_topic_category']}/{row['old_status']} -> "
+                              f"{row['new_topic_category']}/{row['new_status']}{'  *' if is_changed else ''}")
+        self.stdout.write(f"Run {run_id}: {changed} of {total} turns changed classification.")
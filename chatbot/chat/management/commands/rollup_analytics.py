@@ -0,0 +1,96 @@
+# chat/management/commands/rollup_analytics.py
+
+from collections import Counter
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from chat.analytics import bucket_key, truncate_hour
+from chat.archive import decode_rows
+from chat.models import ClassificationRollup, ConversationArchive, Message
+
+# Extra seconds, beyond ANALYTICS_FLUSH_INTERVAL, allowed for a worker's flush to land
+FLUSH_MARGIN = 30
+
+
+class Command(BaseCommand):
+    help = ("Rebuilds ClassificationRollup rows from the Message table in streamed primary-key chunks, plus "
+            "the messages of archived conversations. Use it once to backfill history and periodically (e.g. "
+            "hourly) to make closed hours exact.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=0,
+                            help="Only recompute the last N settled hours (default: the whole table).")
+        parser.add_argument('--chunk-size', type=int, default=50000, help="Message ids aggregated per query.")
+        parser.add_argument('--include-current-hour', action='store_true',
+                            help="Also overwrite the open hour (normally left to the live accumulator); counts "
+                                 "workers have not flushed yet are added on top of it later.")
+
+    def handle(self, *args, **options):
+        # --- 1. Hour Range and the Message Ids Covering It ---
+        # An hour is recomputed only once it is settled: live workers may still hold counts
+        # for the hour that just closed until their next flush, and those would be added on
+        # top of the recomputed row
+        if options['include_current_hour']:
+            end = truncate_hour(timezone.now()) + timedelta(hours=1)
+        else:
+            settle_delay = getattr(settings, 'ANALYTICS_FLUSH_INTERVAL', 10.0) + FLUSH_MARGIN
+            end = truncate_hour(timezone.now() - timedelta(seconds=settle_delay))
+        start = end - timedelta(hours=options['hours']) if options['hours'] else None
+        messages = Message.objects.filter(sender='ai', timestamp__lt=end)
+        if start is not None:
+            messages = messages.filter(timestamp__gte=start)
+        bounds = messages.aggregate(first=Min('id'), last=Max('id'))
+
+        # --- 2. Aggregate Chunk by Chunk (each query touches at most chunk_size ids) ---
+        counts = Counter()
+        chunk_size = options['chunk_size']
+        if bounds['first'] is not None:
+            for chunk_start in range(bounds['first'], bounds['last'] + 1, chunk_size):
+                rows = (
+                    messages.filter(id__gte=chunk_start, id__lt=chunk_start + chunk_size)
+                    .annotate(hour=TruncHour('timestamp', tzinfo=dt_timezone.utc))
+                    .values('hour', 'topic_category', 'status').annotate(count=Count('id')).order_by()
+                )
+                for row in rows:
+                    counts[bucket_key(row['hour'], row['topic_category'], row['status'])] += row['count']
+                self.stdout.write(
+                    f"Aggregated ids {chunk_start}-{min(chunk_start + chunk_size, bounds['last'] + 1) - 1}.")
+
+        # Archived conversations' messages left the Message table but still count; an
+        # archive can only hold messages in range if its conversation was active since start
+        archives = ConversationArchive.objects.all()
+        if start is not None:
+            archives = archives.filter(Q(conversation__last_activity__gte=start)
+                                       | Q(conversation__last_activity__isnull=True))
+        archived = 0
+        for payload in archives.values_list('payload', flat=True).iterator(chunk_size=100):
+            for row in decode_rows(payload):
+                timestamp = row['timestamp'].astimezone(dt_timezone.utc)
+                if row['sender'] == 'ai' and timestamp < end and (start is None or timestamp >= start):
+                    counts[bucket_key(timestamp, row['topic_category'], row['status'])] += 1
+                    archived += 1
+        if archived:
+            self.stdout.write(f"Aggregated {archived} archived AI messages.")
+        if not counts:
+            self.stdout.write("No AI messages in range; nothing to roll up.")
+            return
+
+        # --- 3. Replace the Covered Hours in One Transaction ---
+        with transaction.atomic():
+            covered = ClassificationRollup.objects.filter(hour__lt=end)
+            if start is not None:
+                covered = covered.filter(hour__gte=start)
+            covered.delete()
+            ClassificationRollup.objects.bulk_create(
+                [ClassificationRollup(hour=hour, topic_category=topic_category, status=status, count=count)
+                 for (hour, topic_category, status), count in counts.items()],
+                batch_size=1000,
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {len(counts)} rollup rows covering {sum(counts.values())} AI messages."))
@@ -0,0 +1,86 @@
+# chat/management/commands/train_local_classifier.py
+
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.history_cache import format_history_line
+from chat.llm_schemas import Status
+from chat.local_classifier import DEFAULT_DIMENSION, train
+from chat.models import Message
+
+THRESHOLDS = (0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 0.98)
+
+
+def load_training_samples() -> list[tuple[str, str, str]]:
+    """
+    Pairs every user message with the topic_category of the AI reply logged right
+    after it, plus the history line before it. Only replies with status 'classified'
+    are used: the model answers with the canned confirmation, so turns that were
+    escalated or left unanswered must not teach it their topic. Streams the table in
+    conversation order. Returns (user_message, previous_line, topic) samples.
+    """
+    samples = []
+    messages = (
+        Message.objects.order_by('conversation_id', 'timestamp', 'pk')
+        .values_list('conversation_id', 'sender', 'text', 'topic_category', 'status')
+        .iterator(chunk_size=5000)
+    )
+    conversation, previous_line, pending = None, "", None
+    for conversation_id, sender, text, topic_category, status in messages:
+        if conversation_id != conversation:
+            conversation, previous_line, pending = conversation_id, "", None
+        if sender == 'user':
+            pending = (text, previous_line)
+        elif pending and topic_category and status == Status.CLASSIFIED.value:
+            samples.append((pending[0], pending[1], topic_category))
+            pending = None
+        else:
+            pending = None
+        previous_line = format_history_line(sender, text)
+    return samples
+
+
+class Command(BaseCommand):
+    help = ("Trains the local hashed n-gram topic classifier on logged Message data, reports accuracy and "
+            "coverage per confidence threshold on a held-out split, and writes the artifact.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=str(settings.LOCAL_CLASSIFIER_PATH), help="Artifact path (.npz).")
+        parser.add_argument('--dimension', type=int, default=DEFAULT_DIMENSION, help="Hashed feature space size.")
+        parser.add_argument('--epochs', type=int, default=8)
+        parser.add_argument('--holdout', type=float, default=0.2, help="Fraction held out for the threshold report.")
+        parser.add_argument('--min-samples', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        samples = load_training_samples()
+        if len(samples) < options['min_samples']:
+            raise CommandError(f"Only {len(samples)} labelled turns found; need at least {options['min_samples']}.")
+        self.stdout.write(f"Loaded {len(samples)} labelled turns.")
+
+        # --- 1. Held-out Evaluation for Threshold Tuning ---
+        order = np.random.default_rng(options['seed']).permutation(len(samples))
+        held_out = int(len(samples) * options['holdout'])
+        if held_out:
+            evaluation = [samples[i] for i in order[:held_out]]
+            model = train([samples[i] for i in order[held_out:]], options['dimension'], options['epochs'],
+                          seed=options['seed'])
+            predictions = [model.predict(message, previous) for message, previous, _ in evaluation]
+            self.stdout.write(f"{'threshold':>10}  {'coverage':>9}  {'accuracy':>9}")
+            for threshold in THRESHOLDS:
+                answered = [(topic == expected) for (topic, probability), (_, _, expected)
+                            in zip(predictions, evaluation) if probability >= threshold]
+                accuracy = sum(answered) / len(answered) if answered else 0.0
+                self.stdout.write(f"{threshold:>10.2f}  {len(answered) / len(evaluation):>9.1%}  {accuracy:>9.1%}")
+
+        # --- 2. Final Model on All Samples ---
+        started = time.perf_counter()
+        model = train(samples, options['dimension'], options['epochs'], seed=options['seed'])
+        model.save(options['output'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Trained on {len(samples)} turns in {time.perf_counter() - started:.1f}s; "
+            f"wrote {options['output']} (classes: {', '.join(model.classes)})."
+        ))
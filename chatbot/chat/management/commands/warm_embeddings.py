@@ -0,0 +1,27 @@
+# chat/management/commands/warm_embeddings.py
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.knowledge_base import get_knowledge_base
+from chat.rag_core.data_loader import embed_texts, get_embedding_cache
+
+
+class Command(BaseCommand):
+    help = "Pre-warms the on-disk embedding cache with the knowledge base chunks (run at deploy time)."
+
+    def handle(self, *args, **options):
+        cache = get_embedding_cache()
+        if cache is None:
+            raise CommandError("EMBEDDING_CACHE_DIR is not set; nothing to warm.")
+
+        knowledge_base = get_knowledge_base()
+        chunks = knowledge_base.chunks
+        vectors = embed_texts(chunks)
+        if vectors is None:
+            raise CommandError("Embedding failed; the cache was only partially warmed.")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Embedding cache at {cache.directory} holds the {len(chunks)} chunks of knowledge base "
+            f"{knowledge_base.version} "
+            f"(Dimension: {vectors.shape[1]})."
+        ))
@@ -0,0 +1,63 @@
+# chat/management/commands/warmup.py
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.warmup import warm_up
+
+PROJECT_DIR = Path(__file__).resolve().parents[3]
+
+# Run in a fresh interpreter: what a newly forked (non-preloaded) worker pays before serving
+BOOT_SCRIPT = """
+import json, os, time
+started = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'chatbot.settings')
+import django
+django.setup()
+import chatbot.urls
+booted = time.perf_counter()
+from chat.warmup import warm_up
+warm_up()
+print(json.dumps({"boot": booted - started, "warm": time.perf_counter() - booted}))
+"""
+
+
+class Command(BaseCommand):
+    help = ("Warms the lazily built classify-path components (Gemini client, schema, knowledge base, RAG index, "
+            "local classifier, caches) and reports per-step timings. At deploy time this also fills the on-disk "
+            "embedding cache and ANN index. --benchmark N measures cold worker boot in N fresh interpreters.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--benchmark', type=int, default=0, metavar='N',
+                            help="Also time Django setup + URLconf import, then warm-up, in N fresh processes.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        for name, seconds in warm_up():
+            self.stdout.write(f"{name:>18}  {seconds * 1000:>9.1f} ms")
+        self.stdout.write(self.style.SUCCESS(f"Warm-up finished in {time.perf_counter() - started:.2f}s."))
+
+        if options['benchmark']:
+            self.benchmark(options['benchmark'])
+
+    def benchmark(self, runs: int):
+        results = []
+        for _ in range(runs):
+            completed = subprocess.run([sys.executable, '-c', BOOT_SCRIPT], cwd=PROJECT_DIR, env=os.environ.copy(),
+                                       capture_output=True, text=True)
+            if completed.returncode != 0:
+                raise CommandError(f"Boot benchmark process failed:\n{completed.stderr}")
+            results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+        boot = [result['boot'] * 1000 for result in results]
+        warm = [result['warm'] * 1000 for result in results]
+        self.stdout.write(f"{'':>18}  {'median':>9}  {'max':>9}")
+        self.stdout.write(f"{'boot (to serve)':>18}  {statistics.median(boot):>9.1f}  {max(boot):>9.1f} ms")
+        self.stdout.write(f"{'warm-up':>18}  {statistics.median(warm):>9.1f}  {max(warm):>9.1f} ms")
@@ -0,0 +1,246 @@
+# chat/message_logger.py
+
+import atexit
+import queue
+import threading
+import time
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from . import analytics, history_cache
+from .models import Conversation, Message, RECENT_TURNS
+
+SNAPSHOT_FIELDS = ['recent_turns', 'last_activity']
+
+
+def refresh_snapshots(conversation_ids) -> dict:
+    """
+    Rebuilds recent_turns / last_activity of conversations from their latest Message
+    rows (one windowed query, one bulk UPDATE) and returns {conversation_id: lines}.
+    Call it in the transaction that inserted the rows, after the INSERT: on SQLite the
+    insert already holds the write lock, elsewhere the conversation rows are locked
+    first, so concurrent writers to one session serialize and the last to commit
+    stores a snapshot that includes every message.
+    """
+    conversation_ids = sorted(set(conversation_ids))
+    if connection.features.has_select_for_update:
+        list(Conversation.objects.select_for_update().filter(pk__in=conversation_ids).values_list('pk', flat=True))
+    recent = Message.objects.filter(conversation_id__in=conversation_ids).annotate(
+        turn=Window(RowNumber(), partition_by=[F('conversation_id')], order_by=[F('timestamp').desc(), F('pk').desc()])
+    ).filter(turn__lte=RECENT_TURNS).values_list('conversation_id', 'turn', 'sender', 'text', 'timestamp')
+
+    rows = defaultdict(list)
+    for conversation_id, turn, sender, text, timestamp in recent:
+        rows[conversation_id].append((turn, history_cache.format_history_line(sender, text), timestamp))
+    snapshots = []
+    for conversation_id, entries in rows.items():
+        entries.sort(key=lambda entry: entry[0], reverse=True)  # Highest turn number is oldest
+        snapshots.append(Conversation(pk=conversation_id, recent_turns=[line for _, line, _ in entries],
+                                      last_activity=entries[-1][2]))
+    Conversation.objects.bulk_update(snapshots, SNAPSHOT_FIELDS)
+    return {conversation.pk: conversation.recent_turns for conversation in snapshots}
+
+
+def insert_messages(messages: list[Message]):
+    """Inserts Message rows and refreshes their conversations' snapshots in one transaction."""
+    with transaction.atomic():
+        Message.objects.bulk_create(messages, batch_size=getattr(settings, 'MESSAGE_LOG_BATCH_SIZE', 100))
+        refresh_snapshots(message.conversation_id for message in messages)
+
+
+def save_message(message: Message):
+    """Inserts one Message; the post_save handler refreshes the snapshot inside the same transaction."""
+    with transaction.atomic():
+        message.save(force_insert=True)
+
+
+class WriteBehindLogger:
+    """
+    Buffers Message rows in memory and writes them with bulk_create from a background
+    thread once MESSAGE_LOG_BATCH_SIZE rows are queued or MESSAGE_LOG_FLUSH_INTERVAL
+    seconds have passed, so responses never wait on the SQLite write lock. Each batch
+    and its conversations' recent-turns snapshots are written in one transaction; if
+    it fails, its rows are retried one by one and only those that still fail are
+    dropped. Rows are timestamped when enqueued; if the queue is full they are dropped
+    and counted.
+    """
+
+    def __init__(self, batch_size: int = 100, flush_interval: float = 0.5, max_queue_size: int = 10000,
+                 start: bool = True):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: queue.Queue[Message] = queue.Queue(maxsize=max_queue_size)
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.enqueued = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.failed_batches = 0
+        self.flushes = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+
+        if start:
+            self._thread = threading.Thread(target=self._run, name='message-write-behind', daemon=True)
+            self._thread.start()
+            atexit.register(self.shutdown)
+
+    def enqueue(self, message: Message) -> bool:
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    def _drain(self, limit: int) -> list[Message]:
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def flush(self) -> int:
+        """Writes everything currently queued (in batch_size chunks); returns the rows written."""
+        written = 0
+        with self._flush_lock:
+            while True:
+                batch = self._drain(self.batch_size)
+                if not batch:
+                    return written
+                started = time.perf_counter()
+                try:
+                    insert_messages(batch)
+                    saved = len(batch)
+                except Exception as e:
+                    print(f"Write-behind flush of {len(batch)} messages failed, retrying them one by one: {e}")
+                    saved = self._insert_individually(batch)
+                written += saved
+                self.flushed += saved
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                self.flushes += 1
+                self.last_flush_ms = elapsed_ms
+                self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+
+    def _insert_individually(self, batch: list[Message]) -> int:
+        """Inserts the rows of a failed batch one by one, so only the bad rows are dropped."""
+        saved = 0
+        for message in batch:
+            try:
+                insert_messages([message])
+                saved += 1
+            except Exception as e:
+                print(f"Write-behind dropped a message for conversation {message.conversation_id}: {e}")
+                self.dropped += 1
+        self.failed_batches += 1
+        return saved
+
+    def _run(self):
+        deadline = time.monotonic() + self.flush_interval
+        while not self._stop.is_set():
+            if self._queue.qsize() >= self.batch_size or time.monotonic() >= deadline:
+                if self._queue.qsize():
+                    close_old_connections()
+                    self.flush()
+                deadline = time.monotonic() + self.flush_interval
+            self._stop.wait(min(0.05, self.flush_interval))
+
+    def shutdown(self):
+        """Stops the background thread and writes any rows still queued."""
+        self._stop.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def get_stats(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "enqueued": self.enqueued,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "failed_batches": self.failed_batches,
+            "flushes": self.flushes,
+            "last_flush_ms": self.last_flush_ms,
+            "max_flush_ms": self.max_flush_ms,
+        }
+
+
+_write_behind = None
+_write_behind_lock = threading.Lock()
+
+
+def get_write_behind_logger() -> WriteBehindLogger | None:
+    """Returns the process-wide write-behind logger, or None when MESSAGE_WRITE_BEHIND is off."""
+    global _write_behind
+    if not getattr(settings, 'MESSAGE_WRITE_BEHIND', False):
+        return None
+    with _write_behind_lock:
+        if _write_behind is None:
+            if not history_cache.is_enabled():
+                print("MESSAGE_WRITE_BEHIND is on without HISTORY_CACHE_ENABLED: conversation history "
+                      "will miss queued messages until they are flushed.")
+            _write_behind = WriteBehindLogger(
+                batch_size=getattr(settings, 'MESSAGE_LOG_BATCH_SIZE', 100),
+                flush_interval=getattr(settings, 'MESSAGE_LOG_FLUSH_INTERVAL', 0.5),
+                max_queue_size=getattr(settings, 'MESSAGE_LOG_MAX_QUEUE', 10000),
+            )
+        return _write_behind
+
+
+def build_message(conversation, sender, text, topic_category=None, status=None, knowledge_base_version=None):
+    """Builds an unsaved Message, timestamped now so rows written later keep their order."""
+    return Message(conversation=conversation, sender=sender, text=text, timestamp=timezone.now(),
+                   topic_category=topic_category, status=status, knowledge_base_version=knowledge_base_version)
+
+
+def log_message(conversation, sender, text, topic_category=None, status=None, knowledge_base_version=None):
+    """
+    Logs one Message. With write-behind enabled the row is queued and the session
+    history cache is updated immediately (bulk_create does not fire post_save);
+    otherwise the row is inserted synchronously.
+    """
+    message = build_message(conversation, sender, text, topic_category, status, knowledge_base_version)
+    analytics.record_messages([message])
+    write_behind = get_write_behind_logger()
+    if write_behind is None:
+        save_message(message)
+        return
+
+    write_behind.enqueue(message)
+    if history_cache.is_enabled():
+        history_cache.append_message(conversation, sender, text)
+
+
+async def alog_message(conversation, sender, text, topic_category=None, status=None, knowledge_base_version=None):
+    """Async counterpart of log_message; enqueueing never awaits the database."""
+    message = build_message(conversation, sender, text, topic_category, status, knowledge_base_version)
+    analytics.record_messages([message])
+    write_behind = get_write_behind_logger()
+    if write_behind is None:
+        await sync_to_async(save_message)(message)
+        return
+
+    write_behind.enqueue(message)
+    if history_cache.is_enabled():
+        await history_cache.aappend_message(conversation, sender, text)
+
+
+async def abulk_log_messages(messages: list[Message]):
+    """
+    Inserts pre-built Message rows with batched INSERTs (used by the batch endpoint) and
+    refreshes the touched conversations' snapshots in the same transaction. bulk_create
+    skips post_save, so callers refresh the history cache themselves.
+    """
+    await sync_to_async(insert_messages)(messages)
+    analytics.record_messages(messages)
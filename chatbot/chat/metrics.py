@@ -0,0 +1,195 @@
+# chat/metrics.py
+
+import cProfile
+import io
+import pstats
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from django.conf import settings
+
+# Latency buckets in seconds: sub-millisecond local stages up to multi-second LLM calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key: tuple, extra: dict | None = None) -> str:
+    items = list(key) + list((extra or {}).items())
+    if not items:
+        return ""
+    escaped = (f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for name, value in items)
+    return "{" + ",".join(escaped) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0.0)
+
+    def expose(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            lines += [f"{self.name}{_format_labels(key)} {value}" for key, value in self._values.items()]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self._series: dict[tuple, list] = {}  # key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, **labels) -> int:
+        series = self._series.get(_label_key(labels))
+        return series[-1] if series else 0
+
+    def average(self, **labels) -> float:
+        series = self._series.get(_label_key(labels))
+        return series[-2] / series[-1] if series else 0.0
+
+    def expose(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {key: list(series) for key, series in self._series.items()}
+        for key, series in snapshot.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), series):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float('inf') else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(key, {'le': le})} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {series[-1]}")
+        return lines
+
+
+class Registry:
+    """Holds metrics plus gauge collectors (callables returning {name: value}) sampled at scrape time."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        metric = Counter(name, documentation)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector):
+        self._collectors.append(collector)
+
+    def expose(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines += metric.expose()
+        for collector in self._collectors:
+            try:
+                gauges = collector()
+            except Exception as e:
+                print(f"Metrics collector failed: {e}")
+                continue
+            for name, value in gauges.items():
+                lines += [f"# TYPE {name} gauge", f"{name} {float(value)}"]
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "chat_classify_stage_seconds", "Time spent in each stage of the classify path.")
+REQUEST_SECONDS = REGISTRY.histogram(
+    "chat_classify_request_seconds", "End-to-end classify latency by outcome topic/status.")
+REQUESTS_TOTAL = REGISTRY.counter(
+    "chat_classify_requests_total", "Classify requests by topic, status and the source that answered.")
+GEMINI_TOKENS_TOTAL = REGISTRY.counter(
+    "chat_gemini_tokens_total", "Gemini token usage by kind (prompt, candidates, cached).")
+
+
+@contextmanager
+def span(stage: str):
+    """Times one stage of the classify path into chat_classify_stage_seconds{stage=...}."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage)
+
+
+def record_classification(started: float, topic: str, status: str, source: str):
+    """Records one finished classify request; `started` is a time.perf_counter() value."""
+    REQUEST_SECONDS.observe(time.perf_counter() - started, topic=topic, status=status)
+    REQUESTS_TOTAL.inc(topic=topic, status=status, source=source)
+
+
+def record_token_usage(response):
+    """Adds the usage_metadata token counts of a Gemini response, when present."""
+    usage = getattr(response, 'usage_metadata', None)
+    if not usage:
+        return
+    for kind, attribute in (('prompt', 'prompt_token_count'), ('candidates', 'candidates_token_count'),
+                            ('cached', 'cached_content_token_count')):
+        count = getattr(usage, attribute, None)
+        if count:
+            GEMINI_TOKENS_TOTAL.inc(count, kind=kind)
+
+
+# --- Sampling Profiler Hook ---
+
+@contextmanager
+def profile_if_slow(label: str):
+    """
+    Profiles a PROFILER_SAMPLE_RATE fraction of requests with cProfile and prints the
+    top functions for any sampled request slower than PROFILER_SLOW_SECONDS. cProfile
+    only sees the current thread, so this is meant for the sync view.
+    """
+    sample_rate = getattr(settings, 'PROFILER_SAMPLE_RATE', 0.0)
+    if sample_rate <= 0 or random.random() >= sample_rate:
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        elapsed = time.perf_counter() - started
+        if elapsed >= getattr(settings, 'PROFILER_SLOW_SECONDS', 2.0):
+            output = io.StringIO()
+            pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(25)
+            print(f"Slow request profile ({label}, {elapsed:.3f}s):\n{output.getvalue()}")
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_message_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReclassificationCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('run_id', models.CharField(max_length=100, unique=True)),
+                ('last_conversation_id', models.BigIntegerField(default=0)),
+                ('processed_turns', models.IntegerField(default=0)),
+                ('failed_turns', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Reclassification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('run_id', models.CharField(db_index=True, max_length=100)),
+                ('old_topic_category', models.CharField(blank=True, max_length=50, null=True)),
+                ('old_status', models.CharField(blank=True, max_length=20, null=True)),
+                ('new_topic_category', models.CharField(max_length=50)),
+                ('new_status', models.CharField(max_length=20)),
+                ('new_response_message', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('message', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reclassifications', to='chat.message')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('run_id', 'message'), name='unique_reclassification_per_run')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_reclassification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='knowledge_base_version',
+            field=models.CharField(blank=True, max_length=12, null=True),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_message_knowledge_base_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClassificationRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('topic_category', models.CharField(blank=True, default='', max_length=50)),
+                ('status', models.CharField(blank=True, default='', max_length=20)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('hour', 'topic_category', 'status'), name='unique_rollup_bucket')],
+            },
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+RECENT_TURNS = 10
+
+
+def fill_recent_turns(apps, schema_editor):
+    """Builds the recent-turns snapshot and last_activity of existing conversations."""
+    Conversation = apps.get_model('chat', 'Conversation')
+    Message = apps.get_model('chat', 'Message')
+    for conversation in Conversation.objects.iterator(chunk_size=500):
+        recent = list(Message.objects.filter(conversation=conversation).order_by('-timestamp', '-pk')[:RECENT_TURNS])
+        if not recent:
+            continue
+        conversation.recent_turns = [f"[{message.sender.upper()}]: {message.text}" for message in reversed(recent)]
+        conversation.last_activity = recent[0].timestamp
+        conversation.save(update_fields=['recent_turns', 'last_activity'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0005_classification_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversationArchive',
+            fields=[
+                ('conversation', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='archive', serialize=False, to='chat.conversation')),
+                ('payload', models.BinaryField()),
+                ('message_count', models.IntegerField()),
+                ('archived_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterModelOptions(
+            name='message',
+            options={},
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='archived',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_activity',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='recent_turns',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'timestamp'], name='message_conversation_time'),
+        ),
+        migrations.RunPython(fill_recent_turns, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0006_conversation_recent_turns_and_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reclassificationcheckpoint',
+            name='failed_message_ids',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
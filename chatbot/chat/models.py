@@ -1,6 +1,11 @@
 # chat/models.py
 
 from django.db import models
+from django.utils import timezone
+
+
+# Messages of history sent with each classification (and kept in Conversation.recent_turns)
+RECENT_TURNS = 10
 
 
 class Conversation(models.Model):
@@ -8,6 +13,13 @@ class Conversation(models.Model):
     session_id = models.CharField(max_length=100, unique=True, db_index=True)
     start_time = models.DateTimeField(auto_now_add=True)
 
+    # Denormalized copy of the last RECENT_TURNS formatted history lines, updated as messages
+    # are written, so loading a session's history never reads the Message table
+    recent_turns = models.JSONField(default=list, blank=True)
+    last_activity = models.DateTimeField(null=True, blank=True, db_index=True)
+    # Messages moved to a ConversationArchive blob (chat/archive.py); restored on next use
+    archived = models.BooleanField(default=False)
+
     def __str__(self):
         return f"Conversation: {self.session_id}"
 
@@ -19,14 +31,97 @@ class Message(models.Model):
 
     sender = models.CharField(max_length=10, choices=[('user', 'User'), ('ai', 'AI')])
     text = models.TextField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set at creation time (not insert time) so write-behind batches keep message order
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
 
     # Fields to log the result of the LLM classification for auditing/context
     topic_category = models.CharField(max_length=50, null=True, blank=True)
     status = models.CharField(max_length=20, null=True, blank=True)
+    # Version (content hash) of the knowledge base an AI reply was classified against
+    knowledge_base_version = models.CharField(max_length=12, null=True, blank=True)
 
     def __str__(self):
         return f'{self.sender}: {self.text[:50]}'
 
     class Meta:
-        ordering = ['timestamp']
+        # No default ordering: every query states its own, and this index serves the
+        # per-conversation ones ("messages of X by time") without a sort
+        indexes = [
+            models.Index(fields=['conversation', 'timestamp'], name='message_conversation_time'),
+        ]
+
+
+class Reclassification(models.Model):
+    """
+    Side-table result of re-scoring one stored user turn (manage.py reclassify), kept
+    next to the original classification so runs can be diffed without touching Message.
+    """
+    run_id = models.CharField(max_length=100, db_index=True)
+    message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name='reclassifications')
+
+    # Classification logged at the time (from the AI reply that followed the turn)
+    old_topic_category = models.CharField(max_length=50, null=True, blank=True)
+    old_status = models.CharField(max_length=20, null=True, blank=True)
+
+    new_topic_category = models.CharField(max_length=50)
+    new_status = models.CharField(max_length=20)
+    new_response_message = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.run_id}: {self.old_topic_category}/{self.old_status} -> {self.new_topic_category}/{self.new_status}'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['run_id', 'message'], name='unique_reclassification_per_run'),
+        ]
+
+
+class ReclassificationCheckpoint(models.Model):
+    """Progress of a reclassify run: conversations are processed in primary-key order."""
+    run_id = models.CharField(max_length=100, unique=True)
+    last_conversation_id = models.BigIntegerField(default=0)
+    processed_turns = models.IntegerField(default=0)
+    failed_turns = models.IntegerField(default=0)
+    # User messages whose turn failed; retried when the run is resumed (failed_turns counts them)
+    failed_message_ids = models.JSONField(default=list, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.run_id} @ conversation {self.last_conversation_id}'
+
+
+class ClassificationRollup(models.Model):
+    """
+    Hourly count of logged AI replies per topic_category x status, maintained
+    incrementally (chat/analytics.py) so dashboards never aggregate the Message table.
+    """
+    hour = models.DateTimeField()
+    # '' where the Message column is NULL (e.g. system_error replies have no topic)
+    topic_category = models.CharField(max_length=50, blank=True, default='')
+    status = models.CharField(max_length=20, blank=True, default='')
+    count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.hour:%Y-%m-%d %H}:00 {self.topic_category}/{self.status}: {self.count}'
+
+    class Meta:
+        constraints = [
+            # Also the index behind the hour-range reads of /api/stats/
+            models.UniqueConstraint(fields=['hour', 'topic_category', 'status'], name='unique_rollup_bucket'),
+        ]
+
+
+class ConversationArchive(models.Model):
+    """
+    The Message rows of an inactive conversation, moved out of the Message table as one
+    zlib-compressed JSON blob (manage.py archive_conversations).
+    """
+    conversation = models.OneToOneField(Conversation, on_delete=models.CASCADE, primary_key=True,
+                                        related_name='archive')
+    payload = models.BinaryField()
+    message_count = models.IntegerField()
+    archived_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'Archive of {self.conversation_id}: {self.message_count} messages'
@@ -0,0 +1,210 @@
+# chat/prompt_builder.py
+
+import functools
+import threading
+import time
+
+from django.conf import settings
+
+from .knowledge_base import get_knowledge_base
+from .llm_schemas import ClassificationOutput
+from .singleflight import AsyncSingleFlight
+
+# --- 1. Static Prefix (rules + program overview) ---
+# Sent once as the system instruction (or stored server-side via the SDK's context
+# caching API) instead of being pasted into every request's contents.
+
+SYSTEM_PREAMBLE = "You are a highly efficient, professional conversation topic classifier for Twin Health. Your sole output MUST strictly adhere to the provided JSON schema. Adhere to all formatting rules in the CONTEXT."
+
+
+def build_system_instruction(rules_context: str) -> str:
+    return f"{SYSTEM_PREAMBLE}\n\nRULES & CONTEXT:\n{rules_context}"
+
+
+class StaticPrefixCache:
+    """
+    Holds the name of a Gemini cached-content entry containing the static system
+    instruction, recreating it shortly before its TTL runs out or when the knowledge
+    base version changes (deleting the previous version's entry). Concurrent callers
+    share one creation: threads via the lock, coroutines via a single-flight per
+    knowledge base version. If creation fails (e.g. the prefix is below the model's
+    minimum cacheable size) callers fall back to sending the system instruction
+    inline, and creation is retried later.
+    """
+
+    REFRESH_MARGIN = 60  # seconds before expiry at which the entry is recreated
+    RETRY_AFTER = 300    # seconds to wait after a failed creation
+
+    def __init__(self):
+        self._name = None
+        self._version = None
+        self._expires_at = 0.0
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+        self._flights = AsyncSingleFlight()
+
+    def _create_config(self, knowledge_base, ttl: int) -> dict:
+        return {
+            "system_instruction": knowledge_base.system_instruction,
+            "ttl": f"{ttl}s",
+            "display_name": f"twin-health-rules-{knowledge_base.version}",
+        }
+
+    def _usable(self, knowledge_base, now: float) -> bool:
+        return self._name is not None and self._version == knowledge_base.version and now < self._expires_at
+
+    def _record(self, knowledge_base, name: str | None, now: float, ttl: int):
+        self._name = name
+        self._version = knowledge_base.version
+        if name:
+            self._expires_at = now + ttl - self.REFRESH_MARGIN
+        else:
+            self._retry_at = now + self.RETRY_AFTER
+
+    def _waiting_to_retry(self, knowledge_base, now: float) -> bool:
+        return self._version == knowledge_base.version and now < self._retry_at
+
+    def _superseded(self, knowledge_base) -> str | None:
+        """Name of the entry built for an older knowledge base version, if any."""
+        return self._name if self._name and self._version != knowledge_base.version else None
+
+    def get(self, client, knowledge_base) -> str | None:
+        now = time.monotonic()
+        if self._usable(knowledge_base, now):
+            return self._name
+        if self._waiting_to_retry(knowledge_base, now):
+            return None
+
+        with self._lock:
+            if self._usable(knowledge_base, now):
+                return self._name
+            superseded = self._superseded(knowledge_base)
+            ttl = getattr(settings, 'GEMINI_CONTEXT_CACHE_TTL', 3600)
+            try:
+                cached = client.caches.create(model=settings.GEMINI_MODEL,
+                                              config=self._create_config(knowledge_base, ttl))
+                self._record(knowledge_base, cached.name, now, ttl)
+            except Exception as e:
+                print(f"Gemini context cache creation failed, sending rules inline: {e}")
+                self._record(knowledge_base, None, now, ttl)
+            if superseded:
+                try:
+                    client.caches.delete(name=superseded)
+                except Exception as e:
+                    print(f"Gemini context cache deletion failed for {superseded}: {e}")
+            return self._name
+
+    async def aget(self, client, knowledge_base) -> str | None:
+        now = time.monotonic()
+        if self._usable(knowledge_base, now):
+            return self._name
+        if self._waiting_to_retry(knowledge_base, now):
+            return None
+
+        name, _ = await self._flights.do(knowledge_base.version, lambda: self._acreate(client, knowledge_base))
+        return name
+
+    async def _acreate(self, client, knowledge_base) -> str | None:
+        now = time.monotonic()
+        if self._usable(knowledge_base, now):
+            return self._name
+        superseded = self._superseded(knowledge_base)
+        ttl = getattr(settings, 'GEMINI_CONTEXT_CACHE_TTL', 3600)
+        try:
+            cached = await client.aio.caches.create(model=settings.GEMINI_MODEL,
+                                                    config=self._create_config(knowledge_base, ttl))
+            self._record(knowledge_base, cached.name, now, ttl)
+        except Exception as e:
+            print(f"Gemini context cache creation failed, sending rules inline: {e}")
+            self._record(knowledge_base, None, now, ttl)
+        if superseded:
+            try:
+                await client.aio.caches.delete(name=superseded)
+            except Exception as e:
+                print(f"Gemini context cache deletion failed for {superseded}: {e}")
+        return self._name
+
+
+STATIC_PREFIX_CACHE = StaticPrefixCache()
+
+
+@functools.cache
+def response_json_schema() -> dict:
+    # Generated once per process and shared by every request's config (the SDK passes
+    # response_json_schema through unchanged)
+    return ClassificationOutput.model_json_schema()
+
+
+def _config(system_instruction: str | None = None, cached_content: str | None = None) -> dict:
+    config = {
+        "response_mime_type": "application/json",
+        "response_json_schema": response_json_schema(),
+    }
+    if cached_content:
+        config["cached_content"] = cached_content
+    else:
+        config["system_instruction"] = system_instruction
+    return config
+
+
+def _use_context_cache(client, rules_context: str | None) -> bool:
+    # Only the full, static knowledge base can be cached; retrieved chunks vary per request
+    return bool(client) and settings.GEMINI_CONTEXT_CACHE_ENABLED and rules_context is None
+
+
+def _system_instruction(knowledge_base, rules_context: str | None) -> str:
+    # The full-KB instruction is precompiled once per knowledge base version
+    return knowledge_base.system_instruction if rules_context is None else build_system_instruction(rules_context)
+
+
+def get_generation_config(client=None, rules_context: str | None = None, knowledge_base=None) -> dict:
+    """
+    Returns the structured-output config carrying the static prefix for the classifier call.
+    rules_context=None means the whole knowledge base; pass retrieved chunks otherwise.
+    """
+    knowledge_base = knowledge_base or get_knowledge_base()
+    if _use_context_cache(client, rules_context):
+        cached_content = STATIC_PREFIX_CACHE.get(client, knowledge_base)
+        if cached_content:
+            return _config(cached_content=cached_content)
+    return _config(system_instruction=_system_instruction(knowledge_base, rules_context))
+
+
+async def aget_generation_config(client=None, rules_context: str | None = None, knowledge_base=None) -> dict:
+    """Async counterpart of get_generation_config."""
+    knowledge_base = knowledge_base or get_knowledge_base()
+    if _use_context_cache(client, rules_context):
+        cached_content = await STATIC_PREFIX_CACHE.aget(client, knowledge_base)
+        if cached_content:
+            return _config(cached_content=cached_content)
+    return _config(system_instruction=_system_instruction(knowledge_base, rules_context))
+
+
+# --- 2. Per-Request Suffix (history + current message) ---
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) used for history budgeting."""
+    return (len(text) + 3) // 4
+
+
+def trim_history(history_context: str, max_tokens: int) -> str:
+    """Keeps the most recent history lines that fit within max_tokens."""
+    kept, used = [], 0
+    for line in reversed(history_context.splitlines()):
+        cost = estimate_tokens(line) + 1
+        if used + cost > max_tokens:
+            break
+        kept.append(line)
+        used += cost
+    return "\n".join(reversed(kept))
+
+
+def build_request_contents(history_context: str, user_message: str) -> str:
+    """Builds the small per-turn contents: budgeted history plus the current message."""
+    history_context = trim_history(history_context, getattr(settings, 'PROMPT_HISTORY_TOKEN_BUDGET', 1000))
+    return f"""CONVERSATION HISTORY (Most recent message at the bottom):
+{history_context}
+[CURRENT_USER_MESSAGE]: "{user_message}"
+
+Based ONLY on the CONVERSATION HISTORY and the Classification Rules in your instructions,
+classify the topic, determine the action status, and generate the response message."""
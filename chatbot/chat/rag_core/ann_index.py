@@ -0,0 +1,268 @@
+# chat/rag_core/ann_index.py
+
+import json
+import os
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from .. import serialization
+from .vector_store import QuantizedVectorIndex, VectorIndex, quantization_report
+
+# Rows used per centroid when training; below this many rows the index stays exact
+POINTS_PER_LIST = 39
+
+
+def train_centroids(vectors: np.ndarray, n_lists: int, iterations: int = 10, seed: int = 0,
+                    chunk_size: int = 16384) -> np.ndarray:
+    """
+    Spherical k-means over unit-norm rows: returns (n_lists, dim) unit-norm centroids.
+    Assignment runs in chunks so the score matrix stays small; empty clusters are
+    re-seeded with random rows.
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        sums = np.zeros_like(centroids)
+        counts = np.zeros(n_lists, dtype=np.int64)
+        for start in range(0, len(vectors), chunk_size):
+            chunk = vectors[start:start + chunk_size]
+            assignment = np.argmax(chunk @ centroids.T, axis=1)
+            np.add.at(sums, assignment, chunk)
+            counts += np.bincount(assignment, minlength=n_lists)
+        empty = counts == 0
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        centroids = VectorIndex._normalize(sums)
+    return centroids
+
+
+class IVFIndex:
+    """
+    Approximate nearest-neighbour index (inverted file) with the VectorIndex search
+    API. Spherical k-means splits the unit-norm rows into `n_lists` cells, each stored
+    as one contiguous matrix; a query scores only the `n_probe` cells whose centroids
+    are most similar to it, so a search touches about n_probe / n_lists of the rows.
+    Raise n_probe for recall, lower it for latency (n_probe = n_lists is exact).
+
+    Rows get stable integer ids (their position in `texts`), so deletes leave a
+    tombstone (texts[id] = None) instead of shifting ids. Until POINTS_PER_LIST rows
+    per cell are available the index is untrained and searches exactly.
+    """
+
+    def __init__(self, dimension: int, n_lists: int = 256, n_probe: int = 8, seed: int = 0):
+        self.dimension = dimension
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.seed = seed
+        self.centroids: np.ndarray | None = None  # (cells, dim) once trained
+        self.texts: list[str | None] = []
+        self._cell_of = np.empty(0, dtype=np.int32)  # Cell per id, -1 once deleted
+        self._cell_ids = [np.empty(0, dtype=np.int64)]
+        self._cell_vectors = [np.empty((0, dimension), dtype=np.float32)]
+
+    def __len__(self):
+        return int(np.count_nonzero(self._cell_of >= 0))
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        if not self.trained:
+            return np.zeros(len(vectors), dtype=np.int32)
+        return np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)
+
+    def _append(self, ids: np.ndarray, vectors: np.ndarray, cells: np.ndarray):
+        # One concatenation per touched cell, however many rows the batch holds
+        order = np.argsort(cells, kind='stable')
+        cells, ids, vectors = cells[order], ids[order], vectors[order]
+        boundaries = np.flatnonzero(np.diff(cells)) + 1
+        for cell_ids, cell_vectors in zip(np.split(ids, boundaries), np.split(vectors, boundaries)):
+            cell = self._cell_of[cell_ids[0]]
+            self._cell_ids[cell] = np.concatenate([self._cell_ids[cell], cell_ids])
+            self._cell_vectors[cell] = np.concatenate([self._cell_vectors[cell], cell_vectors])
+
+    def add(self, vectors: np.ndarray, texts: list[str], normalized: bool = False) -> np.ndarray:
+        """Inserts rows and returns their ids; trains the cells once there are enough rows."""
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32)) if normalized else VectorIndex._normalize(vectors)
+        if vectors.shape != (len(texts), self.dimension):
+            raise ValueError(f"Got vectors of shape {vectors.shape} for {len(texts)} texts of dimension {self.dimension}.")
+        ids = np.arange(len(self.texts), len(self.texts) + len(texts), dtype=np.int64)
+        cells = self._assign(vectors)
+        self.texts.extend(texts)
+        self._cell_of = np.concatenate([self._cell_of, cells])
+        self._append(ids, vectors, cells)
+        if not self.trained and len(self) >= POINTS_PER_LIST * self.n_lists:
+            self.train()
+        return ids
+
+    def delete(self, ids) -> int:
+        """Removes rows by id; returns how many were live."""
+        ids = np.unique(np.asarray(ids, dtype=np.int64))
+        ids = ids[(ids >= 0) & (ids < len(self.texts))]
+        ids = ids[self._cell_of[ids] >= 0]
+        for cell in np.unique(self._cell_of[ids]):
+            keep = ~np.isin(self._cell_ids[cell], ids)
+            self._cell_ids[cell] = self._cell_ids[cell][keep]
+            self._cell_vectors[cell] = self._cell_vectors[cell][keep]
+        self._cell_of[ids] = -1
+        for i in ids:
+            self.texts[i] = None
+        return len(ids)
+
+    def train(self, iterations: int = 10):
+        """(Re)computes the cells from the live rows, e.g. after many inserts drifted them."""
+        ids = np.concatenate(self._cell_ids)
+        vectors = np.concatenate(self._cell_vectors)
+        n_lists = min(self.n_lists, max(1, len(ids) // POINTS_PER_LIST))
+        sample = vectors
+        if len(vectors) > 256 * n_lists:
+            sample = vectors[np.random.default_rng(self.seed).choice(len(vectors), 256 * n_lists, replace=False)]
+        self.centroids = train_centroids(sample, n_lists, iterations, self.seed)
+        self._cell_ids = [np.empty(0, dtype=np.int64) for _ in range(n_lists)]
+        self._cell_vectors = [np.empty((0, self.dimension), dtype=np.float32) for _ in range(n_lists)]
+        cells = self._assign(vectors)
+        self._cell_of[ids] = cells
+        self._append(ids, vectors, cells)
+
+    def search(self, query_vectors: np.ndarray, top_k: int = 3,
+               n_probe: int | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns (scores, ids) shaped (n_queries, k), sorted by descending cosine
+        similarity, like VectorIndex.search. Rows a query's probed cells cannot fill
+        are padded with id -1 and score -inf.
+        """
+        queries = VectorIndex._normalize(query_vectors)
+        top_k = min(top_k, len(self))
+        scores = np.full((len(queries), max(top_k, 0)), -np.inf, dtype=np.float32)
+        ids = np.full((len(queries), max(top_k, 0)), -1, dtype=np.int64)
+        if top_k <= 0:
+            return scores, ids
+
+        # --- 1. Coarse Search: the n_probe Closest Cells per Query ---
+        cell_count = len(self._cell_ids)
+        n_probe = min(n_probe or self.n_probe, cell_count)
+        if n_probe < cell_count:
+            probes = np.argpartition(-(queries @ self.centroids.T), n_probe - 1, axis=1)[:, :n_probe]
+        else:
+            probes = np.broadcast_to(np.arange(cell_count), (len(queries), cell_count))
+
+        # --- 2. Fine Search: Score Each Probed Cell Once for All Queries Probing It ---
+        candidate_scores = [[] for _ in queries]
+        candidate_ids = [[] for _ in queries]
+        for cell in np.unique(probes):
+            if not len(self._cell_ids[cell]):
+                continue
+            rows = np.flatnonzero((probes == cell).any(axis=1))
+            cell_scores = queries[rows] @ self._cell_vectors[cell].T
+            for row, row_scores in zip(rows, cell_scores):
+                candidate_scores[row].append(row_scores)
+                candidate_ids[row].append(self._cell_ids[cell])
+
+        # --- 3. Top-k per Query ---
+        for row in range(len(queries)):
+            if not candidate_scores[row]:
+                continue
+            row_scores = np.concatenate(candidate_scores[row])
+            row_ids = np.concatenate(candidate_ids[row])
+            k = min(top_k, len(row_scores))
+            best = np.argpartition(-row_scores, k - 1)[:k] if k < len(row_scores) else np.arange(k)
+            best = best[np.argsort(-row_scores[best])]
+            scores[row, :k] = row_scores[best]
+            ids[row, :k] = row_ids[best]
+        return scores, ids
+
+    def memory_footprint(self) -> dict:
+        """Same keys as VectorIndex.memory_footprint; cells and centroids are private float32."""
+        index_bytes = sum(cell.nbytes for cell in self._cell_vectors) + sum(cell.nbytes for cell in self._cell_ids)
+        if self.trained:
+            index_bytes += self.centroids.nbytes
+        return {"rows": len(self), "index_bytes": index_bytes, "rerank_bytes": 0, "private_bytes": index_bytes}
+
+    def save(self, path):
+        """
+        Writes the index to one .npz file, atomically replacing any previous one. Texts
+        are stored as one UTF-8 JSON array (deleted rows as null) rather than a
+        fixed-width unicode array, which would pad every chunk to the longest one.
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=path.parent, suffix='.npz')
+        with os.fdopen(fd, 'wb') as artifact:
+            np.savez(
+                artifact,
+                params=np.array([self.dimension, self.n_lists, self.n_probe, self.seed]),
+                centroids=self.centroids if self.trained else np.empty((0, self.dimension), dtype=np.float32),
+                texts=np.frombuffer(serialization.dumps(self.texts), dtype=np.uint8),
+                cell_of=self._cell_of,
+                cell_sizes=np.array([len(cell_ids) for cell_ids in self._cell_ids]),
+                ids=np.concatenate(self._cell_ids),
+                vectors=np.concatenate(self._cell_vectors),
+            )
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path, n_probe: int | None = None) -> 'IVFIndex':
+        """
+        Reads an index written by save(). n_probe is a search-time knob, so it comes from
+        the argument or RAG_ANN_PROBES rather than the value saved with the index.
+        """
+        if n_probe is None:
+            n_probe = getattr(settings, 'RAG_ANN_PROBES', 8)
+        with np.load(path) as artifact:
+            dimension, n_lists, _, seed = (int(value) for value in artifact['params'])
+            index = cls(dimension, n_lists, n_probe, seed)
+            index.centroids = artifact['centroids'] if len(artifact['centroids']) else None
+            index._cell_of = artifact['cell_of']
+            texts = artifact['texts']
+            if texts.dtype.kind == 'U':  # Written before texts were stored as JSON
+                texts = [text if cell >= 0 else None for text, cell in zip(texts.tolist(), index._cell_of)]
+            else:
+                texts = json.loads(texts.tobytes())
+            index.texts = texts
+            boundaries = np.cumsum(artifact['cell_sizes'])[:-1]
+            index._cell_ids = np.split(artifact['ids'], boundaries)
+            index._cell_vectors = np.split(artifact['vectors'], boundaries)
+        return index
+
+
+def build_index(vectors: np.ndarray, texts: list[str], normalized: bool = False, path=None):
+    """
+    Returns the search index for a set of chunks: an exact VectorIndex below
+    RAG_ANN_MIN_CHUNKS chunks (a QuantizedVectorIndex when RAG_VECTOR_PRECISION is
+    float16 or int8, with its memory and recall logged), otherwise an IVFIndex. A trained IVFIndex is saved to
+    `path` and re-used from there when it already holds the same number of chunks.
+    """
+    if len(texts) < getattr(settings, 'RAG_ANN_MIN_CHUNKS', 20000):
+        precision = getattr(settings, 'RAG_VECTOR_PRECISION', 'float32')
+        if precision == 'float32':
+            return VectorIndex(vectors, texts, normalized)
+        # Normalized once: the codes, the rerank rows and the recall check all use these rows
+        reference = np.atleast_2d(np.asarray(vectors, dtype=np.float32)) if normalized else VectorIndex._normalize(vectors)
+        index = QuantizedVectorIndex(reference, texts, True, precision, getattr(settings, 'RAG_RERANK_CANDIDATES', 0))
+        top_k = getattr(settings, 'RAG_TOP_K', 3)
+        report = quantization_report(index, reference, top_k)
+        print(f"Vector store quantized to {precision} (rerank {index.rerank}): {report['private_bytes'] / 1e6:.2f} MB "
+              f"private vs {report['float32_bytes'] / 1e6:.2f} MB as float32, recall@{top_k} {report['recall']:.3f}.")
+        return index
+
+    if path is not None and Path(path).exists():
+        try:
+            index = IVFIndex.load(path)
+            if len(index) == len(texts):
+                return index
+        except Exception as e:
+            print(f"Ignoring unreadable ANN index at {path}: {e}")
+
+    # Roughly 4 * sqrt(n) cells keeps both the coarse and the fine search small
+    n_lists = getattr(settings, 'RAG_ANN_LISTS', 0) or int(4 * np.sqrt(len(texts)))
+    index = IVFIndex(np.asarray(vectors).shape[1], n_lists, getattr(settings, 'RAG_ANN_PROBES', 8))
+    index.add(vectors, texts, normalized)
+    if not index.trained:
+        index.train()
+    if path is not None:
+        index.save(path)
+    print(f"ANN index built over {len(index)} chunks ({len(index._cell_ids)} cells, n_probe {index.n_probe}).")
+    return index
@@ -1,49 +1,281 @@
 # chat/rag_core/data_loader.py
 
-import os
+import asyncio
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from google import genai
-from google.genai.errors import APIError
 from django.conf import settings
 
-# --- Initialize Gemini Client for Embedding ---
-try:
-    EMBEDDING_CLIENT = genai.Client(api_key=settings.GEMINI_API_KEY)
-    EMBEDDING_MODEL = 'text-embedding-004'  # A reliable embedding model
-except Exception as e:
-    print(f"Embedding Client Initialization Error: {e}")
-    EMBEDDING_CLIENT = None
+from .. import gemini_client
+from ..gemini_client import get_client
+from .embedding_cache import EmbeddingCache, embedding_key
 
+# Embeddings use the shared Gemini client (created on first use)
+EMBEDDING_MODEL = 'text-embedding-004'  # A reliable embedding model
 
-def get_embedding(text: str) -> np.ndarray | None:
+# Markdown "## " headings start a new knowledge chunk
+SECTION_HEADING_RE = re.compile(r"^## ", re.MULTILINE)
+
+# HTTP status codes worth retrying (rate limiting and transient server errors)
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+def get_embedding(text: str, task_type: str = "RETRIEVAL_DOCUMENT") -> np.ndarray | None:
     """Generates an embedding vector for a given text using the Gemini API."""
-    if not EMBEDDING_CLIENT:
+    if not get_client():
         return None
 
     try:
-        response = EMBEDDING_CLIENT.models.embed_content(
+        response = get_client().models.embed_content(
             model=EMBEDDING_MODEL,
-            content=[text],
-            task_type="RETRIEVAL_DOCUMENT"  # Use appropriate task type
+            contents=[text],
+            config={"task_type": task_type},
         )
         # The result is a list of embeddings; we take the first one
-        return np.array(response['embedding'][0])
-    except APIError as e:
+        return np.array(response.embeddings[0].values, dtype=np.float32)
+    except gemini_client.APIError as e:
+        print(f"Gemini Embedding API Error: {e}")
+        return None
+    except Exception as e:
+        print(f"Unexpected Embedding Error: {e}")
+        return None
+
+
+async def aget_embedding(text: str, task_type: str = "RETRIEVAL_QUERY") -> np.ndarray | None:
+    """Async counterpart of get_embedding using the Gemini async client."""
+    if not get_client():
+        return None
+
+    try:
+        response = await get_client().aio.models.embed_content(
+            model=EMBEDDING_MODEL,
+            contents=[text],
+            config={"task_type": task_type},
+        )
+        return np.array(response.embeddings[0].values, dtype=np.float32)
+    except gemini_client.APIError as e:
+        print(f"Gemini Embedding API Error: {e}")
+        return None
+    except Exception as e:
+        print(f"Unexpected Embedding Error: {e}")
+        return None
+
+
+# --- Query Embedding Memo ---
+# One classify request may embed its message for both RAG retrieval and the semantic
+# cache; the last few query embeddings are kept so the API is called once per message.
+
+QUERY_EMBEDDING_MEMO_SIZE = 256
+_query_embeddings: OrderedDict[str, np.ndarray] = OrderedDict()
+_query_embeddings_lock = threading.Lock()
+
+
+def _memo_get(text: str) -> np.ndarray | None:
+    with _query_embeddings_lock:
+        vector = _query_embeddings.get(text)
+        if vector is not None:
+            _query_embeddings.move_to_end(text)
+        return vector
+
+
+def _memo_set(text: str, vector: np.ndarray | None):
+    if vector is None:
+        return  # Failures are not memoized
+    with _query_embeddings_lock:
+        _query_embeddings[text] = vector
+        _query_embeddings.move_to_end(text)
+        while len(_query_embeddings) > QUERY_EMBEDDING_MEMO_SIZE:
+            _query_embeddings.popitem(last=False)
+
+
+def get_query_embedding(text: str) -> np.ndarray | None:
+    """RETRIEVAL_QUERY embedding of a user message, memoized for recently seen messages."""
+    vector = _memo_get(text)
+    if vector is None:
+        vector = get_embedding(text, task_type="RETRIEVAL_QUERY")
+        _memo_set(text, vector)
+    return vector
+
+
+async def aget_query_embedding(text: str) -> np.ndarray | None:
+    """Async counterpart of get_query_embedding."""
+    vector = _memo_get(text)
+    if vector is None:
+        vector = await aget_embedding(text, task_type="RETRIEVAL_QUERY")
+        _memo_set(text, vector)
+    return vector
+
+
+# --- Batched Embedding Pipeline ---
+
+def make_batches(texts: list[str], max_items: int, max_chars: int) -> list[list[int]]:
+    """
+    Packs text positions into consecutive batches of at most max_items texts and
+    max_chars characters (a single over-long text still gets its own batch).
+    """
+    batches, current, current_chars = [], [], 0
+    for position, text in enumerate(texts):
+        if current and (len(current) >= max_items or current_chars + len(text) > max_chars):
+            batches.append(current)
+            current, current_chars = [], 0
+        current.append(position)
+        current_chars += len(text)
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _is_retryable(error: Exception) -> bool:
+    return isinstance(error, gemini_client.APIError) and getattr(error, 'code', None) in RETRYABLE_STATUS_CODES
+
+
+def _backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter."""
+    base = getattr(settings, 'EMBEDDING_RETRY_BASE_DELAY', 0.5)
+    return random.uniform(0, base * (2 ** attempt))
+
+
+def _embed_batch(batch_texts: list[str], task_type: str) -> np.ndarray:
+    """Embeds one batch in a single API call, retrying retryable errors with backoff."""
+    max_retries = getattr(settings, 'EMBEDDING_MAX_RETRIES', 3)
+    for attempt in range(max_retries + 1):
+        try:
+            response = get_client().models.embed_content(
+                model=EMBEDDING_MODEL,
+                contents=batch_texts,
+                config={"task_type": task_type},
+            )
+            return np.array([embedding.values for embedding in response.embeddings], dtype=np.float32)
+        except Exception as e:
+            if attempt == max_retries or not _is_retryable(e):
+                raise
+            time.sleep(_backoff_delay(attempt))
+
+
+async def _aembed_batch(batch_texts: list[str], task_type: str) -> np.ndarray:
+    """Async counterpart of _embed_batch."""
+    max_retries = getattr(settings, 'EMBEDDING_MAX_RETRIES', 3)
+    for attempt in range(max_retries + 1):
+        try:
+            response = await get_client().aio.models.embed_content(
+                model=EMBEDDING_MODEL,
+                contents=batch_texts,
+                config={"task_type": task_type},
+            )
+            return np.array([embedding.values for embedding in response.embeddings], dtype=np.float32)
+        except Exception as e:
+            if attempt == max_retries or not _is_retryable(e):
+                raise
+            await asyncio.sleep(_backoff_delay(attempt))
+
+
+def get_embeddings_batch(texts, task_type: str = "RETRIEVAL_DOCUMENT") -> np.ndarray | None:
+    """
+    Embeds an iterable of texts with one API call per size-limited batch, running the
+    batches on a bounded thread pool. Returns a (len(texts), dim) float32 matrix in
+    input order, or None if any batch still fails after retries.
+    """
+    texts = list(texts)
+    if not get_client() or not texts:
+        return None
+
+    batches = make_batches(texts, getattr(settings, 'EMBEDDING_BATCH_SIZE', 100),
+                           getattr(settings, 'EMBEDDING_BATCH_MAX_CHARS', 60000))
+    max_workers = min(getattr(settings, 'EMBEDDING_MAX_CONCURRENCY', 4), len(batches))
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(
+                lambda batch: _embed_batch([texts[position] for position in batch], task_type), batches
+            ))
+    except gemini_client.APIError as e:
+        print(f"Gemini Embedding API Error: {e}")
+        return None
+    except Exception as e:
+        print(f"Unexpected Embedding Error: {e}")
+        return None
+
+    # Batches are consecutive runs of positions, so stacking them preserves input order
+    return np.vstack(results)
+
+
+async def aget_embeddings_batch(texts, task_type: str = "RETRIEVAL_DOCUMENT") -> np.ndarray | None:
+    """Async counterpart of get_embeddings_batch, bounded by an asyncio semaphore."""
+    texts = list(texts)
+    if not get_client() or not texts:
+        return None
+
+    batches = make_batches(texts, getattr(settings, 'EMBEDDING_BATCH_SIZE', 100),
+                           getattr(settings, 'EMBEDDING_BATCH_MAX_CHARS', 60000))
+    semaphore = asyncio.Semaphore(getattr(settings, 'EMBEDDING_MAX_CONCURRENCY', 4))
+
+    async def run(batch):
+        async with semaphore:
+            return await _aembed_batch([texts[position] for position in batch], task_type)
+
+    try:
+        results = await asyncio.gather(*(run(batch) for batch in batches))
+    except gemini_client.APIError as e:
         print(f"Gemini Embedding API Error: {e}")
         return None
     except Exception as e:
         print(f"Unexpected Embedding Error: {e}")
         return None
 
+    return np.vstack(results)
+
+
+_embedding_cache = None
+
 
-def load_knowledge_base(knowledge_text: str) -> tuple[np.ndarray | None, str]:
+def get_embedding_cache() -> EmbeddingCache | None:
+    """Returns the on-disk embedding cache for EMBEDDING_MODEL, or None if EMBEDDING_CACHE_DIR is unset."""
+    global _embedding_cache
+    cache_dir = getattr(settings, 'EMBEDDING_CACHE_DIR', None)
+    if not cache_dir:
+        return None
+    if _embedding_cache is None:
+        _embedding_cache = EmbeddingCache(cache_dir, EMBEDDING_MODEL)
+    return _embedding_cache
+
+
+def embed_texts(texts: list[str], task_type: str = "RETRIEVAL_DOCUMENT") -> np.ndarray | None:
     """
-    Loads the primary knowledge text, generates its embedding, and prepares
-    it for the vector store.
+    Returns a (len(texts), dim) float32 matrix of L2-normalized embeddings in input order.
+    With the on-disk cache enabled only texts that are new or changed are sent to the
+    API, and the result is read from the shared memory map.
     """
-    print("Generating embedding for the primary knowledge base...")
-    vector = get_embedding(knowledge_text)
+    cache = get_embedding_cache()
+    if cache is None:
+        matrix = get_embeddings_batch(texts, task_type)
+        if matrix is None:
+            return None
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    keys = [embedding_key(text, EMBEDDING_MODEL, task_type) for text in texts]
+    cached, missing = cache.lookup(keys)
+    if not missing:
+        return cached
+
+    print(f"Embedding {len(missing)} of {len(texts)} texts not found in the embedding cache...")
+    vectors = get_embeddings_batch([texts[position] for position in missing], task_type)
+    if vectors is None:
+        return None
+    cache.store([keys[position] for position in missing], vectors)
+
+    cached, missing = cache.lookup(keys)
+    return cached
+
+
+def chunk_knowledge_base(knowledge_text: str) -> list[str]:
+    """Splits the knowledge text into section-level chunks at each '## ' heading."""
+    starts = [match.start() for match in SECTION_HEADING_RE.finditer(knowledge_text)]
+    bounds = [0] + starts + [len(knowledge_text)]
+    chunks = [knowledge_text[start:end].strip() for start, end in zip(bounds, bounds[1:])]
+    return [chunk for chunk in chunks if chunk]
 
-    # In a real RAG system, you would load documents from files (PDFs, docs).
-    # Here, we treat the entire LLM_RAG_CONTEXT as one document.
-    return vector, knowledge_text
@@ -0,0 +1,115 @@
+# chat/rag_core/embedding_cache.py
+
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import fcntl  # POSIX only; used to serialize writers across worker processes
+except ImportError:
+    fcntl = None
+
+
+def embedding_key(text: str, model: str, task_type: str) -> str:
+    """Content address of an embedding: hash of the model, task type and text."""
+    return hashlib.sha256(f"{model}\x00{task_type}\x00{text}".encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed, append-only on-disk embedding cache for one embedding model.
+
+    Rows live in a single float32 `vectors.npy` (L2-normalized, one row per key) with
+    `keys.json` giving the row order. The matrix is opened with np.load(mmap_mode='r'),
+    so every worker maps the same pages read-only instead of holding a private copy.
+    New rows are appended by atomically replacing both files (vectors first, then keys),
+    so readers never see keys that point past the end of the matrix.
+    """
+
+    def __init__(self, directory, model: str):
+        self.directory = Path(directory) / model.replace('/', '_')
+        self.model = model
+        self._vectors_path = self.directory / 'vectors.npy'
+        self._keys_path = self.directory / 'keys.json'
+        self._lock = threading.Lock()
+        self._loaded_stamp = None
+        self._rows: dict[str, int] = {}
+        self._matrix: np.ndarray | None = None
+
+    def _refresh(self):
+        """(Re)maps the files if another process has appended since the last load."""
+        try:
+            stat = self._keys_path.stat()
+        except FileNotFoundError:
+            return
+        stamp = (stat.st_ino, stat.st_mtime_ns)
+        if stamp == self._loaded_stamp:
+            return
+        keys = json.loads(self._keys_path.read_text())
+        matrix = np.load(self._vectors_path, mmap_mode='r')
+        if matrix.shape[0] < len(keys):
+            return  # Torn read between the two replaces; keep the previous mapping
+        self._rows = {key: row for row, key in enumerate(keys)}
+        self._matrix = matrix
+        self._loaded_stamp = stamp
+
+    @contextmanager
+    def _write_lock(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.directory / '.lock', 'w') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def lookup(self, keys: list[str]) -> tuple[np.ndarray | None, list[int]]:
+        """
+        Returns (vectors, missing) where missing lists the positions of keys not yet
+        cached. When nothing is missing, vectors holds the rows in key order; if those
+        rows are stored contiguously it is a zero-copy view of the memory map.
+        """
+        with self._lock:
+            self._refresh()
+            rows = [self._rows.get(key) for key in keys]
+            missing = [position for position, row in enumerate(rows) if row is None]
+            if missing or not keys:
+                return None, missing
+
+            first = rows[0]
+            if rows == list(range(first, first + len(rows))):
+                return self._matrix[first:first + len(rows)], []
+            return np.asarray(self._matrix[rows]), []
+
+    def store(self, keys: list[str], vectors: np.ndarray):
+        """Appends embeddings (normalized on write) for keys that are not cached yet."""
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vectors = vectors / norms
+
+        with self._lock, self._write_lock():
+            self._refresh()
+            new = [(key, vector) for key, vector in zip(keys, vectors) if key not in self._rows]
+            if not new:
+                return
+
+            all_keys = list(self._rows) + [key for key, _ in new]
+            new_rows = np.vstack([vector for _, vector in new])
+            matrix = new_rows if self._matrix is None else np.vstack([self._matrix, new_rows])
+
+            tmp_vectors = self.directory / f'vectors.{os.getpid()}.tmp.npy'
+            tmp_keys = self.directory / f'keys.{os.getpid()}.tmp.json'
+            np.save(tmp_vectors, matrix)
+            tmp_keys.write_text(json.dumps(all_keys))
+            os.replace(tmp_vectors, self._vectors_path)
+            os.replace(tmp_keys, self._keys_path)
+            self._loaded_stamp = None
+            self._refresh()
@@ -1,25 +1,215 @@
 # chat/rag_core/vector_store.py
 
+import mmap
+
 import numpy as np
-from typing import List, Tuple
 
-# In-memory storage for the RAG system: [vector, text_chunk]
-# For this classification project, we only store one main knowledge chunk.
-KNOWLEDGE_STORE: List[Tuple[np.ndarray, str]] = []
+# Storage precisions of QuantizedVectorIndex (VectorIndex itself is float32)
+PRECISIONS = ('float16', 'int8')
+
+# Rows whose codes are widened to float32 at a time while scoring a quantized index (the
+# float32 block stays cache-sized, which is most of int8's speed)
+SCORE_BLOCK_ROWS = 1024
+
+
+def quantize(vectors: np.ndarray, precision: str) -> tuple[np.ndarray, np.ndarray | None]:
+    """
+    Compact codes of unit-norm float32 rows, as (codes, scales). float16 halves the
+    rows (scales is None); int8 stores each row as round(x / scale) with its own
+    scale = max|x| / 127, a quarter of the float32 size plus 4 bytes per row.
+    """
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    if precision == 'float16':
+        return vectors.astype(np.float16), None
+    if precision != 'int8':
+        raise ValueError(f"Unknown vector precision {precision!r}; expected one of {PRECISIONS}.")
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1.0
+    codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def is_memory_mapped(array) -> bool:
+    """True when an array's memory is a file mapping (shared between workers), not a private copy."""
+    while array is not None:
+        if isinstance(array, (np.memmap, mmap.mmap)):
+            return True
+        array = getattr(array, 'base', None)
+    return False
+
+
+def recall_at_k(approximate: np.ndarray, exact: np.ndarray) -> float:
+    """Fraction of the exact top-k ids the approximate search also returned."""
+    return float(np.mean([len(set(a) & set(e)) / len(e) for a, e in zip(approximate, exact)]))
+
+
+class VectorIndex:
+    """
+    In-memory vector index over text chunks. Vectors are stored L2-normalized in one
+    contiguous float32 matrix (one row per chunk), so cosine similarity against any
+    number of queries is a single matrix multiplication.
+    """
+
+    def __init__(self, vectors: np.ndarray | None = None, texts: list[str] | None = None,
+                 normalized: bool = False):
+        self.matrix = np.empty((0, 0), dtype=np.float32)
+        self.texts: list[str] = []
+        if vectors is not None and texts:
+            self.add(vectors, texts, normalized)
+
+    def __len__(self):
+        return len(self.texts)
+
+    @property
+    def dimension(self) -> int:
+        return self.matrix.shape[1]
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0  # Zero vectors stay zero and score 0 against everything
+        return vectors / norms
 
+    def add(self, vectors: np.ndarray, texts: list[str], normalized: bool = False):
+        """
+        Appends chunks; vectors is a (len(texts), dim) array. Pass normalized=True for
+        float32 unit-norm rows (e.g. the embedding cache's memory map) to adopt them
+        without a copy.
+        """
+        normalized = np.atleast_2d(np.asarray(vectors, dtype=np.float32)) if normalized else self._normalize(vectors)
+        if normalized.shape[0] != len(texts):
+            raise ValueError(f"Got {normalized.shape[0]} vectors for {len(texts)} texts.")
+        if len(self):
+            normalized = np.vstack([self.matrix, normalized])
+        self.matrix = np.ascontiguousarray(normalized)
+        self.texts.extend(texts)
 
-def initialize_vector_store(knowledge_vector: np.ndarray, knowledge_text: str):
+    def replace(self, position: int, vector: np.ndarray, text: str):
+        """Overwrites one row in place, e.g. when a fixed-capacity index evicts an entry."""
+        self.matrix[position] = self._normalize(vector)[0]
+        self.texts[position] = text
+
+    def search(self, query_vectors: np.ndarray, top_k: int = 3) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns (scores, indices), each shaped (n_queries, k) and sorted by descending
+        cosine similarity. Accepts a single query vector or a (n_queries, dim) batch.
+        """
+        queries = self._normalize(query_vectors)
+        top_k = min(top_k, len(self))
+        if top_k <= 0:
+            empty = np.empty((queries.shape[0], 0))
+            return empty.astype(np.float32), empty.astype(np.intp)
+
+        scores = self._scores(queries)
+        if top_k < scores.shape[1]:
+            candidates = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+        else:
+            candidates = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+        candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+        order = np.argsort(-candidate_scores, axis=1)
+        return np.take_along_axis(candidate_scores, order, axis=1), np.take_along_axis(candidates, order, axis=1)
+
+    def _scores(self, queries: np.ndarray) -> np.ndarray:
+        return queries @ self.matrix.T
+
+    def memory_footprint(self) -> dict:
+        """
+        Bytes held by the index: `index_bytes` scored per query, `rerank_bytes` of
+        full-precision rows kept for reranking, and `private_bytes`, the part not
+        backed by a shared memory map (what each worker's RSS pays).
+        """
+        index_bytes = self.matrix.nbytes
+        return {"rows": len(self), "index_bytes": index_bytes, "rerank_bytes": 0,
+                "private_bytes": 0 if is_memory_mapped(self.matrix) else index_bytes}
+
+
+class QuantizedVectorIndex(VectorIndex):
+    """
+    VectorIndex storing its rows as float16 or per-row-scaled int8 codes (see
+    quantize), scored directly on the compact codes. With rerank=N the N best
+    candidates are re-scored against the full-precision rows, which are kept as
+    passed in: rows adopted from the embedding cache stay a shared memory map.
+    """
+
+    def __init__(self, vectors: np.ndarray | None = None, texts: list[str] | None = None,
+                 normalized: bool = False, precision: str = 'int8', rerank: int = 0):
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown vector precision {precision!r}; expected one of {PRECISIONS}.")
+        self.precision = precision
+        self.rerank = rerank
+        self.scales: np.ndarray | None = None  # Per-row int8 scales
+        self.full: np.ndarray | None = None  # Full-precision rows, when reranking
+        super().__init__(vectors, texts, normalized)
+
+    def add(self, vectors: np.ndarray, texts: list[str], normalized: bool = False):
+        full = np.atleast_2d(np.asarray(vectors, dtype=np.float32)) if normalized else self._normalize(vectors)
+        if full.shape[0] != len(texts):
+            raise ValueError(f"Got {full.shape[0]} vectors for {len(texts)} texts.")
+        codes, scales = quantize(full, self.precision)
+        if len(self):
+            codes = np.vstack([self.matrix, codes])
+            scales = None if scales is None else np.concatenate([self.scales, scales])
+            full = np.vstack([self.full, full]) if self.rerank else full
+        self.matrix, self.scales = np.ascontiguousarray(codes), scales
+        self.full = full if self.rerank else None
+        self.texts.extend(texts)
+
+    def replace(self, position: int, vector: np.ndarray, text: str):
+        row = self._normalize(vector)
+        codes, scales = quantize(row, self.precision)
+        self.matrix[position] = codes[0]
+        if scales is not None:
+            self.scales[position] = scales[0]
+        if self.full is not None:
+            if not self.full.flags.writeable:
+                self.full = np.array(self.full)  # Leave a read-only memory map for a private copy
+            self.full[position] = row[0]
+        self.texts[position] = text
+
+    def _scores(self, queries: np.ndarray) -> np.ndarray:
+        # Codes are widened to float32 one block at a time, never the whole matrix
+        scores = np.empty((queries.shape[0], len(self)), dtype=np.float32)
+        for start in range(0, len(self), SCORE_BLOCK_ROWS):
+            block = self.matrix[start:start + SCORE_BLOCK_ROWS].astype(np.float32)
+            scores[:, start:start + len(block)] = queries @ block.T
+        if self.scales is not None:
+            scores *= self.scales
+        return scores
+
+    def search(self, query_vectors: np.ndarray, top_k: int = 3) -> tuple[np.ndarray, np.ndarray]:
+        if self.full is None:
+            return super().search(query_vectors, top_k)
+
+        queries = self._normalize(query_vectors)
+        _, candidates = super().search(queries, max(self.rerank, top_k))
+        exact = np.einsum('qd,qkd->qk', queries, self.full[candidates])
+        order = np.argsort(-exact, axis=1)[:, :min(top_k, candidates.shape[1])]
+        return np.take_along_axis(exact, order, axis=1), np.take_along_axis(candidates, order, axis=1)
+
+    def memory_footprint(self) -> dict:
+        index_bytes = self.matrix.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+        rerank_bytes = self.full.nbytes if self.full is not None else 0
+        shared = rerank_bytes if is_memory_mapped(self.full) else 0
+        return {"rows": len(self), "index_bytes": index_bytes, "rerank_bytes": rerank_bytes,
+                "private_bytes": index_bytes + rerank_bytes - shared}
+
+
+def quantization_report(index, vectors: np.ndarray, top_k: int = 3, sample: int = 100, seed: int = 0) -> dict:
     """
-    Initializes the in-memory vector store with the primary knowledge base
-    embedding and text.
+    Memory and recall of a (quantized) index against exact float32 search over the
+    same unit-norm `vectors`, with perturbed copies of `sample` rows as queries.
     """
-    if knowledge_vector is not None and knowledge_text:
-        # Clear existing data and add the new knowledge chunk
-        global KNOWLEDGE_STORE
-        KNOWLEDGE_STORE = [(knowledge_vector, knowledge_text)]
-        print(f"Vector store initialized with 1 knowledge chunk (Dimension: {knowledge_vector.shape[0]})")
-    else:
-        print("Vector store initialization failed due to missing vector or text.")
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.integers(len(vectors), size=min(sample, len(vectors)))]
+    queries = VectorIndex._normalize(queries + 0.3 * rng.standard_normal(queries.shape).astype(np.float32))
+    exact = VectorIndex(vectors, [""] * len(vectors), normalized=True)
+    footprint = index.memory_footprint()
+    return {
+        **footprint,
+        "float32_bytes": exact.matrix.nbytes,
+        "recall": recall_at_k(index.search(queries, top_k)[1], exact.search(queries, top_k)[1]),
+    }
 
 
 def cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
@@ -30,25 +220,20 @@ def cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
     return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
 
 
-def retrieve_context(query_vector: np.ndarray, top_k: int = 1) -> str:
+def retrieve_contexts(query_vectors: np.ndarray, top_k: int = 3, *, index) -> list[str]:
     """
-    Retrieves the most relevant context from the vector store based on the query.
-    For classification, we expect the entire knowledge base to be relevant.
+    Batched retrieval: returns one context string per query row, made of that query's
+    top_k chunks in their original document order. Searches `index` (a VectorIndex,
+    QuantizedVectorIndex or IVFIndex, e.g. a knowledge base snapshot's).
     """
-    if not KNOWLEDGE_STORE:
-        return ""  # No context available
-
-    similarities = []
-    for vector, text in KNOWLEDGE_STORE:
-        similarity = cosine_similarity(query_vector, vector)
-        similarities.append((similarity, text))
+    if not len(index):
+        return [""] * np.atleast_2d(query_vectors).shape[0]  # No context available
 
-    # Since we only have one chunk, we always return it, regardless of similarity
-    # In a real RAG, this would sort and concatenate top_k results.
+    _, indices = index.search(query_vectors, top_k)
+    # An approximate index pads rows it could not fill with -1
+    return ["\n\n".join(index.texts[i] for i in sorted(row) if i >= 0) for row in indices]
 
-    # Sort and take the top_k relevant texts
-    # relevant_chunks = sorted(similarities, key=lambda x: x[0], reverse=True)[:top_k]
-    # return "\n---\n".join([text for _, text in relevant_chunks])
 
-    # For this project: just return the main knowledge base text
-    return KNOWLEDGE_STORE[0][1]
+def retrieve_context(query_vector: np.ndarray, top_k: int = 3, *, index) -> str:
+    """Retrieves the top_k most relevant knowledge chunks for a single query vector."""
+    return retrieve_contexts(query_vector, top_k, index=index)[0]
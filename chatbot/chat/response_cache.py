@@ -0,0 +1,159 @@
+# chat/response_cache.py
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .fast_path import normalize_message
+from .knowledge_base import get_knowledge_base
+from .llm_schemas import ClassificationOutput
+
+# --- 1. Storage Backends ---
+
+class LocalLRUBackend:
+    """In-process cache bounded by entry count (LRU eviction) and a per-entry TTL."""
+
+    def __init__(self, max_entries: int = 1024, ttl: int = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, ClassificationOutput]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> ClassificationOutput | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, output = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return output
+
+    def set(self, key: str, output: ClassificationOutput):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, output)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    async def aget(self, key: str) -> ClassificationOutput | None:
+        return self.get(key)
+
+    async def aset(self, key: str, output: ClassificationOutput):
+        self.set(key, output)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DjangoCacheBackend:
+    """
+    Stores outputs as JSON in a Django cache alias so all workers share them. Size
+    bounds and eviction are those of the configured Django cache (e.g. MAX_ENTRIES).
+    """
+
+    def __init__(self, alias: str = 'default', ttl: int = 3600):
+        self.alias = alias
+        self.ttl = ttl
+
+    @property
+    def _cache(self):
+        return caches[self.alias]
+
+    def get(self, key: str) -> ClassificationOutput | None:
+        raw = self._cache.get(key)
+        return ClassificationOutput.model_validate_json(raw) if raw else None
+
+    def set(self, key: str, output: ClassificationOutput):
+        self._cache.set(key, output.model_dump_json(), self.ttl)
+
+    async def aget(self, key: str) -> ClassificationOutput | None:
+        raw = await self._cache.aget(key)
+        return ClassificationOutput.model_validate_json(raw) if raw else None
+
+    async def aset(self, key: str, output: ClassificationOutput):
+        await self._cache.aset(key, output.model_dump_json(), self.ttl)
+
+    def clear(self):
+        self._cache.clear()
+
+
+# --- 2. Classification Response Cache ---
+
+class ClassificationCache:
+    """
+    Exact-match cache of validated ClassificationOutput objects. The key covers the
+    normalized user message, the last `history_turns` lines of history, the knowledge
+    base version and the Gemini model, so a rules or model change never serves stale output.
+    """
+
+    def __init__(self, backend, history_turns: int = 2):
+        self.backend = backend
+        self.history_turns = history_turns
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def make_key(self, user_message: str, history_context: str) -> str:
+        history_window = history_context.splitlines()[-self.history_turns:] if self.history_turns else []
+        fingerprint = hashlib.sha256()
+        for part in (normalize_message(user_message), "\n".join(history_window),
+                     get_knowledge_base().version, settings.GEMINI_MODEL):
+            fingerprint.update(part.encode('utf-8'))
+            fingerprint.update(b"\x00")
+        return f"classify:{fingerprint.hexdigest()}"
+
+    def _record(self, output):
+        with self._lock:
+            if output is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return output
+
+    def get(self, user_message: str, history_context: str) -> ClassificationOutput | None:
+        return self._record(self.backend.get(self.make_key(user_message, history_context)))
+
+    def set(self, user_message: str, history_context: str, output: ClassificationOutput):
+        self.backend.set(self.make_key(user_message, history_context), output)
+
+    async def aget(self, user_message: str, history_context: str) -> ClassificationOutput | None:
+        return self._record(await self.backend.aget(self.make_key(user_message, history_context)))
+
+    async def aset(self, user_message: str, history_context: str, output: ClassificationOutput):
+        await self.backend.aset(self.make_key(user_message, history_context), output)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {"hits": hits, "misses": misses, "hit_rate": hits / total if total else 0.0}
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ClassificationCache | None:
+    """Returns the process-wide cache configured by RESPONSE_CACHE_BACKEND, or None if disabled."""
+    global _response_cache
+    backend_name = getattr(settings, 'RESPONSE_CACHE_BACKEND', 'local')
+    if backend_name == 'none':
+        return None
+
+    with _response_cache_lock:
+        if _response_cache is None:
+            ttl = getattr(settings, 'RESPONSE_CACHE_TTL', 3600)
+            if backend_name == 'django':
+                backend = DjangoCacheBackend(getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default'), ttl)
+            else:
+                backend = LocalLRUBackend(getattr(settings, 'RESPONSE_CACHE_MAX_ENTRIES', 1024), ttl)
+            _response_cache = ClassificationCache(backend, getattr(settings, 'RESPONSE_CACHE_HISTORY_TURNS', 2))
+        return _response_cache
@@ -0,0 +1,165 @@
+# chat/semantic_cache.py
+
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from . import metrics
+from .fast_path import normalize_message
+from .knowledge_base import GENERIC_ACK_PHRASES, get_knowledge_base
+from .llm_schemas import ClassificationOutput, Status
+from .rag_core.data_loader import aget_query_embedding, get_query_embedding
+from .rag_core.vector_store import VectorIndex
+
+
+def is_standalone(user_message: str, min_words: int) -> bool:
+    """Short replies ("yes", "ok thanks") mean different things in different conversations."""
+    normalized = normalize_message(user_message)
+    return len(normalized.split()) >= min_words and normalized not in GENERIC_ACK_PHRASES
+
+
+class SemanticCache:
+    """
+    Reuses a validated ClassificationOutput for paraphrases of an earlier message
+    ("when is my blood test" / "what time's my lab draw"). Past query embeddings live
+    in a fixed-capacity VectorIndex; a lookup is one matrix-vector product and hits at
+    cosine similarity >= threshold. Only context-independent answers are stored:
+    standalone messages classified without any conversation history, never
+    no_response. When full, the least recently used entry is overwritten. Entries
+    expire after `ttl` seconds, and the cache clears itself when the knowledge base
+    version or Gemini model changes.
+    """
+
+    def __init__(self, max_entries: int = 2048, threshold: float = 0.92, ttl: int = 3600, min_words: int = 3):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl = ttl
+        self.min_words = min_words
+        self.index: VectorIndex | None = None  # Allocated on first store, once the dimension is known
+        self._outputs: list[ClassificationOutput | None] = [None] * max_entries
+        self._stored_at = np.zeros(max_entries)
+        self._used_at = np.zeros(max_entries)
+        self._generation = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_llm_seconds = 0.0
+
+    def _current_generation(self) -> tuple:
+        return get_knowledge_base().version, settings.GEMINI_MODEL
+
+    def _check_generation(self):
+        generation = self._current_generation()
+        if generation != self._generation:
+            self.clear()
+            self._generation = generation
+
+    def clear(self):
+        self.index = None
+        self._outputs = [None] * self.max_entries
+        self._stored_at[:] = 0
+        self._used_at[:] = 0
+
+    def lookup(self, query_vector: np.ndarray) -> ClassificationOutput | None:
+        now = time.monotonic()
+        with self._lock:
+            self._check_generation()
+            output = None
+            if self.index is not None:
+                scores, positions = self.index.search(query_vector, top_k=1)
+                position = int(positions[0, 0])
+                if (scores[0, 0] >= self.threshold and self._outputs[position] is not None
+                        and now - self._stored_at[position] < self.ttl):
+                    output = self._outputs[position]
+                    self._used_at[position] = now
+
+            if output is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                # Each hit saves one Gemini call of the currently observed average latency
+                self.saved_llm_seconds += metrics.STAGE_SECONDS.average(stage='gemini')
+            return output
+
+    def store(self, query_vector: np.ndarray, user_message: str, output: ClassificationOutput):
+        now = time.monotonic()
+        with self._lock:
+            self._check_generation()
+            if self.index is None:
+                dimension = np.asarray(query_vector).shape[-1]
+                self.index = VectorIndex(np.zeros((self.max_entries, dimension), dtype=np.float32),
+                                         [""] * self.max_entries, normalized=True)
+            # Evict a free slot first, then an expired entry, then the least recently used one
+            free = self._stored_at == 0
+            expired = now - self._stored_at >= self.ttl
+            position = int(np.argmin(np.where(free, -2.0, np.where(expired, -1.0, self._used_at))))
+            self.index.replace(position, query_vector, user_message)
+            self._outputs[position] = output
+            self._stored_at[position] = now
+            self._used_at[position] = now
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            hits, misses = self.hits, self.misses
+            entries = sum(output is not None for output in self._outputs)
+        total = hits + misses
+        return {"hits": hits, "misses": misses, "hit_rate": hits / total if total else 0.0,
+                "entries": entries, "saved_llm_seconds": self.saved_llm_seconds}
+
+    # --- Classify-path helpers (embedding included) ---
+
+    def _cacheable(self, user_message: str, history_context: str) -> bool:
+        """
+        Only standalone first messages: entries are stored without context, so reusing
+        one mid-conversation ("can I reschedule it") would ignore what "it" refers to.
+        """
+        return not history_context and is_standalone(user_message, self.min_words)
+
+    def get(self, user_message: str, history_context: str) -> ClassificationOutput | None:
+        if not self._cacheable(user_message, history_context):
+            return None
+        query_vector = get_query_embedding(user_message)
+        return self.lookup(query_vector) if query_vector is not None else None
+
+    async def aget(self, user_message: str, history_context: str) -> ClassificationOutput | None:
+        if not self._cacheable(user_message, history_context):
+            return None
+        query_vector = await aget_query_embedding(user_message)
+        return self.lookup(query_vector) if query_vector is not None else None
+
+    def _should_store(self, user_message: str, history_context: str, output: ClassificationOutput) -> bool:
+        return output.status != Status.NO_RESPONSE and self._cacheable(user_message, history_context)
+
+    def set(self, user_message: str, history_context: str, output: ClassificationOutput):
+        if self._should_store(user_message, history_context, output):
+            query_vector = get_query_embedding(user_message)  # Memoized from the lookup
+            if query_vector is not None:
+                self.store(query_vector, user_message, output)
+
+    async def aset(self, user_message: str, history_context: str, output: ClassificationOutput):
+        if self._should_store(user_message, history_context, output):
+            query_vector = await aget_query_embedding(user_message)
+            if query_vector is not None:
+                self.store(query_vector, user_message, output)
+
+
+_semantic_cache = None
+_semantic_cache_lock = threading.Lock()
+
+
+def get_semantic_cache() -> SemanticCache | None:
+    """Returns the process-wide semantic cache, or None when SEMANTIC_CACHE_ENABLED is off."""
+    global _semantic_cache
+    if not getattr(settings, 'SEMANTIC_CACHE_ENABLED', False):
+        return None
+    with _semantic_cache_lock:
+        if _semantic_cache is None:
+            _semantic_cache = SemanticCache(
+                max_entries=getattr(settings, 'SEMANTIC_CACHE_MAX_ENTRIES', 2048),
+                threshold=getattr(settings, 'SEMANTIC_CACHE_THRESHOLD', 0.92),
+                ttl=getattr(settings, 'SEMANTIC_CACHE_TTL', 3600),
+                min_words=getattr(settings, 'SEMANTIC_CACHE_MIN_WORDS', 3),
+            )
+        return _semantic_cache
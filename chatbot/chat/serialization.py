@@ -0,0 +1,45 @@
+# chat/serialization.py
+
+import json
+
+from django.http import HttpResponse
+
+from .llm_schemas import ClassificationOutput, PYTHON_ESCALATION_MESSAGES
+
+try:
+    import orjson  # Optional faster encoder for generic payloads (batch results)
+except ImportError:
+    orjson = None
+
+JSON_CONTENT_TYPE = 'application/json'
+
+# pydantic-core's serializer writes a ClassificationOutput straight to JSON bytes,
+# without the intermediate dict that model_dump() + json.dumps() would build
+_OUTPUT_SERIALIZER = ClassificationOutput.__pydantic_serializer__
+
+# The escalation replies never change, so their bodies are encoded once at import
+ESCALATION_PAYLOADS = {name: json.dumps(message).encode('utf-8') for name, message in PYTHON_ESCALATION_MESSAGES.items()}
+
+
+def output_to_json(output: ClassificationOutput) -> bytes:
+    return _OUTPUT_SERIALIZER.to_json(output)
+
+
+def dumps(data) -> bytes:
+    """JSON-encodes plain data to bytes, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+
+def json_response(body: bytes, status: int = 200) -> HttpResponse:
+    """HttpResponse around an already-encoded JSON body (JsonResponse would encode again)."""
+    return HttpResponse(body, status=status, content_type=JSON_CONTENT_TYPE)
+
+
+def classification_output_response(output: ClassificationOutput, status: int = 200) -> HttpResponse:
+    return json_response(output_to_json(output), status)
+
+
+def escalation_response(name: str, status: int) -> HttpResponse:
+    return json_response(ESCALATION_PAYLOADS[name], status)
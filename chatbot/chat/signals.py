@@ -0,0 +1,27 @@
+# chat/signals.py
+
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from . import history_cache
+from .message_logger import refresh_snapshots
+from .models import Message
+
+
+@receiver(post_save, sender=Message)
+def refresh_history_cache(sender, instance, created, **kwargs):
+    """Rebuilds the session's history cache entry once the Message write has committed."""
+    if created and history_cache.is_enabled():
+        conversation = instance.conversation
+        transaction.on_commit(lambda: history_cache.refresh(conversation))
+
+
+@receiver(post_save, sender=Message)
+def update_recent_turns(sender, instance, created, **kwargs):
+    """Keeps Conversation.recent_turns (the denormalized history) in step with every Message write."""
+    if created:
+        # Joins the caller's transaction (message_logger.save_message) so the snapshot
+        # is rebuilt right after the INSERT and committed with it
+        with transaction.atomic(savepoint=False):
+            refresh_snapshots([instance.conversation_id])
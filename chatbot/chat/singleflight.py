@@ -0,0 +1,84 @@
+# chat/singleflight.py
+
+import asyncio
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key across threads: the first caller
+    runs the function, callers arriving while it is in flight wait for and share its
+    result (or exception). Nothing is cached once the call completes.
+    """
+
+    def __init__(self):
+        self._calls: dict = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """Returns (result, shared); shared is True when another caller's in-flight call was reused."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+
+class AsyncSingleFlight:
+    """
+    Event-loop counterpart of SingleFlight for coroutine functions. Followers await
+    the leader's future; calls on a different event loop than the in-flight one are
+    not coalesced (a future cannot be awaited across loops).
+    """
+
+    def __init__(self):
+        self._futures: dict = {}
+
+    async def do(self, key, coroutine_fn):
+        loop = asyncio.get_running_loop()
+        future = self._futures.get(key)
+        if future is not None and future.get_loop() is loop:
+            # shield() so a cancelled follower does not cancel the leader's shared call
+            return await asyncio.shield(future), True
+
+        future = loop.create_future()
+        self._futures[key] = future
+        try:
+            result = await coroutine_fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # Mark retrieved so an unshared failure is not reported as unhandled
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            if self._futures.get(key) is future:
+                del self._futures[key]
+        return result, False
@@ -0,0 +1,109 @@
+# chat/streaming.py
+
+import json
+
+# Fields surfaced to the client as soon as their values are complete
+EARLY_FIELDS = ('topic', 'status')
+# Field whose string content is streamed to the client as it is generated
+STREAMED_FIELD = 'response_message'
+
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+class ClassificationStreamParser:
+    """
+    Incremental parser for the flat ClassificationOutput JSON object produced by the
+    streaming Gemini call. feed() accepts arbitrary text fragments and returns events:
+    ('field', name, value) once an early field's string value is complete, and
+    ('delta', text) for each newly decoded piece of response_message. The complete raw
+    text is kept in .text for the final validation.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._state = 'start'   # start | key | key_string | after_key | value | string | scalar | next | done
+        self._key = ""
+        self._current_key = None
+        self._value = ""
+        self._escape = None     # None, '' (just saw a backslash) or partial \\u hex digits
+
+    def _decode(self, char):
+        """Decodes one character inside a JSON string; returns the decoded text (possibly empty)."""
+        if self._escape is None:
+            if char == '\\':
+                self._escape = ''
+                return ''
+            return char
+        if self._escape == '' and char != 'u':
+            self._escape = None
+            return _ESCAPES.get(char, char)
+        self._escape += char
+        if len(self._escape) == 5:  # 'u' + four hex digits
+            decoded = chr(int(self._escape[1:], 16))
+            self._escape = None
+            return decoded
+        return ''
+
+    def feed(self, fragment: str) -> list[tuple]:
+        self.text += fragment
+        events = []
+        delta = ""
+
+        for char in fragment:
+            state = self._state
+            if state == 'start':
+                if char == '{':
+                    self._state = 'key'
+            elif state == 'key':
+                if char == '"':
+                    self._state = 'key_string'
+                    self._key = ""
+                elif char == '}':
+                    self._state = 'done'
+            elif state == 'key_string':
+                if char == '"' and self._escape is None:
+                    self._current_key = self._key
+                    self._state = 'after_key'
+                else:
+                    self._key += self._decode(char)
+            elif state == 'after_key':
+                if char == ':':
+                    self._state = 'value'
+            elif state == 'value':
+                if char == '"':
+                    self._state = 'string'
+                    self._value = ""
+                elif not char.isspace():
+                    self._state = 'scalar'
+            elif state == 'string':
+                if char == '"' and self._escape is None:
+                    if self._current_key in EARLY_FIELDS:
+                        if delta:
+                            events.append(('delta', delta))
+                            delta = ""
+                        events.append(('field', self._current_key, self._value))
+                    self._state = 'next'
+                else:
+                    decoded = self._decode(char)
+                    self._value += decoded
+                    if self._current_key == STREAMED_FIELD:
+                        delta += decoded
+            elif state == 'scalar':
+                if char == ',':
+                    self._state = 'key'
+                elif char == '}':
+                    self._state = 'done'
+            elif state == 'next':
+                if char == ',':
+                    self._state = 'key'
+                elif char == '}':
+                    self._state = 'done'
+
+        if delta:
+            events.append(('delta', delta))
+        return events
+
+
+def sse_event(event: str, data) -> str:
+    """Formats one Server-Sent Event with a JSON-encoded data payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
@@ -1,3 +1,1015 @@
-from django.test import TestCase
+import asyncio
+import json
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from collections import Counter
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from . import archive, batch, history_cache, metrics, warmup
+from .fast_path import AhoCorasickMatcher, classify
+from .benchmarks.driver import DBTimer, expand_corpus, load_corpus, summarize
+from .benchmarks.fake_gemini import FakeGeminiClient, LatencyModel
+from .knowledge_base import KnowledgeBaseStore, get_knowledge_base
+from .llm_schemas import ClassificationOutput, PYTHON_ESCALATION_MESSAGES, TopicCategory, Status
+from . import local_classifier
+from .llm_resilience import (
+    AdaptiveLimiter, CircuitBreaker, CircuitOpenError, ConcurrencyLimitExceeded, DeadlineExceeded, LLMUnavailable,
+    ResilientLLM,
+)
+from .message_logger import WriteBehindLogger, save_message
+from .analytics import RollupAccumulator, build_stats, truncate_hour
+from .models import (
+    ClassificationRollup, Conversation, ConversationArchive, Message, Reclassification, ReclassificationCheckpoint,
+)
+from .response_cache import ClassificationCache, LocalLRUBackend
+from .semantic_cache import SemanticCache
+from .serialization import ESCALATION_PAYLOADS, classification_output_response, dumps
+from .singleflight import AsyncSingleFlight, SingleFlight
+from .prompt_builder import StaticPrefixCache, get_generation_config, response_json_schema, trim_history
+from .streaming import ClassificationStreamParser
+from .views import get_conversation_history
+from .rag_core.data_loader import chunk_knowledge_base, make_batches
+from .rag_core.embedding_cache import EmbeddingCache
+from .management.commands import reclassify
+from .management.commands.benchmark_ann import clustered_vectors, recall_at_k
+from .management.commands.train_local_classifier import load_training_samples
+from .rag_core.ann_index import IVFIndex
+from .rag_core.vector_store import QuantizedVectorIndex, VectorIndex, cosine_similarity, retrieve_context
+
+
+def make_output(topic=TopicCategory.LAB, status=Status.CLASSIFIED, message="Your lab is at 9am."):
+    return ClassificationOutput(topic=topic, status=status, response_message=message,
+                                confidence=0.9, justification="test")
+
+
+class FastPathTests(SimpleTestCase):
+    def test_matcher_respects_word_boundaries(self):
+        matcher = AhoCorasickMatcher({"LAB": ["quest"], "TWIN_APPOINTMENT": ["welcome call"]})
+        self.assertEqual(matcher.match("I have a question"), set())
+        self.assertEqual(matcher.match("Booked at Quest today"), {"LAB"})
+        self.assertEqual(matcher.match("quest, then the welcome call"), {"LAB", "TWIN_APPOINTMENT"})
+
+    def test_first_message_ack_is_no_response(self):
+        output = classify("Ok, thanks!", "")
+        self.assertEqual(output.status, Status.NO_RESPONSE)
+        self.assertIsNone(classify("ok", "[AI]: Your lab is tomorrow."))
+
+    def test_single_topic_indicator_short_circuits(self):
+        self.assertEqual(classify("Blood draw done at Labcorp", "").topic, TopicCategory.LAB)
+        self.assertIsNone(classify("Can I move my blood draw?", ""))
+        self.assertIsNone(classify("Welcome call went well, blood test next", ""))
+
+    def test_corrections_and_non_english_messages_go_to_the_llm(self):
+        self.assertEqual(classify("Confirmed for my blood draw", "").status, Status.CLASSIFIED)
+        self.assertIsNone(classify("my labcorp appointment date is wrong", ""))
+        self.assertIsNone(classify("I can't make the blood draw at Labcorp", ""))
+        self.assertIsNone(classify("Labcorp", ""))  # No confirmation cue
+        self.assertIsNone(classify("Sí, confirmo la cita en Labcorp", ""))
+        self.assertIsNone(classify("Ja, Labcorp Termin bestätigt", ""))
+
+    def test_visit_prep_questions_and_requests_go_to_the_llm(self):
+        output = classify("Yes, coaching session tomorrow works for me", "")
+        self.assertEqual(output.topic, TopicCategory.TWIN_APPOINTMENT)
+        for message in ("yes blood draw tomorrow, do i need to fast", "ok, I am fasting for quest. what can I drink",
+                        "ok labcorp at 9 please send me the address", "yes coaching session, my coach is rude",
+                        "confirmed labcorp, is it a 12 hour fast"):
+            self.assertIsNone(classify(message, ""), message)
+
+
+class ResponseCacheTests(SimpleTestCase):
+    def test_lru_eviction_and_ttl(self):
+        backend = LocalLRUBackend(max_entries=2, ttl=60)
+        backend.set("a", make_output())
+        backend.set("b", make_output())
+        backend.get("a")
+        backend.set("c", make_output())
+        self.assertIsNone(backend.get("b"))
+        self.assertIsNotNone(backend.get("a"))
+
+        expired = LocalLRUBackend(ttl=-1)
+        expired.set("a", make_output())
+        self.assertIsNone(expired.get("a"))
+
+    def test_key_normalizes_message_and_tracks_model(self):
+        cache = ClassificationCache(LocalLRUBackend(), history_turns=1)
+        cache.set("OK, confirmed!", "[USER]: hi\n[AI]: hello", make_output())
+        self.assertIsNotNone(cache.get("ok confirmed", "[AI]: hello"))
+        self.assertIsNone(cache.get("ok confirmed", "[AI]: something else"))
+        with override_settings(GEMINI_MODEL="other-model"):
+            self.assertIsNone(cache.get("ok confirmed", "[AI]: hello"))
+        self.assertEqual(cache.get_stats()["hits"], 1)
+
+
+class VectorIndexTests(SimpleTestCase):
+    def test_batched_top_k_matches_brute_force(self):
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(50, 16))
+        queries = rng.normal(size=(4, 16))
+        index = VectorIndex(vectors, [str(i) for i in range(50)])
+
+        scores, indices = index.search(queries, top_k=5)
+        for query, row_scores, row in zip(queries, scores, indices):
+            expected = np.argsort([-cosine_similarity(query, v) for v in vectors])[:5]
+            self.assertEqual(list(row), list(expected))
+            self.assertTrue(np.all(np.diff(row_scores) <= 0))
+
+    def test_batches_respect_item_and_char_limits(self):
+        self.assertEqual(make_batches(["aaaa", "bb", "c", "dddddd"], max_items=10, max_chars=5),
+                         [[0], [1, 2], [3]])
+        self.assertEqual(make_batches(["a"] * 5, max_items=2, max_chars=100), [[0, 1], [2, 3], [4]])
+
+    def test_chunks_split_on_section_headings(self):
+        chunks = chunk_knowledge_base("# Title\nintro\n## A\nalpha\n### A.1\nmore\n## B\nbeta\n")
+        self.assertEqual(chunks, ["# Title\nintro", "## A\nalpha\n### A.1\nmore", "## B\nbeta"])
+
+
+class IVFIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.vectors = clustered_vectors(4000, 32, clusters=40)
+        self.queries = self.vectors[:50] + 0.05
+        self.index = IVFIndex(32, n_lists=32, n_probe=4)
+        self.index.add(self.vectors, [str(i) for i in range(4000)], normalized=True)
+
+    def test_recall_against_exact_search(self):
+        self.assertTrue(self.index.trained)
+        exact = VectorIndex(self.vectors, [""] * 4000).search(self.queries, top_k=5)[1]
+        self.assertGreater(recall_at_k(self.index.search(self.queries, top_k=5)[1], exact), 0.9)
+        np.testing.assert_array_equal(self.index.search(self.queries, top_k=5, n_probe=32)[1], exact)
+
+    def test_insert_delete_and_persistence(self):
+        new_id = self.index.add(np.ones((1, 32)), ["new chunk"])[0]
+        self.assertEqual(self.index.search(np.ones(32), top_k=1)[1][0, 0], new_id)
+        self.assertEqual(self.index.delete([new_id, new_id]), 1)
+        self.assertNotEqual(self.index.search(np.ones(32), top_k=1)[1][0, 0], new_id)
+
+        with tempfile.TemporaryDirectory() as directory:
+            # One long chunk must not pad every other text to its length
+            self.index.add(-np.ones((1, 32)), ["x" * 50000])
+            self.index.save(Path(directory) / "ann.npz")
+            self.assertLess((Path(directory) / "ann.npz").stat().st_size, 2 * self.vectors.nbytes)
+            with override_settings(RAG_ANN_PROBES=16):
+                self.assertEqual(IVFIndex.load(Path(directory) / "ann.npz").n_probe, 16)
+            loaded = IVFIndex.load(Path(directory) / "ann.npz", n_probe=4)
+        self.assertEqual(len(loaded), 4001)
+        self.assertIsNone(loaded.texts[new_id])
+        np.testing.assert_array_equal(loaded.search(self.queries, top_k=5)[1], self.index.search(self.queries, top_k=5)[1])
+        self.assertEqual(retrieve_context(self.queries[0], top_k=1, index=loaded), "0")
+
+
+class QuantizedVectorIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.vectors = clustered_vectors(3000, 64, clusters=30)
+        self.queries = VectorIndex._normalize(self.vectors[:50] + 0.1)
+        self.exact = VectorIndex(self.vectors, [""] * 3000, normalized=True)
+
+    def test_compact_codes_keep_recall_and_rerank_restores_exact_order(self):
+        exact_ids = self.exact.search(self.queries, top_k=5)[1]
+        for precision, ratio in (("float16", 2), ("int8", 4)):
+            index = QuantizedVectorIndex(self.vectors, [""] * 3000, normalized=True, precision=precision)
+            self.assertLessEqual(index.memory_footprint()["index_bytes"], self.exact.matrix.nbytes / ratio + 3000 * 4)
+            self.assertGreater(recall_at_k(index.search(self.queries, top_k=5)[1], exact_ids), 0.9)
+
+        reranked = QuantizedVectorIndex(self.vectors, [""] * 3000, normalized=True, precision="int8", rerank=20)
+        np.testing.assert_array_equal(reranked.search(self.queries, top_k=5)[1], exact_ids)
+
+    def test_replace_and_memory_mapped_rerank_rows(self):
+        with tempfile.TemporaryDirectory() as directory:
+            np.save(Path(directory) / "vectors.npy", self.vectors)
+            mapped = np.load(Path(directory) / "vectors.npy", mmap_mode='r')
+            index = QuantizedVectorIndex(mapped, [str(i) for i in range(3000)], normalized=True, rerank=10)
+            footprint = index.memory_footprint()
+            self.assertEqual(footprint["private_bytes"], footprint["index_bytes"])
+
+            index.replace(7, np.ones(64), "replaced")
+            self.assertEqual(retrieve_context(np.ones(64), top_k=1, index=index), "replaced")
+            self.assertEqual(index.memory_footprint()["private_bytes"], index.memory_footprint()["index_bytes"]
+                             + index.memory_footprint()["rerank_bytes"])
+
+
+class EmbeddingCacheTests(SimpleTestCase):
+    def test_appends_only_missing_rows_and_maps_read_only(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = EmbeddingCache(directory, "test-model")
+            cache.store(["a", "b"], np.array([[3.0, 4.0], [1.0, 0.0]]))
+            cache.store(["b", "c"], np.array([[9.0, 9.0], [0.0, 2.0]]))
+
+            vectors, missing = EmbeddingCache(directory, "test-model").lookup(["a", "b", "c"])
+            self.assertEqual(missing, [])
+            self.assertIsInstance(vectors.base, np.memmap)
+            np.testing.assert_allclose(vectors, [[0.6, 0.8], [1.0, 0.0], [0.0, 1.0]])
+            self.assertEqual(cache.lookup(["c", "d"])[1], [1])
+
+
+class KnowledgeBaseTests(TestCase):
+    def test_edits_are_hot_reloaded_and_broken_edits_keep_the_old_version(self):
+        with tempfile.TemporaryDirectory() as directory:
+            rules = Path(directory) / '01_rules.md'
+            rules.write_text("# Rules\n## LAB\nLab draws are at 9am.\n")
+            store = KnowledgeBaseStore(directory, check_interval=0, background=False)
+            first = store.get()
+            self.assertEqual(first.chunks, ["# Rules", "## LAB\nLab draws are at 9am."])
+
+            rules.write_text("# Rules\n## LAB\nLab draws are at 8am.\n")
+            second = store.get()
+            self.assertNotEqual(second.version, first.version)
+            self.assertIn("8am", second.system_instruction)
+
+            rules.unlink()
+            self.assertIs(store.get(), second)
+
+    @override_settings(FAST_PATH_ENABLED=False, RESPONSE_CACHE_BACKEND='none')
+    def test_ai_messages_record_the_knowledge_base_version(self):
+        with mock.patch('chat.gemini_client._client', StubGeminiClient()):
+            self.client.post('/api/classify/', json.dumps({"user_message": "hello there", "session_id": "kb"}),
+                             content_type='application/json')
+
+        reply = Message.objects.get(conversation__session_id="kb", sender='ai')
+        self.assertEqual(reply.knowledge_base_version, get_knowledge_base().version)
+
+
+class SerializationTests(SimpleTestCase):
+    def test_byte_payloads_match_the_dict_encoding(self):
+        output = make_output()
+        response = classification_output_response(output)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(json.loads(response.content), json.loads(json.dumps(output.model_dump())))
+        self.assertEqual(json.loads(ESCALATION_PAYLOADS["system_error"]),
+                         PYTHON_ESCALATION_MESSAGES["system_error"])
+        self.assertEqual(json.loads(dumps({"results": [output.model_dump(mode='json')]}))["results"][0]["topic"], "LAB")
+
+
+class StreamParserTests(SimpleTestCase):
+    def test_emits_fields_and_message_deltas_across_fragments(self):
+        document = json.dumps(make_output(message='Your "lab" is at 9am.\nBring ID').model_dump(mode='json'))
+        parser = ClassificationStreamParser()
+        events = []
+        for start in range(0, len(document), 5):
+            events += parser.feed(document[start:start + 5])
+
+        self.assertEqual([event for event in events if event[0] == 'field'],
+                         [('field', 'topic', 'LAB'), ('field', 'status', 'classified')])
+        self.assertEqual("".join(event[1] for event in events if event[0] == 'delta'),
+                         'Your "lab" is at 9am.\nBring ID')
+        self.assertEqual(parser.text, document)
+
+
+@override_settings(HISTORY_CACHE_ENABLED=True)
+class HistoryCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_active_session_history_needs_no_sql(self):
+        conversation, history = get_conversation_history("s1")
+        self.assertEqual(history, "")
+        with self.captureOnCommitCallbacks(execute=True):
+            Message.objects.create(conversation=conversation, sender='user', text="When is my lab?")
+        with self.captureOnCommitCallbacks(execute=True):
+            Message.objects.create(conversation=conversation, sender='ai', text="Tuesday at 9am.")
+
+        with self.assertNumQueries(0):
+            cached_conversation, history = get_conversation_history("s1")
+        self.assertEqual(cached_conversation.pk, conversation.pk)
+        self.assertEqual(history, "[USER]: When is my lab?\n[AI]: Tuesday at 9am.")
+
+        cache.clear()
+        self.assertEqual(get_conversation_history("s1")[1], history)
+
+
+    def test_concurrent_writers_never_leave_a_stale_entry(self):
+        Conversation.objects.create(session_id="s2")
+        # A reader misses and loads the DB, then two workers holding stale instances write
+        missed, stale_version = history_cache.get_history("s2")
+        self.assertIsNone(missed)
+        for text in ("first", "second"):
+            with self.captureOnCommitCallbacks(execute=True):
+                save_message(Message(conversation=Conversation.objects.get(session_id="s2"), sender='user', text=text))
+        expected = "[USER]: first\n[USER]: second"
+        self.assertEqual(get_conversation_history("s2")[1], expected)
+
+        # The slow reader's lines were read before the writes, so they are never served
+        history_cache.set_history(Conversation.objects.get(session_id="s2"), [], stale_version)
+        self.assertEqual(get_conversation_history("s2")[1], expected)
+
+        # A write-behind append only extends the entry one version behind; after a lost
+        # race the entry is invalid and the next read comes from the DB
+        conversation = Conversation.objects.get(session_id="s2")
+        history_cache.append_message(conversation, 'user', "queued")
+        self.assertEqual(history_cache.get_history("s2")[0][1], expected + "\n[USER]: queued")
+        cache.set("history:s2", {"conversation_id": conversation.pk, "lines": [], "version": -1})
+        history_cache.append_message(conversation, 'user', "queued again")
+        self.assertIsNone(history_cache.get_history("s2")[0])
+
+
+class WriteBehindLoggerTests(TestCase):
+    def test_flush_bulk_inserts_in_order_and_counts_drops(self):
+        conversation = Conversation.objects.create(session_id="wb")
+        logger = WriteBehindLogger(batch_size=2, max_queue_size=3, start=False)
+        for text in ("one", "two", "three", "four"):
+            logger.enqueue(Message(conversation=conversation, sender='user', text=text))
+
+        self.assertEqual(Message.objects.count(), 0)
+        # Per batch, in one transaction (a savepoint here): bulk INSERT, recent-turns read and UPDATE
+        with self.assertNumQueries(10):
+            self.assertEqual(logger.flush(), 3)
+        self.assertEqual(list(conversation.messages.order_by('timestamp').values_list('text', flat=True)),
+                         ["one", "two", "three"])
+        self.assertEqual(logger.get_stats()["dropped"], 1)
+        self.assertEqual(logger.get_stats()["queue_depth"], 0)
+
+    def test_a_bad_row_only_drops_itself(self):
+        conversation = Conversation.objects.create(session_id="wb-bad")
+        logger = WriteBehindLogger(batch_size=10, start=False)
+        for text in ("one", None, "three"):  # text is NOT NULL
+            logger.enqueue(Message(conversation=conversation, sender='user', text=text))
+
+        self.assertEqual(logger.flush(), 2)
+        self.assertEqual(list(conversation.messages.order_by('timestamp').values_list('text', flat=True)),
+                         ["one", "three"])
+        self.assertEqual((logger.get_stats()["dropped"], logger.get_stats()["failed_batches"]), (1, 1))
+
+
+class StubGeminiClient:
+    """Records generate_content calls and answers with a fixed ClassificationOutput."""
+
+    def __init__(self, output=None):
+        self.output = output or make_output()
+        self.calls = []
+        self.models = SimpleNamespace(generate_content=self._generate_content)
+        self.caches = SimpleNamespace(create=lambda **kwargs: SimpleNamespace(name="cachedContents/rules"))
+
+    def _generate_content(self, **kwargs):
+        self.calls.append(kwargs)
+        return SimpleNamespace(text=self.output.model_dump_json())
+
+
+@override_settings(FAST_PATH_ENABLED=False, RESPONSE_CACHE_BACKEND='none')
+class PromptLayoutTests(TestCase):
+    def post(self, message, session_id="prompt"):
+        return self.client.post('/api/classify/', json.dumps({"user_message": message, "session_id": session_id}),
+                                content_type='application/json')
+
+    def test_rules_move_out_of_the_per_request_contents(self):
+        stub = StubGeminiClient()
+        with mock.patch('chat.gemini_client._client', stub):
+            self.assertEqual(self.post("What time is my appointment").status_code, 200)
+
+        call = stub.calls[0]
+        rules = get_knowledge_base().text
+        self.assertNotIn(rules, call["contents"])
+        self.assertIn(rules, call["config"]["system_instruction"])
+
+    @override_settings(GEMINI_CONTEXT_CACHE_ENABLED=True)
+    def test_context_cache_shrinks_the_per_request_payload(self):
+        stub = StubGeminiClient()
+        with mock.patch('chat.gemini_client._client', stub), \
+                mock.patch('chat.prompt_builder.STATIC_PREFIX_CACHE', StaticPrefixCache()):
+            self.post("What time is my appointment")
+
+        call = stub.calls[0]
+        self.assertEqual(call["config"]["cached_content"], "cachedContents/rules")
+        self.assertNotIn("system_instruction", call["config"])
+        # Legacy layout pasted the whole knowledge base into every request's contents
+        self.assertLess(len(call["contents"]) * 5, len(call["contents"]) + len(get_knowledge_base().text))
+
+    def test_concurrent_async_callers_share_one_context_cache(self):
+        created = []
+
+        async def create(**kwargs):
+            await asyncio.sleep(0.01)
+            created.append(kwargs["config"]["display_name"])
+            return SimpleNamespace(name=f"cachedContents/{len(created)}")
+
+        delete = mock.AsyncMock()
+        client = SimpleNamespace(aio=SimpleNamespace(caches=SimpleNamespace(create=create, delete=delete)))
+        prefix_cache = StaticPrefixCache()
+
+        async def fetch(knowledge_base, callers):
+            return await asyncio.gather(*(prefix_cache.aget(client, knowledge_base) for _ in range(callers)))
+
+        v1 = SimpleNamespace(version="v1", system_instruction="rules v1")
+        self.assertEqual(asyncio.run(fetch(v1, 20)), ["cachedContents/1"] * 20)
+        self.assertEqual(created, ["twin-health-rules-v1"])
+
+        # A new knowledge base version replaces (and deletes) the previous entry
+        v2 = SimpleNamespace(version="v2", system_instruction="rules v2")
+        self.assertEqual(asyncio.run(fetch(v2, 5)), ["cachedContents/2"] * 5)
+        delete.assert_awaited_once_with(name="cachedContents/1")
+
+    def test_history_is_trimmed_to_the_token_budget(self):
+        history = "\n".join(f"[USER]: message number {i}" for i in range(20))
+        trimmed = trim_history(history, max_tokens=20)
+        self.assertTrue(trimmed.endswith("message number 19"))
+        self.assertLess(len(trimmed.splitlines()), 20)
+
+
+class LazyStartupTests(SimpleTestCase):
+    def test_response_schema_is_generated_once(self):
+        response_json_schema.cache_clear()
+        self.addCleanup(response_json_schema.cache_clear)
+        with mock.patch.object(ClassificationOutput, 'model_json_schema', return_value={"type": "object"}) as schema:
+            get_generation_config()
+            get_generation_config()
+        self.assertEqual(schema.call_count, 1)
+
+    def test_warm_up_builds_each_component_once(self):
+        with mock.patch('chat.gemini_client._client', StubGeminiClient()), \
+                mock.patch.object(warmup, '_warmed', threading.Event()):
+            steps = [name for name, _ in warmup.warm_up()]
+            self.assertEqual(warmup.warm_up(), [])
+        self.assertEqual(steps[:3], ['gemini_client', 'response_schema', 'knowledge_base'])
+
+
+class BenchmarkHarnessTests(SimpleTestCase):
+    def test_fake_client_returns_valid_outputs_and_injects_errors(self):
+        fake = FakeGeminiClient(latency=LatencyModel(median_ms=0), seed=3)
+        output = ClassificationOutput.model_validate_json(
+            fake.models.generate_content(model="m", contents="hello").text)
+        self.assertIn(output.topic, list(TopicCategory))
+
+        failing = FakeGeminiClient(latency=LatencyModel(median_ms=0), error_rate=1.0)
+        with self.assertRaises(Exception):
+            failing.models.generate_content(model="m", contents="hello")
+
+    def test_corpus_replay_and_report(self):
+        conversations = expand_corpus(load_corpus("reminder_replies"), 40)
+        self.assertEqual(len(conversations), 40)
+        self.assertEqual(len({session_id for session_id, _ in conversations}), 40)
+
+        row = summarize("wsgi", 4, [0.1] * 98 + [1.0, 2.0], Counter({200: 99, 503: 1}), 10.0, DBTimer())
+        self.assertEqual((row["requests"], row["errors"], row["rps"]), (100, 1, 10.0))
+        self.assertAlmostEqual(row["p50_ms"], 100.0)
+        self.assertGreater(row["p99_ms"], row["p95_ms"])
+
+
+@override_settings(FAST_PATH_ENABLED=False, RESPONSE_CACHE_BACKEND='none')
+class MetricsTests(TestCase):
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.Histogram("test_seconds", "Test.", buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 5.0):
+            histogram.observe(value, stage="x")
+        lines = histogram.expose()
+        self.assertIn('test_seconds_bucket{stage="x",le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{stage="x",le="+Inf"} 3', lines)
+        self.assertIn('test_seconds_count{stage="x"} 3', lines)
+
+    def test_classify_records_stages_and_metrics_endpoint_exposes_them(self):
+        before = metrics.STAGE_SECONDS.count(stage='gemini')
+        with mock.patch('chat.gemini_client._client', StubGeminiClient()):
+            self.client.post('/api/classify/', json.dumps({"user_message": "When is my lab", "session_id": "m"}),
+                             content_type='application/json')
+        self.assertEqual(metrics.STAGE_SECONDS.count(stage='gemini'), before + 1)
+        self.assertGreaterEqual(metrics.REQUESTS_TOTAL.value(topic="LAB", status="classified", source="llm"), 1)
+
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('chat_classify_stage_seconds_bucket{stage="history"', body)
+        self.assertIn('chat_fast_path_hit_rate', body)
+
+
+@override_settings(FAST_PATH_ENABLED=False, RESPONSE_CACHE_BACKEND='none')
+class BatchClassificationTests(TestCase):
+    def test_batch_returns_ordered_results_with_bulk_queries(self):
+        conversation = Conversation.objects.create(session_id="known")
+        Message.objects.create(conversation=conversation, sender='user', text="Earlier message")
+        items = [
+            {"session_id": "known", "user_message": "When is my lab"},
+            {"session_id": "new", "user_message": "Coach call tomorrow"},
+            {"session_id": "known", "user_message": "Thanks, see you then"},
+            {"session_id": "new"},
+        ] + [{"session_id": f"burst-{i}", "user_message": "Confirming my appointment"} for i in range(20)]
+
+        fake = FakeGeminiClient(latency=LatencyModel(median_ms=0), seed=1)
+        # Conversations select/insert/reselect, then one transaction (a savepoint here)
+        # with the bulk insert and the recent-turns read and bulk update
+        with mock.patch('chat.gemini_client._client', fake), self.assertNumQueries(8):
+            response = self.client.post('/api/classify/batch/', json.dumps({"items": items}),
+                                        content_type='application/json')
+
+        results = response.json()["results"]
+        self.assertEqual([r["session_id"] for r in results[:4]], ["known", "new", "known", "new"])
+        self.assertEqual([r["status_code"] for r in results[:4]], [200, 200, 200, 400])
+        self.assertEqual(fake.calls, 23)
+        self.assertEqual(Message.objects.filter(conversation=conversation, sender='user').count(), 3)
+        self.assertEqual(Conversation.objects.filter(session_id__startswith="burst-").count(), 20)
+
+    def test_history_window_keeps_the_last_turns_in_order(self):
+        conversation = Conversation.objects.create(session_id="window")
+        for i in range(14):
+            Message.objects.create(conversation=conversation, sender='user', text=f"m{i}")
+        conversation = Conversation.objects.get(pk=conversation.pk)
+        with self.assertNumQueries(0):
+            lines = batch.load_histories({"window": conversation})["window"]
+        self.assertEqual(lines, [f"[USER]: m{i}" for i in range(4, 14)])
+
+    def test_batch_rejects_a_malformed_body(self):
+        response = self.client.post('/api/classify/batch/', json.dumps({"items": []}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(HISTORY_CACHE_ENABLED=False)
+class HistoryStorageTests(TestCase):
+    def setUp(self):
+        self.conversation = Conversation.objects.create(session_id="cold")
+        for i in range(12):
+            Message.objects.create(conversation=self.conversation, sender='user' if i % 2 else 'ai', text=f"m{i}")
+
+    def test_history_is_read_from_the_recent_turns_snapshot(self):
+        with self.assertNumQueries(1):
+            conversation, history = get_conversation_history("cold")
+        self.assertEqual(history.splitlines(), [f"[{'USER' if i % 2 else 'AI'}]: m{i}" for i in range(2, 12)])
+        self.assertIsNotNone(conversation.last_activity)
+
+    def test_writers_with_stale_conversations_keep_every_turn(self):
+        # Two requests loaded the session before either logged its turn
+        first = Conversation.objects.get(pk=self.conversation.pk)
+        second = Conversation.objects.get(pk=self.conversation.pk)
+        save_message(Message(conversation=first, sender='user', text="from first"))
+        save_message(Message(conversation=second, sender='user', text="from second"))
+
+        recent_turns = Conversation.objects.get(pk=self.conversation.pk).recent_turns
+        self.assertEqual(recent_turns[-2:], ["[USER]: from first", "[USER]: from second"])
+        self.assertEqual(len(recent_turns), 10)
+
+    def test_archive_round_trip_keeps_history_and_message_ids(self):
+        ids = list(self.conversation.messages.order_by('timestamp').values_list('id', flat=True))
+        Conversation.objects.filter(pk=self.conversation.pk).update(
+            last_activity=timezone.now() - timedelta(days=90))
+
+        call_command('archive_conversations', inactive_days=30, stdout=StringIO())
+        self.assertEqual(Message.objects.count(), 0)
+        archived = Conversation.objects.get(pk=self.conversation.pk)
+        self.assertTrue(archived.archived)
+        self.assertEqual([message.pk for message in archive.load_messages(archived)], ids)
+
+        # The next classification of the session rehydrates it transparently
+        conversation, history = get_conversation_history("cold")
+        self.assertFalse(Conversation.objects.get(pk=conversation.pk).archived)
+        self.assertEqual(list(conversation.messages.order_by('timestamp').values_list('id', flat=True)), ids)
+        self.assertTrue(history.endswith("[USER]: m11"))
+        self.assertFalse(ConversationArchive.objects.exists())
+
+
+class AnalyticsRollupTests(TestCase):
+    def test_accumulated_counts_are_added_to_the_rollups(self):
+        now = timezone.now()
+        accumulator = RollupAccumulator(start=False)
+        for status in ['classified', 'classified', 'escalate']:
+            accumulator.record(now, 'LAB', status)
+        accumulator.flush()
+        accumulator.record(now, None, 'escalate')
+        accumulator.record(now, 'LAB', 'classified')
+        accumulator.flush()
+
+        totals = build_stats(1, now)["totals"]
+        self.assertEqual(totals["total"], 5)
+        self.assertEqual(totals["escalation_rate"], 0.4)
+        self.assertEqual(totals["by_topic_status"], {"LAB": {"classified": 3, "escalate": 1}, "none": {"escalate": 1}})
+
+    def test_backfill_rebuilds_closed_hours_and_stats_endpoint_serves_them(self):
+        conversation = Conversation.objects.create(session_id="stats")
+        two_hours_ago = timezone.now() - timedelta(hours=2)
+        Message.objects.bulk_create([
+            Message(conversation=conversation, sender=sender, text="x", timestamp=two_hours_ago,
+                    topic_category=topic, status=status)
+            for sender, topic, status in [('user', None, None), ('ai', 'LAB', 'classified'),
+                                          ('ai', 'OTHERS', 'escalate'), ('ai', 'LAB', 'classified')]
+        ])
+        ClassificationRollup.objects.create(hour=two_hours_ago.replace(minute=0, second=0, microsecond=0),
+                                            topic_category='LAB', status='classified', count=99)
+        call_command('rollup_analytics', chunk_size=2, stdout=StringIO())
+        self.assertEqual(ClassificationRollup.objects.get(topic_category='LAB').count, 2)
+
+        cache.clear()
+        stats = self.client.get('/api/stats/?hours=6').json()
+        self.assertEqual(stats["totals"]["total"], 3)
+        self.assertEqual(len(stats["hourly"]), 1)
+        self.assertEqual(self.client.get('/api/stats/?hours=0').status_code, 400)
+
+
+    def test_backfill_leaves_the_just_closed_hour_until_workers_have_flushed(self):
+        hour = truncate_hour(timezone.now()) - timedelta(hours=1)
+        conversation = Conversation.objects.create(session_id="settle")
+        Message.objects.create(conversation=conversation, sender='ai', text="x", timestamp=hour + timedelta(minutes=59),
+                               topic_category='LAB', status='classified')
+        ClassificationRollup.objects.create(hour=hour, topic_category='LAB', status='classified', count=7)
+
+        # Seconds after the hour closed, a worker may still hold counts for it: left alone
+        with mock.patch('django.utils.timezone.now', return_value=hour + timedelta(hours=1, seconds=5)):
+            call_command('rollup_analytics', stdout=StringIO())
+        self.assertEqual(ClassificationRollup.objects.get(hour=hour).count, 7)
+        with mock.patch('django.utils.timezone.now', return_value=hour + timedelta(hours=1, minutes=1)):
+            call_command('rollup_analytics', stdout=StringIO())
+        self.assertEqual(ClassificationRollup.objects.get(hour=hour).count, 1)
+
+    def test_backfill_keeps_the_counts_of_archived_conversations(self):
+        three_hours_ago = timezone.now() - timedelta(hours=3)
+        for session_id in ("archived", "live"):
+            conversation = Conversation.objects.create(session_id=session_id)
+            Message.objects.bulk_create([
+                Message(conversation=conversation, sender='ai', text="x", timestamp=three_hours_ago,
+                        topic_category='LAB', status=status) for status in ('classified', 'escalate')
+            ])
+        archive.archive_conversation(Conversation.objects.get(session_id="archived"))
+        self.assertEqual(Message.objects.count(), 2)
+
+        Conversation.objects.update(last_activity=three_hours_ago)
+
+        for hours in (0, 6):  # The whole table, then recent hours only
+            call_command('rollup_analytics', hours=hours, stdout=StringIO())
+            self.assertEqual(ClassificationRollup.objects.get(status='classified').count, 2)
+            self.assertEqual(ClassificationRollup.objects.get(status='escalate').count, 2)
+
+
+class ReclassifyCommandTests(TestCase):
+    def setUp(self):
+        for c in range(3):
+            conversation = Conversation.objects.create(session_id=f"reclassify-{c}")
+            Message.objects.create(conversation=conversation, sender='user', text="When is my lab")
+            Message.objects.create(conversation=conversation, sender='ai', text="At 9am.",
+                                   topic_category="LAB", status="classified")
+            Message.objects.create(conversation=conversation, sender='user', text="ok thanks")
+
+    def test_reclassify_writes_side_table_and_resumes_from_checkpoint(self):
+        fake = FakeGeminiClient(latency=LatencyModel(median_ms=0), seed=2)
+        with mock.patch('chat.gemini_client._client', fake):
+            call_command('reclassify', run_id="run", page_size=2, workers=2, stdout=StringIO())
+            self.assertEqual(Reclassification.objects.filter(run_id="run").count(), 6)
+            self.assertEqual(ReclassificationCheckpoint.objects.get(run_id="run").processed_turns, 6)
+            first = Reclassification.objects.filter(run_id="run", message__text="When is my lab").first()
+            self.assertEqual((first.old_topic_category, first.old_status), ("LAB", "classified"))
+
+            # A rerun resumes past the checkpoint and calls Gemini for nothing
+            call_command('reclassify', run_id="run", stdout=StringIO())
+        self.assertEqual(fake.calls, 6)
+
+        output = StringIO()
+        with mock.patch('chat.gemini_client._client', fake):
+            call_command('reclassify', run_id="run", report=True, stdout=output)
+        self.assertIn("of 6 turns changed classification", output.getvalue())
+
+    def test_failed_turns_are_retried_when_the_run_resumes(self):
+        fake = FakeGeminiClient(latency=LatencyModel(median_ms=0), seed=2)
+        classify_turn, attempts = reclassify.classify_turn, []
+
+        def breaker_open_for_the_first_page(turn):
+            attempts.append(turn)
+            if len(attempts) <= 4:
+                raise LLMUnavailable("LLM circuit breaker is open.")
+            return classify_turn(turn)
+
+        with mock.patch('chat.gemini_client._client', fake):
+            with mock.patch('chat.management.commands.reclassify.classify_turn', breaker_open_for_the_first_page):
+                call_command('reclassify', run_id="flaky", page_size=2, workers=1, stdout=StringIO(), stderr=StringIO())
+            checkpoint = ReclassificationCheckpoint.objects.get(run_id="flaky")
+            self.assertEqual(checkpoint.failed_turns, 4)
+
+            call_command('reclassify', run_id="flaky", stdout=StringIO())
+        checkpoint.refresh_from_db()
+        self.assertEqual((checkpoint.failed_turns, checkpoint.failed_message_ids), (0, []))
+        self.assertEqual(Reclassification.objects.filter(run_id="flaky").count(), 6)
+        self.assertEqual(fake.calls, 6)
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_concurrent_threads_share_one_call(self):
+        flights, calls, results = SingleFlight(), [], []
+
+        def slow_call():
+            calls.append(1)
+            time.sleep(0.05)
+            return "output"
+
+        threads = [threading.Thread(target=lambda: results.append(flights.do("key", slow_call))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(shared for _, shared in results), [False, True, True, True, True])
+
+    def test_failures_propagate_to_followers_and_are_not_cached(self):
+        flights = AsyncSingleFlight()
+
+        async def failing_call():
+            await asyncio.sleep(0.01)
+            raise ValueError("upstream")
+
+        async def main():
+            return await asyncio.gather(*(flights.do("key", failing_call) for _ in range(3)), return_exceptions=True)
+
+        self.assertTrue(all(isinstance(result, ValueError) for result in asyncio.run(main())))
+        self.assertEqual(flights._futures, {})
+
+
+@override_settings(FAST_PATH_ENABLED=False, RESPONSE_CACHE_BACKEND='none')
+class CoalescedClassificationTests(TestCase):
+    async def test_duplicate_async_requests_share_one_gemini_call_and_log_once(self):
+        fake = FakeGeminiClient(latency=LatencyModel(median_ms=30, p95_ms=30), seed=4)
+        body = json.dumps({"user_message": "When is my lab", "session_id": "double-tap"})
+        with mock.patch('chat.gemini_client._client', fake):
+            responses = await asyncio.gather(*(
+                self.async_client.post('/api/classify/async/', body, content_type='application/json')
+                for _ in range(3)
+            ))
+
+        self.assertEqual([response.status_code for response in responses], [200, 200, 200])
+        self.assertEqual(len({response.content for response in responses}), 1)
+        self.assertEqual(fake.calls, 1)
+        self.assertEqual(await Message.objects.filter(sender='user', conversation__session_id="double-tap").acount(), 1)
+
+
+@override_settings(FAST_PATH_ENABLED=False, RESPONSE_CACHE_BACKEND='none')
+class AsyncClassificationViewTests(TestCase):
+    async def post(self, fake, payload):
+        with mock.patch('chat.gemini_client._client', fake), \
+                mock.patch('chat.views.get_llm', return_value=ResilientLLM(retry_base_delay=0.001)):
+            return await self.async_client.post('/api/classify/async/', json.dumps(payload),
+                                                content_type='application/json')
+
+    async def test_classifies_and_logs_both_turns(self):
+        fake = FakeGeminiClient(latency=LatencyModel(median_ms=0), seed=3)
+        response = await self.post(fake, {"user_message": "When is my lab", "session_id": "async-ok"})
+
+        self.assertEqual(response.status_code, 200)
+        ClassificationOutput.model_validate(response.json())
+        self.assertEqual(fake.calls, 1)
+        senders = [sender async for sender in Message.objects.filter(conversation__session_id="async-ok")
+                   .order_by('timestamp').values_list('sender', flat=True)]
+        self.assertEqual(senders, ['user', 'ai'])
+
+    async def test_missing_fields_are_rejected_without_calling_gemini(self):
+        fake = FakeGeminiClient(latency=LatencyModel(median_ms=0), seed=3)
+        response = await self.post(fake, {"user_message": "   ", "session_id": "async-invalid"})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["status"], "error")
+        self.assertEqual(fake.calls, 0)
+        self.assertFalse(await Conversation.objects.filter(session_id="async-invalid").aexists())
+
+    async def test_gemini_errors_return_the_system_error_escalation(self):
+        fake = FakeGeminiClient(latency=LatencyModel(median_ms=0), error_rate=1.0, seed=3)
+        response = await self.post(fake, {"user_message": "When is my lab", "session_id": "async-error"})
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json(), PYTHON_ESCALATION_MESSAGES["system_error"])
+        self.assertTrue(await Message.objects.filter(conversation__session_id="async-error", sender='ai',
+                                                     status=Status.ESCALATE.value).aexists())
+
+
+@override_settings(FAST_PATH_ENABLED=False, RESPONSE_CACHE_BACKEND='none')
+class StreamingViewTests(TestCase):
+    async def stream(self, fake, session_id):
+        body = json.dumps({"user_message": "When is my lab", "session_id": session_id})
+        with mock.patch('chat.gemini_client._client', fake), \
+                mock.patch('chat.views.get_llm', return_value=ResilientLLM(retry_base_delay=0.001)):
+            response = await self.async_client.post('/api/classify/stream/', body, content_type='application/json')
+            return b"".join([chunk async for chunk in response.streaming_content]).decode()
+
+    async def test_stream_retries_before_the_first_chunk_and_logs_the_result(self):
+        fake = FakeGeminiClient(latency=LatencyModel(median_ms=0), fail_first=1, seed=2)
+        body = await self.stream(fake, "stream-ok")
+        self.assertEqual(fake.calls, 2)
+        self.assertIn("event: token", body)
+        self.assertIn("event: result", body)
+        self.assertTrue(await Message.objects.filter(sender='ai', conversation__session_id="stream-ok").aexists())
+
+    async def test_stream_failure_sends_the_system_error_event(self):
+        fake = FakeGeminiClient(latency=LatencyModel(median_ms=0), error_rate=1.0, seed=2)
+        body = await self.stream(fake, "stream-error")
+        self.assertIn("event: error", body)
+        self.assertIn(PYTHON_ESCALATION_MESSAGES["system_error"]["message"], body)
+        self.assertEqual(fake.calls, 3)  # The first attempt and two retries
+
+
+class SlowFirstCallClient(FakeGeminiClient):
+    """Fake client whose first generate_content call hangs for `first_delay` seconds."""
+
+    def __init__(self, first_delay, **kwargs):
+        super().__init__(latency=LatencyModel(median_ms=0), **kwargs)
+        self.first_delay = first_delay
+        self.models.generate_content = self._slow_first
+
+    def _slow_first(self, **kwargs):
+        if self.calls == 0:
+            self.calls += 1
+            time.sleep(self.first_delay)
+        return self._generate_content(**kwargs)
+
+
+class ResilientLLMTests(SimpleTestCase):
+    def make_llm(self, **kwargs):
+        kwargs.setdefault('retry_base_delay', 0.001)
+        return ResilientLLM(**kwargs)
+
+    def test_retryable_errors_are_retried_within_the_deadline(self):
+        fake = FakeGeminiClient(latency=LatencyModel(median_ms=0), fail_first=2)
+        response = self.make_llm(max_retries=2).generate(fake, model="m", contents="hello")
+        ClassificationOutput.model_validate_json(response.text)
+        self.assertEqual(fake.calls, 3)
+
+    def test_deadline_fails_fast_and_shrinks_the_concurrency_limit(self):
+        llm = self.make_llm(deadline=0.05, limiter=AdaptiveLimiter(initial=16))
+        started = time.perf_counter()
+        with self.assertRaises(DeadlineExceeded):
+            llm.generate(SlowFirstCallClient(first_delay=0.5), model="m", contents="hello")
+        self.assertLess(time.perf_counter() - started, 0.3)
+        self.assertEqual(llm.limiter.limit, 8)
+
+    def test_hedged_request_beats_a_slow_primary(self):
+        fake = SlowFirstCallClient(first_delay=0.5)
+        llm = self.make_llm(hedging=True, hedge_delay=0.02)
+        started = time.perf_counter()
+        llm.generate(fake, model="m", contents="hello")
+        self.assertLess(time.perf_counter() - started, 0.3)
+        self.assertEqual(fake.calls, 2)
+
+    def test_circuit_opens_after_consecutive_failures_then_probes(self):
+        fake = FakeGeminiClient(latency=LatencyModel(median_ms=0), error_rate=1.0)
+        llm = self.make_llm(max_retries=0, breaker=CircuitBreaker(failure_threshold=3, reset_timeout=0.05))
+        for _ in range(3):
+            with self.assertRaises(Exception):
+                llm.generate(fake, model="m", contents="hello")
+        with self.assertRaises(CircuitOpenError):
+            llm.generate(fake, model="m", contents="hello")
+        self.assertEqual(fake.calls, 3)
+
+        time.sleep(0.06)
+        fake.error_rate = 0.0
+        llm.generate(fake, model="m", contents="hello")
+        self.assertEqual(llm.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_cancelled_half_open_probe_does_not_wedge_the_breaker(self):
+        fake = FakeGeminiClient(latency=LatencyModel(median_ms=0))
+        hanging = SimpleNamespace(aio=SimpleNamespace(models=SimpleNamespace(
+            generate_content=lambda **kwargs: asyncio.sleep(10),
+            generate_content_stream=lambda **kwargs: asyncio.sleep(10),
+        )))
+        llm = self.make_llm(breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0))
+
+        async def consume_stream():
+            async for _ in llm.astream(hanging, model="m", contents="hi"):
+                pass
+
+        async def cancel_probe(call):
+            llm.breaker.record_failure()
+            task = asyncio.ensure_future(call())
+            await asyncio.sleep(0.01)
+            self.assertEqual(llm.breaker.state, CircuitBreaker.HALF_OPEN)
+            task.cancel()  # e.g. the ASGI client disconnected
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            # The next caller becomes the probe instead of failing fast
+            await llm.agenerate(fake, model="m", contents="hello")
+            self.assertEqual(llm.breaker.state, CircuitBreaker.CLOSED)
+
+        asyncio.run(cancel_probe(lambda: llm.agenerate(hanging, model="m", contents="hello")))
+        asyncio.run(cancel_probe(consume_stream))
+
+        async def close_stream_early():
+            llm.breaker.record_failure()
+            stream = llm.astream(fake, model="m", contents="hi")
+            await anext(stream)
+            await stream.aclose()  # GeneratorExit inside astream
+            await llm.agenerate(fake, model="m", contents="hello")
+            self.assertEqual(llm.breaker.state, CircuitBreaker.CLOSED)
+
+        asyncio.run(close_stream_early())
+
+    def test_calls_over_the_limit_wait_for_a_slot(self):
+        fake = FakeGeminiClient(latency=LatencyModel(median_ms=20, p95_ms=20), seed=1)
+        llm = self.make_llm(limiter=AdaptiveLimiter(initial=2, minimum=1, maximum=2))
+
+        async def burst():
+            return await asyncio.gather(*(llm.agenerate(fake, model="m", contents="hi") for _ in range(12)))
+
+        self.assertEqual(len(asyncio.run(burst())), 12)
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            self.assertEqual(len(list(pool.map(lambda _: llm.generate(fake, model="m", contents="hi"), range(6)))), 6)
+        self.assertEqual(fake.calls, 18)
+        self.assertEqual((llm.limiter.in_flight, llm.limiter.waiting), (0, 0))
+
+        # A caller that cannot get a slot before its deadline is still rejected
+        llm = self.make_llm(deadline=0.05, limiter=AdaptiveLimiter(initial=1, minimum=1, maximum=1))
+        self.assertTrue(llm.limiter.try_acquire())
+        with self.assertRaises(ConcurrencyLimitExceeded):
+            llm.generate(fake, model="m", contents="hi")
+        self.assertEqual(llm.limiter.waiting, 0)
+
+    def test_limiter_grows_additively_and_rejects_over_the_limit(self):
+        limiter = AdaptiveLimiter(initial=2, minimum=1, maximum=4)
+        self.assertTrue(limiter.try_acquire() and limiter.try_acquire())
+        self.assertFalse(limiter.try_acquire())
+        for _ in range(10):
+            limiter.on_success()
+        self.assertGreater(limiter.limit, 3)
+
+
+TRAINING_SAMPLES = [
+    ("Confirmed for my blood draw on Monday", "[AI]: Reminder: your lab test is Monday", "LAB"),
+    ("I will be fasting for the labcorp visit", "[AI]: Reminder: your lab test is Monday", "LAB"),
+    ("Yes I will be there", "[AI]: Reminder: your lab test is Monday", "LAB"),
+    ("Coach call works for me", "[AI]: Your coaching session is tomorrow", "TWIN_APPOINTMENT"),
+    ("See you at the coaching session", "[AI]: Your coaching session is tomorrow", "TWIN_APPOINTMENT"),
+    ("Yes I will be there", "[AI]: Your coaching session is tomorrow", "TWIN_APPOINTMENT"),
+    ("Can you send me a new sensor", "", "OTHERS"),
+    ("My insurance changed last month", "", "OTHERS"),
+] * 5
+
+
+class LocalClassifierTests(TestCase):
+    def test_model_learns_topics_from_message_and_previous_line(self):
+        model = local_classifier.train(TRAINING_SAMPLES, dimension=2 ** 12, epochs=10)
+        self.assertEqual(model.predict("Yes I will be there", "[AI]: Your coaching session is tomorrow")[0],
+                         "TWIN_APPOINTMENT")
+        self.assertEqual(model.predict("Yes I will be there", "[AI]: Reminder: your lab test is Monday")[0], "LAB")
+
+    def test_artifact_round_trip_and_hot_reload(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = f"{directory}/model.npz"
+            loader = local_classifier.ModelLoader(path, check_interval=0)
+            self.assertIsNone(loader.get())
+
+            local_classifier.train(TRAINING_SAMPLES, dimension=2 ** 12, epochs=2).save(path)
+            first = loader.get()
+            self.assertEqual(first.classes, ["LAB", "OTHERS", "TWIN_APPOINTMENT"])
+
+            local_classifier.train(TRAINING_SAMPLES[:6], dimension=2 ** 12, epochs=2).save(path)
+            self.assertEqual(loader.get().classes, ["LAB", "TWIN_APPOINTMENT"])
+
+    def test_train_command_and_confident_routing(self):
+        conversation = Conversation.objects.create(session_id="train")
+        for message, previous, topic in TRAINING_SAMPLES:
+            if previous:
+                Message.objects.create(conversation=conversation, sender='ai', text=previous[6:])
+            Message.objects.create(conversation=conversation, sender='user', text=message)
+            Message.objects.create(conversation=conversation, sender='ai', text="ok", topic_category=topic,
+                                   status=Status.CLASSIFIED.value)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = f"{directory}/model.npz"
+            output = StringIO()
+            call_command('train_local_classifier', output=path, dimension=2 ** 12, min_samples=20, stdout=output)
+            self.assertIn("coverage", output.getvalue())
+
+            with override_settings(LOCAL_CLASSIFIER_ENABLED=True, LOCAL_CLASSIFIER_THRESHOLD=0.6), \
+                    mock.patch.object(local_classifier, '_loader', local_classifier.ModelLoader(path, 0)):
+                routed = local_classifier.classify("I will be fasting for the labcorp visit", "")
+                self.assertEqual((routed.topic, routed.status), (TopicCategory.LAB, Status.CLASSIFIED))
+                self.assertIsNone(local_classifier.classify("Can you send me a new sensor", ""))
+                self.assertIsNone(local_classifier.classify("Is my labcorp visit fasting?", ""))
+                # Corrections, cancellations and non-English text are escalations for the LLM
+                for message in ("the labcorp visit time you sent is wrong",
+                                "I cannot make the labcorp visit, need to cancel", "No habla ingles labcorp"):
+                    self.assertIsNone(local_classifier.classify(message, ""), message)
+
+    def test_training_uses_only_classified_replies(self):
+        conversation = Conversation.objects.create(session_id="train-status")
+        for text, status in (("Blood draw done", Status.CLASSIFIED), ("My lab result is wrong", Status.ESCALATE)):
+            Message.objects.create(conversation=conversation, sender='user', text=text)
+            Message.objects.create(conversation=conversation, sender='ai', text="reply", topic_category="LAB",
+                                   status=status.value)
+        self.assertEqual(load_training_samples(), [("Blood draw done", "", "LAB")])
+
+
+class SemanticCacheTests(SimpleTestCase):
+    def test_paraphrase_hits_above_threshold_and_lru_eviction(self):
+        semantic = SemanticCache(max_entries=2, threshold=0.9)
+        rng = np.random.default_rng(0)
+        blood_test, coach, sensor = rng.standard_normal((3, 16)).astype(np.float32)
+        semantic.store(blood_test, "when is my blood test", make_output())
+        semantic.store(coach, "when is my coach call", make_output(topic=TopicCategory.TWIN_APPOINTMENT))
+
+        paraphrase = blood_test + 0.1 * rng.standard_normal(16).astype(np.float32)
+        self.assertEqual(semantic.lookup(paraphrase).topic, TopicCategory.LAB)
+        self.assertIsNone(semantic.lookup(sensor))
+
+        # The coach entry is least recently used, so it is the one evicted
+        semantic.store(sensor, "my sensor fell off", make_output(topic=TopicCategory.OTHERS))
+        self.assertIsNone(semantic.lookup(coach))
+        self.assertIsNotNone(semantic.lookup(blood_test))
+        self.assertEqual(semantic.get_stats()["hits"], 2)
+
+    def test_only_standalone_messages_without_history_are_stored(self):
+        semantic = SemanticCache()
+        vector = np.ones(8, dtype=np.float32)
+        with mock.patch('chat.semantic_cache.get_query_embedding', return_value=vector):
+            semantic.set("yes", "", make_output())
+            semantic.set("what time is my lab draw", "[AI]: Hello", make_output())
+            self.assertEqual(semantic.get_stats()["entries"], 0)
+            semantic.set("what time is my lab draw", "", make_output())
+            self.assertEqual(semantic.get("when is my blood test", "").topic, TopicCategory.LAB)
+            # Answers stored without context are never reused mid-conversation
+            self.assertIsNone(semantic.get("when is my blood test", "[AI]: Your coach call is tomorrow"))
+            self.assertIsNone(asyncio.run(semantic.aget("can I reschedule it", "[AI]: Your lab is Monday")))
@@ -6,4 +6,12 @@ from . import views
 urlpatterns = [
     # The main API endpoint: /api/classify/
     path('classify/', views.chat_classification_api, name='classify_chat'),
+    # Native async variant, served without a thread per request under ASGI: /api/classify/async/
+    path('classify/async/', views.async_chat_classification_api, name='classify_chat_async'),
+    # Server-Sent Events stream of the classification as it is generated: /api/classify/stream/
+    path('classify/stream/', views.stream_chat_classification_api, name='classify_chat_stream'),
+    # Many {session_id, user_message} items in one request, classified concurrently: /api/classify/batch/
+    path('classify/batch/', views.batch_chat_classification_api, name='classify_chat_batch'),
+    # Hourly topic x status counts and escalation rates from the rollup table: /api/stats/
+    path('stats/', views.stats_endpoint, name='stats'),
 ]
@@ -1,43 +1,54 @@
 # chat/views.py
 
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
 from django.conf import settings
 from rest_framework.decorators import api_view
+import asyncio
 import json
-
-from google import genai
-from google.genai.errors import APIError
+import time
 
 # Import local app components
 from .llm_schemas import ClassificationOutput, Status, PYTHON_ESCALATION_MESSAGES
-from .knowledge_base import LLM_RAG_CONTEXT
-from .models import Conversation, Message  # Import the models we just defined
-
-# --- Initialization ---
-
-# Initialize the Gemini Client using the key from settings.py
-try:
-    client = genai.Client(api_key=settings.GEMINI_API_KEY)
-except Exception as e:
-    print(f"Error initializing Gemini client: {e}")
-    client = None
-
+from .gemini_client import get_client
+from .knowledge_base import get_knowledge_base
+from .llm_resilience import LLMUnavailable, get_llm
+from .models import Conversation  # Import the models we just defined
+from . import analytics, archive, batch, fast_path, gemini_client, history_cache, local_classifier, metrics, serialization
+from .message_logger import log_message, alog_message, abulk_log_messages, build_message, get_write_behind_logger
+from .response_cache import get_response_cache
+from .semantic_cache import get_semantic_cache
+from .serialization import classification_output_response, escalation_response, json_response
+from .rag_core.data_loader import get_query_embedding, aget_query_embedding
+from .rag_core.vector_store import retrieve_context
+from .singleflight import AsyncSingleFlight, SingleFlight
+from .streaming import ClassificationStreamParser, sse_event
+from .prompt_builder import build_request_contents, get_generation_config, aget_generation_config
 
 # Helper function to load conversation history for context
 def get_conversation_history(session_id):
-    """Fetches or creates the conversation session and retrieves the message history."""
+    """
+    Fetches or creates the conversation session and retrieves the message history from
+    its recent-turns snapshot. Active sessions are served from the shared history cache
+    without any SQL reads.
+    """
+    if history_cache.is_enabled():
+        cached, version = history_cache.get_history(session_id)
+        if cached:
+            return cached
+
     try:
         conversation, created = Conversation.objects.get_or_create(session_id=session_id)
+        if conversation.archived:
+            # A dormant session is active again: move its messages back from the archive
+            archive.rehydrate(conversation)
 
-        # Retrieve the last 10 messages for context, ordered by time
-        history_objs = conversation.messages.all().order_by('-timestamp')[:10]
+        # The last RECENT_TURNS formatted lines are kept on the row itself, so no Message query
+        history_formatted = list(conversation.recent_turns)
 
-        # Format history for the LLM prompt: [SENDER]: MESSAGE
-        history_formatted = [
-            f"[{msg.sender.upper()}]: {msg.text}"
-            for msg in reversed(history_objs)  # Reverse to chronological order
-        ]
+        if history_cache.is_enabled():
+            history_cache.set_history(conversation, history_formatted, version)
 
         return conversation, "\n".join(history_formatted)
 
@@ -46,96 +57,654 @@ def get_conversation_history(session_id):
         return None, ""
 
 
-@csrf_exempt  # Required for non-browser-based POST requests
-@api_view(['POST'])  # DRF decorator
-def chat_classification_api(request):
+async def aget_conversation_history(session_id):
+    """Async counterpart of get_conversation_history using Django's async ORM."""
+    if history_cache.is_enabled():
+        cached, version = await history_cache.aget_history(session_id)
+        if cached:
+            return cached
+
+    try:
+        conversation, created = await Conversation.objects.aget_or_create(session_id=session_id)
+        if conversation.archived:
+            await archive.arehydrate(conversation)
+
+        history_formatted = list(conversation.recent_turns)
+
+        if history_cache.is_enabled():
+            await history_cache.aset_history(conversation, history_formatted, version)
+
+        return conversation, "\n".join(history_formatted)
+
+    except Exception as e:
+        print(f"Database error fetching conversation {session_id}: {e}")
+        return None, ""
+
+
+def parse_classification_request(body):
     """
-    Handles incoming chat messages, loads history, calls Gemini for structured
-    classification, logs the messages, and returns a JSON response.
+    Parses the classify request body shared by the sync and async views.
+    Returns (user_message, session_id, error_response); error_response is None on success.
     """
-    # System check for client initialization
-    if not client:
-        error_response = PYTHON_ESCALATION_MESSAGES["system_error"]
-        return JsonResponse(error_response, status=500)
-
     try:
-        data = json.loads(request.body)
+        data = json.loads(body)
         user_message = data.get('user_message', '').strip()
         session_id = data.get('session_id')
 
         if not user_message or not session_id:
-            return JsonResponse({"status": "error", "message": "Missing message or session ID."}, status=400)
+            return None, None, JsonResponse({"status": "error", "message": "Missing message or session ID."}, status=400)
 
     except json.JSONDecodeError:
-        return JsonResponse({"error": "Invalid JSON format in request body"}, status=400)
+        return None, None, JsonResponse({"error": "Invalid JSON format in request body"}, status=400)
+
+    return user_message, session_id, None
+
+
+def get_rules_context(user_message, knowledge_base=None):
+    """
+    Returns the rules/knowledge context for the prompt. With RAG retrieval enabled, only
+    the top RAG_TOP_K chunks of the knowledge base for the message are used. Returns
+    None, meaning the whole knowledge base, when retrieval is off, embedding fails or
+    the snapshot's index is still being built.
+    """
+    knowledge_base = knowledge_base or get_knowledge_base()
+    if not settings.RAG_RETRIEVAL_ENABLED or knowledge_base.index is None:
+        return None
+    query_vector = get_query_embedding(user_message)
+    if query_vector is None:
+        return None
+    return retrieve_context(query_vector, top_k=settings.RAG_TOP_K, index=knowledge_base.index) or None
+
+
+async def aget_rules_context(user_message, knowledge_base=None):
+    """Async counterpart of get_rules_context."""
+    knowledge_base = knowledge_base or get_knowledge_base()
+    if not settings.RAG_RETRIEVAL_ENABLED or knowledge_base.index is None:
+        return None
+    query_vector = await aget_query_embedding(user_message)
+    if query_vector is None:
+        return None
+    return retrieve_context(query_vector, top_k=settings.RAG_TOP_K, index=knowledge_base.index) or None
+
+
+def log_ai_response(conversation, validated_output, knowledge_base_version=None):
+    """Logs the AI reply for a validated classification (skipped for no_response)."""
+    if validated_output.status != Status.NO_RESPONSE:
+        log_message(
+            conversation,
+            'ai',
+            validated_output.response_message,
+            topic_category=validated_output.topic.value,
+            status=validated_output.status.value,
+            knowledge_base_version=knowledge_base_version
+        )
+
+
+async def alog_ai_response(conversation, validated_output, knowledge_base_version=None):
+    """Async counterpart of log_ai_response."""
+    if validated_output.status != Status.NO_RESPONSE:
+        await alog_message(
+            conversation,
+            'ai',
+            validated_output.response_message,
+            topic_category=validated_output.topic.value,
+            status=validated_output.status.value,
+            knowledge_base_version=knowledge_base_version
+        )
+
+
+def collect_component_stats() -> dict:
+    """Gauges sampled at scrape time from the fast path, caches, write-behind logger, rollups and RAG index."""
+    gauges = {f"chat_fast_path_{name}": value for name, value in fast_path.get_stats().items()}
+    gauges.update({f"chat_local_classifier_{name}": value for name, value in local_classifier.get_stats().items()})
+    response_cache = get_response_cache()
+    if response_cache:
+        gauges.update({f"chat_response_cache_{name}": value for name, value in response_cache.get_stats().items()})
+    semantic_cache = get_semantic_cache()
+    if semantic_cache:
+        gauges.update({f"chat_semantic_cache_{name}": value for name, value in semantic_cache.get_stats().items()})
+    write_behind = get_write_behind_logger()
+    if write_behind:
+        gauges.update({f"chat_message_log_{name}": value for name, value in write_behind.get_stats().items()})
+    rollups = analytics.get_rollup_accumulator()
+    if rollups:
+        gauges.update({f"chat_analytics_rollup_{name}": value for name, value in rollups.get_stats().items()})
+    rag_index = get_knowledge_base().index
+    if rag_index is not None:
+        gauges.update({f"chat_rag_index_{name}": value for name, value in rag_index.memory_footprint().items()})
+    return gauges
+
+
+metrics.REGISTRY.register_collector(collect_component_stats)
+
 
+def find_shortcut_output(user_message, history_context):
+    """
+    Answers without the LLM where possible: the rule-based fast path first, then the
+    response cache, then the local trained classifier when it is confident, then the
+    semantic cache of paraphrases. Returns (output, source) or (None, None).
+    """
+    with metrics.span('fast_path'):
+        output = fast_path.classify(user_message, history_context)
+    if output:
+        return output, 'fast_path'
+
+    response_cache = get_response_cache()
+    if response_cache:
+        with metrics.span('response_cache'):
+            output = response_cache.get(user_message, history_context)
+        if output:
+            return output, 'response_cache'
+
+    with metrics.span('local_model'):
+        output = local_classifier.classify(user_message, history_context)
+    if output:
+        return output, 'local_model'
+
+    semantic_cache = get_semantic_cache()
+    if semantic_cache:
+        with metrics.span('semantic_cache'):
+            output = semantic_cache.get(user_message, history_context)
+        if output:
+            return output, 'semantic_cache'
+    return None, None
+
+
+def remember_output(user_message, history_context, validated_output):
+    """Stores a fresh Gemini classification in the exact-match and semantic caches."""
+    response_cache = get_response_cache()
+    if response_cache:
+        response_cache.set(user_message, history_context, validated_output)
+    semantic_cache = get_semantic_cache()
+    if semantic_cache:
+        semantic_cache.set(user_message, history_context, validated_output)
+
+
+async def aremember_output(user_message, history_context, validated_output):
+    """Async counterpart of remember_output."""
+    response_cache = get_response_cache()
+    if response_cache:
+        await response_cache.aset(user_message, history_context, validated_output)
+    semantic_cache = get_semantic_cache()
+    if semantic_cache:
+        await semantic_cache.aset(user_message, history_context, validated_output)
+
+
+async def afind_shortcut_output(user_message, history_context):
+    """Async counterpart of find_shortcut_output."""
+    with metrics.span('fast_path'):
+        output = fast_path.classify(user_message, history_context)
+    if output:
+        return output, 'fast_path'
+
+    response_cache = get_response_cache()
+    if response_cache:
+        with metrics.span('response_cache'):
+            output = await response_cache.aget(user_message, history_context)
+        if output:
+            return output, 'response_cache'
+
+    with metrics.span('local_model'):
+        output = local_classifier.classify(user_message, history_context)
+    if output:
+        return output, 'local_model'
+
+    semantic_cache = get_semantic_cache()
+    if semantic_cache:
+        with metrics.span('semantic_cache'):
+            output = await semantic_cache.aget(user_message, history_context)
+        if output:
+            return output, 'semantic_cache'
+    return None, None
+
+
+def generate_classification(contents, generation_config):
+    """Calls Gemini for structured output and validates it into a ClassificationOutput."""
+    with metrics.span('gemini'):
+        response = get_llm().generate(
+            get_client(),
+            model=settings.GEMINI_MODEL,
+            contents=contents,
+            config=generation_config,
+        )
+    metrics.record_token_usage(response)
+
+    # Validate the raw JSON text in one pass (no intermediate dict)
+    with metrics.span('validate'):
+        return ClassificationOutput.model_validate_json(response.text)
+
+
+async def agenerate_classification(contents, generation_config):
+    """Async counterpart of generate_classification using the Gemini async client."""
+    with metrics.span('gemini'):
+        response = await get_llm().agenerate(
+            get_client(),
+            model=settings.GEMINI_MODEL,
+            contents=contents,
+            config=generation_config,
+        )
+    metrics.record_token_usage(response)
+
+    with metrics.span('validate'):
+        return ClassificationOutput.model_validate_json(response.text)
+
+
+def log_system_error(conversation):
+    """Logs the system_error escalation sent for a failed classification."""
+    error_response = PYTHON_ESCALATION_MESSAGES["system_error"]
+    log_message(conversation, 'ai', error_response['message'], status=Status.ESCALATE.value)
+
+
+async def alog_system_error(conversation):
+    """Async counterpart of log_system_error."""
+    error_response = PYTHON_ESCALATION_MESSAGES["system_error"]
+    await alog_message(conversation, 'ai', error_response['message'], status=Status.ESCALATE.value)
+
+
+def run_classification(session_id, user_message):
+    """
+    Loads history, logs the turn and classifies it (fast path, response cache, then
+    Gemini). Returns (validated_output, status_code, source); validated_output is
+    None when the system_error escalation should be returned with status_code.
+    """
     # --- 1. Get History and Prepare Prompt ---
-    conversation, history_context = get_conversation_history(session_id)
+    with metrics.span('history'):
+        conversation, history_context = get_conversation_history(session_id)
     if not conversation:
         # If database fails to connect/fetch, escalate
-        error_response = PYTHON_ESCALATION_MESSAGES["system_error"]
-        return JsonResponse(error_response, status=503)
+        return None, 503, 'error'
 
     # Log the user's message immediately
-    Message.objects.create(conversation=conversation, sender='user', text=user_message)
+    with metrics.span('log_user'):
+        log_message(conversation, 'user', user_message)
 
-    # Construct the full context prompt for the LLM
-    full_prompt = f"""
-    CONVERSATION HISTORY (Most recent message at the bottom):
-    {history_context}
-    [CURRENT_USER_MESSAGE]: "{user_message}"
+    # One knowledge base snapshot serves the whole turn, even if a reload lands meanwhile
+    knowledge_base = get_knowledge_base()
 
-    Based ONLY on the CONVERSATION HISTORY and the Classification Rules provided below,
-    classify the topic, determine the action status, and generate the response message.
+    # Obvious messages are answered by the local rule-based fast path, and repeated
+    # messages with the same recent history by the response cache, without an LLM call
+    shortcut_output, source = find_shortcut_output(user_message, history_context)
+    if shortcut_output:
+        with metrics.span('log_ai'):
+            log_ai_response(conversation, shortcut_output, knowledge_base.version)
+        return shortcut_output, 200, source
 
-    RULES & CONTEXT:
-    {LLM_RAG_CONTEXT}
-    """
+    # The static rules travel in the system instruction (or a cached context); the
+    # per-request contents carry only the budgeted history and the current message
+    with metrics.span('prompt'):
+        contents = build_request_contents(history_context, user_message)
+        rules_context = get_rules_context(user_message, knowledge_base)
+        generation_config = get_generation_config(get_client(), rules_context, knowledge_base)
 
     # --- 2. Call Gemini for Structured Output ---
     try:
-        response = client.models.generate_content(
-            model=settings.GEMINI_MODEL,
-            contents=full_prompt,
-            config={
-                "system_instruction": "You are a highly efficient, professional conversation topic classifier for Twin Health. Your sole output MUST strictly adhere to the provided JSON schema. Adhere to all formatting rules in the CONTEXT.",
-                "response_mime_type": "application/json",
-                "response_json_schema": ClassificationOutput.model_json_schema(),
-            }
-        )
+        validated_output = generate_classification(contents, generation_config)
+        remember_output(user_message, history_context, validated_output)
 
-        # Validate and extract the structured response
-        json_response_data = json.loads(response.text)
-        validated_output = ClassificationOutput(**json_response_data)
-
-        # --- 3. Log AI Response and Return ---
-        ai_message = validated_output.response_message
-        ai_status = validated_output.status.value
-        ai_topic = validated_output.topic.value
-
-        # Log the AI response message
-        if ai_status != Status.NO_RESPONSE.value:
-            Message.objects.create(
-                conversation=conversation,
-                sender='ai',
-                text=ai_message,
-                topic_category=ai_topic,
-                status=ai_status
-            )
+        # --- 3. Log AI Response ---
+        with metrics.span('log_ai'):
+            log_ai_response(conversation, validated_output, knowledge_base.version)
+        return validated_output, 200, 'llm'
+
+    except (gemini_client.APIError, LLMUnavailable) as e:
+        print(f"Gemini API Error: {e}")
+        log_system_error(conversation)
+        return None, 503, 'error'
+
+    except Exception as e:
+        print(f"Unexpected Internal Server Error: {e}")
+        log_system_error(conversation)
+        return None, 500, 'error'
 
-        # Return the structured response back to the frontend
-        return JsonResponse(validated_output.model_dump(), status=200)
 
-    except APIError as e:
+async def arun_classification(session_id, user_message):
+    """Async counterpart of run_classification using the async ORM and Gemini async client."""
+    # --- 1. Get History and Prepare Prompt ---
+    with metrics.span('history'):
+        conversation, history_context = await aget_conversation_history(session_id)
+    if not conversation:
+        return None, 503, 'error'
+
+    with metrics.span('log_user'):
+        await alog_message(conversation, 'user', user_message)
+
+    knowledge_base = get_knowledge_base()
+    shortcut_output, source = await afind_shortcut_output(user_message, history_context)
+    if shortcut_output:
+        with metrics.span('log_ai'):
+            await alog_ai_response(conversation, shortcut_output, knowledge_base.version)
+        return shortcut_output, 200, source
+
+    with metrics.span('prompt'):
+        contents = build_request_contents(history_context, user_message)
+        rules_context = await aget_rules_context(user_message, knowledge_base)
+        generation_config = await aget_generation_config(get_client(), rules_context, knowledge_base)
+
+    # --- 2. Call Gemini for Structured Output (non-blocking) ---
+    try:
+        validated_output = await agenerate_classification(contents, generation_config)
+        await aremember_output(user_message, history_context, validated_output)
+
+        # --- 3. Log AI Response ---
+        with metrics.span('log_ai'):
+            await alog_ai_response(conversation, validated_output, knowledge_base.version)
+        return validated_output, 200, 'llm'
+
+    except (gemini_client.APIError, LLMUnavailable) as e:
         print(f"Gemini API Error: {e}")
-        error_response = PYTHON_ESCALATION_MESSAGES["system_error"]
-        Message.objects.create(conversation=conversation, sender='ai', text=error_response['message'],
-                               status=Status.ESCALATE.value)
-        return JsonResponse(error_response, status=503)
+        await alog_system_error(conversation)
+        return None, 503, 'error'
 
     except Exception as e:
         print(f"Unexpected Internal Server Error: {e}")
-        error_response = PYTHON_ESCALATION_MESSAGES["system_error"]
-        Message.objects.create(conversation=conversation, sender='ai', text=error_response['message'],
-                               status=Status.ESCALATE.value)
-        return JsonResponse(error_response, status=500)
+        await alog_system_error(conversation)
+        return None, 500, 'error'
+
+
+# Frontend retries and double-taps send the same (session_id, user_message) within
+# milliseconds; concurrent copies share one history load, log write and Gemini call.
+# Coalescing is per worker process.
+CLASSIFY_FLIGHTS = SingleFlight()
+ACLASSIFY_FLIGHTS = AsyncSingleFlight()
+
+
+def coalesced_classification(session_id, user_message):
+    """run_classification, shared with identical requests already in flight."""
+    if not getattr(settings, 'CLASSIFY_COALESCING_ENABLED', True):
+        return run_classification(session_id, user_message)
+    (validated_output, status_code, source), shared = CLASSIFY_FLIGHTS.do(
+        (session_id, user_message), lambda: run_classification(session_id, user_message))
+    return validated_output, status_code, 'coalesced' if shared else source
+
+
+async def acoalesced_classification(session_id, user_message):
+    """Async counterpart of coalesced_classification."""
+    if not getattr(settings, 'CLASSIFY_COALESCING_ENABLED', True):
+        return await arun_classification(session_id, user_message)
+    (validated_output, status_code, source), shared = await ACLASSIFY_FLIGHTS.do(
+        (session_id, user_message), lambda: arun_classification(session_id, user_message))
+    return validated_output, status_code, 'coalesced' if shared else source
+
+
+def classification_response(started, validated_output, status_code, source):
+    """Records the request metrics and builds the JSON response shared by the sync and async views."""
+    if validated_output is None:
+        metrics.record_classification(started, 'none', Status.ESCALATE.value, source)
+        return escalation_response("system_error", status_code)
+
+    metrics.record_classification(started, validated_output.topic.value, validated_output.status.value, source)
+    # Return the structured response back to the frontend, serialized straight to bytes
+    return classification_output_response(validated_output)
+
+
+@csrf_exempt  # Required for non-browser-based POST requests
+@api_view(['POST'])  # DRF decorator
+def chat_classification_api(request):
+    """
+    Handles incoming chat messages, loads history, calls Gemini for structured
+    classification, logs the messages, and returns a JSON response.
+    """
+    with metrics.profile_if_slow('classify'):
+        started = time.perf_counter()
+
+        # System check for client initialization
+        if not get_client():
+            return escalation_response("system_error", 500)
+
+        user_message, session_id, error_response = parse_classification_request(request.body)
+        if error_response:
+            return error_response
+
+        validated_output, status_code, source = coalesced_classification(session_id, user_message)
+        return classification_response(started, validated_output, status_code, source)
+
+
+@csrf_exempt
+@require_POST
+async def async_chat_classification_api(request):
+    """
+    Async version of chat_classification_api for ASGI deployments. Uses the Gemini
+    async client and the async ORM so a single worker can hold many in-flight
+    classifications while they wait on the network. The JSON contract is identical.
+    """
+    started = time.perf_counter()
+
+    if not get_client():
+        return escalation_response("system_error", 500)
+
+    user_message, session_id, error_response = parse_classification_request(request.body)
+    if error_response:
+        return error_response
+
+    validated_output, status_code, source = await acoalesced_classification(session_id, user_message)
+    return classification_response(started, validated_output, status_code, source)
+
+
+def stream_classification_output(validated_output):
+    """Yields the SSE events for an already-complete classification (fast path or cache hit)."""
+    yield sse_event('topic', validated_output.topic.value)
+    yield sse_event('status', validated_output.status.value)
+    yield sse_event('token', validated_output.response_message)
+    yield sse_event('result', validated_output.model_dump(mode='json'))
+
+
+@csrf_exempt
+@require_POST
+async def stream_chat_classification_api(request):
+    """
+    Streaming version of the classify endpoint over Server-Sent Events. Uses the
+    SDK's streaming generation and flushes `topic`/`status` as soon as they are
+    generated and `response_message` token by token. The full output is validated
+    and logged at the end of the stream and sent as the final `result` event
+    (or an `error` event carrying the system_error escalation).
+    """
+    started = time.perf_counter()
+
+    if not get_client():
+        return escalation_response("system_error", 500)
+
+    user_message, session_id, error_response = parse_classification_request(request.body)
+    if error_response:
+        return error_response
+
+    with metrics.span('history'):
+        conversation, history_context = await aget_conversation_history(session_id)
+    if not conversation:
+        return escalation_response("system_error", 503)
+
+    with metrics.span('log_user'):
+        await alog_message(conversation, 'user', user_message)
+
+    async def event_stream():
+        knowledge_base = get_knowledge_base()
+        shortcut_output, source = await afind_shortcut_output(user_message, history_context)
+        if shortcut_output:
+            await alog_ai_response(conversation, shortcut_output, knowledge_base.version)
+            metrics.record_classification(started, shortcut_output.topic.value, shortcut_output.status.value,
+                                          source)
+            for event in stream_classification_output(shortcut_output):
+                yield event
+            return
+
+        contents = build_request_contents(history_context, user_message)
+        rules_context = await aget_rules_context(user_message, knowledge_base)
+        generation_config = await aget_generation_config(get_client(), rules_context, knowledge_base)
+        parser = ClassificationStreamParser()
+        try:
+            # Through the resilience layer: deadline, retries before the first chunk, limiter, breaker
+            stream = get_llm().astream(
+                get_client(),
+                model=settings.GEMINI_MODEL,
+                contents=contents,
+                config=generation_config,
+            )
+            first_token = True
+            async for chunk in stream:
+                if first_token:
+                    metrics.STAGE_SECONDS.observe(time.perf_counter() - started, stage='stream_first_chunk')
+                    first_token = False
+                metrics.record_token_usage(chunk)
+                for event in parser.feed(chunk.text or ""):
+                    if event[0] == 'field':
+                        yield sse_event(event[1], event[2])
+                    else:
+                        yield sse_event('token', event[1])
+
+            # Validate the complete output, then log it and send the final result
+            with metrics.span('validate'):
+                validated_output = ClassificationOutput.model_validate_json(parser.text)
+            await aremember_output(user_message, history_context, validated_output)
+            await alog_ai_response(conversation, validated_output, knowledge_base.version)
+            metrics.record_classification(started, validated_output.topic.value, validated_output.status.value,
+                                          'llm_stream')
+            yield sse_event('result', validated_output.model_dump(mode='json'))
+
+        except Exception as e:
+            print(f"Streaming classification error: {e}")
+            error_response = PYTHON_ESCALATION_MESSAGES["system_error"]
+            await alog_message(conversation, 'ai', error_response['message'], status=Status.ESCALATE.value)
+            metrics.record_classification(started, 'none', Status.ESCALATE.value, 'error')
+            yield sse_event('error', error_response)
+
+    response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Disable proxy buffering (e.g. nginx) so events flush immediately
+    return response
+
+
+async def aclassify_message(user_message, history_context, llm_semaphore, knowledge_base):
+    """
+    Classifies one message for the batch endpoint: fast path and response cache first,
+    otherwise a Gemini call holding one of the batch's bounded concurrency slots.
+    Returns (output, source).
+    """
+    shortcut_output, source = await afind_shortcut_output(user_message, history_context)
+    if shortcut_output:
+        return shortcut_output, source
+
+    async with llm_semaphore:
+        contents = build_request_contents(history_context, user_message)
+        rules_context = await aget_rules_context(user_message, knowledge_base)
+        generation_config = await aget_generation_config(get_client(), rules_context, knowledge_base)
+        validated_output = await agenerate_classification(contents, generation_config)
+
+    await aremember_output(user_message, history_context, validated_output)
+    return validated_output, 'llm'
+
+
+async def aclassify_session_items(conversation, lines, items, llm_semaphore, knowledge_base, results, messages):
+    """
+    Classifies one session's batch items in request order, so a later reply sees the
+    earlier ones in its history. Fills `results` by item index and collects the
+    Message rows to write; returns the session's updated history lines.
+    """
+    for index, user_message in items:
+        started = time.perf_counter()
+        history_context = "\n".join(lines[-batch.HISTORY_TURNS:])
+        messages.append(build_message(conversation, 'user', user_message))
+        lines.append(history_cache.format_history_line('user', user_message))
+
+        try:
+            validated_output, source = await aclassify_message(user_message, history_context, llm_semaphore,
+                                                               knowledge_base)
+        except Exception as e:
+            print(f"Batch classification error for {conversation.session_id}: {e}")
+            error_response = PYTHON_ESCALATION_MESSAGES["system_error"]
+            messages.append(build_message(conversation, 'ai', error_response['message'], status=Status.ESCALATE.value))
+            lines.append(history_cache.format_history_line('ai', error_response['message']))
+            metrics.record_classification(started, 'none', Status.ESCALATE.value, 'error')
+            results[index] = {"session_id": conversation.session_id,
+                              "status_code": 503 if isinstance(e, (gemini_client.APIError, LLMUnavailable)) else 500, "error": error_response}
+            continue
+
+        if validated_output.status != Status.NO_RESPONSE:
+            messages.append(build_message(conversation, 'ai', validated_output.response_message,
+                                          topic_category=validated_output.topic.value,
+                                          status=validated_output.status.value,
+                                          knowledge_base_version=knowledge_base.version))
+            lines.append(history_cache.format_history_line('ai', validated_output.response_message))
+        metrics.record_classification(started, validated_output.topic.value, validated_output.status.value, source)
+        results[index] = {"session_id": conversation.session_id, "status_code": 200,
+                          "result": validated_output.model_dump(mode='json')}
+    return lines
+
+
+@csrf_exempt
+@require_POST
+async def batch_chat_classification_api(request):
+    """
+    Classifies many {session_id, user_message} items in one request (e.g. a burst of
+    SMS replies to a reminder campaign). All conversations and histories are loaded
+    with bulk queries, Gemini calls run with at most BATCH_LLM_CONCURRENCY in flight,
+    every Message row is written with one bulk_create, and results come back in
+    request order with a per-item status_code and either `result` or `error`.
+    """
+    if not get_client():
+        return escalation_response("system_error", 500)
+
+    items, error = batch.parse_batch_request(request.body)
+    if error:
+        return JsonResponse(error, status=400)
+
+    results = [None] * len(items)
+    by_session = {}
+    for index, (session_id, user_message, item_error) in enumerate(items):
+        if item_error:
+            results[index] = {"session_id": session_id, "status_code": 400, "error": item_error}
+        else:
+            by_session.setdefault(session_id, []).append((index, user_message))
+
+    # --- 1. Load Every Conversation and History in Bulk ---
+    try:
+        with metrics.span('batch_history'):
+            conversations = await batch.aload_conversations(list(by_session))
+            histories = batch.load_histories(conversations)
+    except Exception as e:
+        print(f"Database error loading batch conversations: {e}")
+        return escalation_response("system_error", 503)
+
+    # --- 2. Classify, One Task per Session ---
+    llm_semaphore = asyncio.Semaphore(getattr(settings, 'BATCH_LLM_CONCURRENCY', 16))
+    knowledge_base = get_knowledge_base()
+    messages = []
+    session_ids = list(by_session)
+    await asyncio.gather(*(
+        aclassify_session_items(conversations[session_id], histories[session_id], by_session[session_id],
+                                llm_semaphore, knowledge_base, results, messages)
+        for session_id in session_ids
+    ))
+
+    # --- 3. Log Every Message with bulk_create ---
+    try:
+        with metrics.span('batch_log'):
+            messages.sort(key=lambda message: message.timestamp)
+            await abulk_log_messages(messages)
+            if history_cache.is_enabled():
+                await history_cache.arefresh_many([conversations[session_id] for session_id in session_ids])
+    except Exception as e:
+        # The classifications are still returned; only the audit log write failed
+        print(f"Database error logging batch messages: {e}")
+
+    return json_response(serialization.dumps({"results": results}))
+
+
+def metrics_endpoint(request):
+    """Exposes the classify-path metrics in the Prometheus text format at /metrics."""
+    return HttpResponse(metrics.REGISTRY.expose(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@require_GET
+def stats_endpoint(request):
+    """
+    Read-only dashboard data at /api/stats/?hours=24: hourly topic_category x status
+    counts and escalation rates, served from the rollup table (never from Message) and
+    cached for ANALYTICS_STATS_CACHE_TTL seconds.
+    """
+    max_hours = getattr(settings, 'ANALYTICS_MAX_HOURS', 24 * 31)
+    try:
+        hours = int(request.GET.get('hours', 24))
+    except ValueError:
+        hours = 0
+    if not 1 <= hours <= max_hours:
+        return JsonResponse({"error": f"hours must be an integer from 1 to {max_hours}."}, status=400)
+    return json_response(analytics.get_stats_payload(hours))
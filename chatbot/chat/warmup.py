@@ -0,0 +1,54 @@
+# chat/warmup.py
+
+import threading
+import time
+
+from django.conf import settings
+
+_warmed = threading.Event()
+
+
+def warm_up() -> list[tuple[str, float]]:
+    """
+    Builds the lazily initialized parts of the classify path before the first request
+    needs them: the shared Gemini client (and the google.genai import behind it), the
+    response schema, the knowledge base snapshot and, when enabled, its RAG index, the
+    local classifier, the LLM resilience layer and the response caches. Returns
+    (step, seconds) pairs; later calls in the same process are no-ops.
+    """
+    if _warmed.is_set():
+        return []
+
+    from . import local_classifier
+    from .gemini_client import get_client
+    from .knowledge_base import get_knowledge_base
+    from .llm_resilience import get_llm
+    from .prompt_builder import response_json_schema
+    from .response_cache import get_response_cache
+    from .semantic_cache import get_semantic_cache
+
+    steps = [
+        ('gemini_client', get_client),
+        ('response_schema', response_json_schema),
+        ('knowledge_base', get_knowledge_base),
+        ('llm_layer', get_llm),
+        ('caches', lambda: (get_response_cache(), get_semantic_cache())),
+    ]
+    if settings.RAG_RETRIEVAL_ENABLED:
+        # Fills the on-disk embedding cache and ANN index too, so later boots only read them
+        steps.append(('rag_index', lambda: get_knowledge_base().embed()))
+    if getattr(settings, 'LOCAL_CLASSIFIER_ENABLED', False):
+        steps.append(('local_classifier', lambda: local_classifier.get_model_loader().get()))
+
+    timings = []
+    for name, step in steps:
+        started = time.perf_counter()
+        step()
+        timings.append((name, time.perf_counter() - started))
+    _warmed.set()
+    return timings
+
+
+def start_background_warm_up():
+    """Runs warm_up on a daemon thread so a worker accepts requests while it warms."""
+    threading.Thread(target=warm_up, daemon=True, name='warmup').start()
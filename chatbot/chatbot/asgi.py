@@ -5,6 +5,11 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
+
+Async views such as ``chat.views.async_chat_classification_api`` only run
+natively (without a thread per request) when served through this module, e.g.:
+
+    gunicorn chatbot.asgi:application -k uvicorn.workers.UvicornWorker
 """
 
 import os
@@ -22,6 +22,165 @@ ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', '127.0.0.1,localhost').split(',')
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-2.5-flash')
 
+# --- Prompt Layout ---
+# The static rules are sent as the system instruction; with context caching enabled they
+# are stored once server-side (SDK caches API) and referenced by name on every call.
+GEMINI_CONTEXT_CACHE_ENABLED = os.getenv('GEMINI_CONTEXT_CACHE_ENABLED', 'False') == 'True'
+GEMINI_CONTEXT_CACHE_TTL = int(os.getenv('GEMINI_CONTEXT_CACHE_TTL', '3600'))
+# Approximate token budget for the conversation history sent with each request.
+PROMPT_HISTORY_TOKEN_BUDGET = int(os.getenv('PROMPT_HISTORY_TOKEN_BUDGET', '1000'))
+
+# --- Knowledge Base ---
+# Classification rules and program facts as markdown files (concatenated in file-name order).
+# Edits are picked up by running workers within KNOWLEDGE_BASE_RELOAD_INTERVAL seconds; the
+# content hash is the knowledge base version stamped on cache keys and logged AI messages.
+KNOWLEDGE_BASE_DIR = os.getenv('KNOWLEDGE_BASE_DIR', str(Path(__file__).resolve().parent.parent / 'chat' / 'knowledge'))
+KNOWLEDGE_BASE_RELOAD_INTERVAL = float(os.getenv('KNOWLEDGE_BASE_RELOAD_INTERVAL', '5'))
+
+# --- RAG Retrieval ---
+# When enabled, the knowledge base is embedded per section on load (in the background) and only
+# the top RAG_TOP_K sections most similar to the user message are sent in the prompt.
+RAG_RETRIEVAL_ENABLED = os.getenv('RAG_RETRIEVAL_ENABLED', 'False') == 'True'
+RAG_TOP_K = int(os.getenv('RAG_TOP_K', '3'))
+# Above RAG_ANN_MIN_CHUNKS chunks retrieval uses an approximate IVF index (chat/rag_core/ann_index.py)
+# with RAG_ANN_LISTS cells (0 = about 4 * sqrt(chunks)), searching the RAG_ANN_PROBES closest cells.
+# Raise the probes for recall, lower them for latency; `manage.py benchmark_ann` reports recall@k.
+RAG_ANN_MIN_CHUNKS = int(os.getenv('RAG_ANN_MIN_CHUNKS', '20000'))
+RAG_ANN_LISTS = int(os.getenv('RAG_ANN_LISTS', '0'))
+RAG_ANN_PROBES = int(os.getenv('RAG_ANN_PROBES', '8'))
+# RAG_VECTOR_PRECISION = float16 or int8 keeps the exact index as compact codes (4x smaller
+# for int8) and scores on them; RAG_RERANK_CANDIDATES > 0 re-scores that many of the best
+# candidates at full precision. Memory and recall against float32 are logged at build time.
+RAG_VECTOR_PRECISION = os.getenv('RAG_VECTOR_PRECISION', 'float32')
+RAG_RERANK_CANDIDATES = int(os.getenv('RAG_RERANK_CANDIDATES', '0'))
+# Content-addressed on-disk embedding cache shared (memory-mapped) by all workers.
+# Pre-warm at deploy time with `python manage.py warm_embeddings`; set empty to disable.
+EMBEDDING_CACHE_DIR = os.getenv('EMBEDDING_CACHE_DIR', str(BASE_DIR / 'embedding_cache'))
+# Batched embedding pipeline: texts per embed_content call, character budget per call,
+# concurrent calls in flight, and retries (exponential backoff with jitter) per batch.
+EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', '100'))
+EMBEDDING_BATCH_MAX_CHARS = int(os.getenv('EMBEDDING_BATCH_MAX_CHARS', '60000'))
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv('EMBEDDING_MAX_CONCURRENCY', '4'))
+EMBEDDING_MAX_RETRIES = int(os.getenv('EMBEDDING_MAX_RETRIES', '3'))
+EMBEDDING_RETRY_BASE_DELAY = float(os.getenv('EMBEDDING_RETRY_BASE_DELAY', '0.5'))
+
+# --- Session History Cache ---
+# Pre-formatted ring buffer of the last HISTORY_CACHE_TURNS messages per session_id
+# (chat/history_cache.py), rebuilt after every Message write and versioned with an atomic
+# incr so concurrent writers cannot drop each other's turns. Only enable with a shared
+# CACHES backend when running several workers, otherwise each worker's copy goes stale.
+HISTORY_CACHE_ENABLED = os.getenv('HISTORY_CACHE_ENABLED', 'False') == 'True'
+HISTORY_CACHE_ALIAS = os.getenv('HISTORY_CACHE_ALIAS', 'default')
+HISTORY_CACHE_TURNS = int(os.getenv('HISTORY_CACHE_TURNS', '10'))
+HISTORY_CACHE_TTL = int(os.getenv('HISTORY_CACHE_TTL', '86400'))
+
+# --- Write-Behind Message Logging ---
+# Queue Message rows in memory and insert them with bulk_create from a background thread
+# (chat/message_logger.py) once MESSAGE_LOG_BATCH_SIZE rows are queued or every
+# MESSAGE_LOG_FLUSH_INTERVAL seconds, so responses never wait on the SQLite write lock.
+# Queued messages reach Conversation.recent_turns only when flushed, so enable
+# HISTORY_CACHE_ENABLED with it: otherwise the next turn's history can miss them.
+MESSAGE_WRITE_BEHIND = os.getenv('MESSAGE_WRITE_BEHIND', 'False') == 'True'
+MESSAGE_LOG_BATCH_SIZE = int(os.getenv('MESSAGE_LOG_BATCH_SIZE', '100'))
+MESSAGE_LOG_FLUSH_INTERVAL = float(os.getenv('MESSAGE_LOG_FLUSH_INTERVAL', '0.5'))
+MESSAGE_LOG_MAX_QUEUE = int(os.getenv('MESSAGE_LOG_MAX_QUEUE', '10000'))
+
+# --- Classification Fast Path ---
+# Rule-based pre-classifier (chat/fast_path.py) that answers obvious messages without an LLM call.
+FAST_PATH_ENABLED = os.getenv('FAST_PATH_ENABLED', 'True') == 'True'
+FAST_PATH_MAX_WORDS = int(os.getenv('FAST_PATH_MAX_WORDS', '12'))
+
+# --- Local Trained Classifier ---
+# Hashed n-gram linear model (chat/local_classifier.py) trained on logged Message data with
+# `manage.py train_local_classifier`. Tried after the fast path and response cache; answers
+# LAB / TWIN_APPOINTMENT locally when its probability is at least LOCAL_CLASSIFIER_THRESHOLD
+# (compare with the `confidence` Gemini reports), otherwise Gemini is called. The artifact
+# is reloaded automatically when it changes on disk.
+LOCAL_CLASSIFIER_ENABLED = os.getenv('LOCAL_CLASSIFIER_ENABLED', 'False') == 'True'
+LOCAL_CLASSIFIER_PATH = os.getenv('LOCAL_CLASSIFIER_PATH', str(BASE_DIR / 'local_classifier.npz'))
+LOCAL_CLASSIFIER_THRESHOLD = float(os.getenv('LOCAL_CLASSIFIER_THRESHOLD', '0.9'))
+LOCAL_CLASSIFIER_RELOAD_INTERVAL = float(os.getenv('LOCAL_CLASSIFIER_RELOAD_INTERVAL', '5'))
+
+# --- Classification Response Cache ---
+# Exact-match cache of validated classifications (chat/response_cache.py).
+# Backend: 'local' (per-process LRU), 'django' (shared via CACHES) or 'none'.
+RESPONSE_CACHE_BACKEND = os.getenv('RESPONSE_CACHE_BACKEND', 'local')
+RESPONSE_CACHE_ALIAS = os.getenv('RESPONSE_CACHE_ALIAS', 'default')
+RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', '3600'))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '1024'))
+RESPONSE_CACHE_HISTORY_TURNS = int(os.getenv('RESPONSE_CACHE_HISTORY_TURNS', '2'))
+
+# --- Semantic Response Cache ---
+# Reuses a classification for paraphrased messages (chat/semantic_cache.py) when the
+# message embedding's cosine similarity to a cached one is at least SEMANTIC_CACHE_THRESHOLD.
+# Only standalone messages (SEMANTIC_CACHE_MIN_WORDS+ words) classified without history are stored.
+SEMANTIC_CACHE_ENABLED = os.getenv('SEMANTIC_CACHE_ENABLED', 'False') == 'True'
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.92'))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv('SEMANTIC_CACHE_MAX_ENTRIES', '2048'))
+SEMANTIC_CACHE_TTL = int(os.getenv('SEMANTIC_CACHE_TTL', '3600'))
+SEMANTIC_CACHE_MIN_WORDS = int(os.getenv('SEMANTIC_CACHE_MIN_WORDS', '3'))
+
+# --- Resilient LLM Calls ---
+# chat/llm_resilience.py: every classify call gets LLM_DEADLINE_SECONDS in total, retryable
+# errors (429/5xx) are retried with jittered backoff, in-flight calls are capped by an
+# AIMD limit between LLM_CONCURRENCY_MIN and LLM_CONCURRENCY_MAX (calls over it queue for a
+# slot until their deadline), and a circuit breaker fails fast to the system_error
+# escalation after consecutive upstream failures.
+# Hedging sends a duplicate request after the recent p95 latency (costs extra quota).
+LLM_DEADLINE_SECONDS = float(os.getenv('LLM_DEADLINE_SECONDS', '20'))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '2'))
+LLM_RETRY_BASE_DELAY = float(os.getenv('LLM_RETRY_BASE_DELAY', '0.25'))
+LLM_HEDGING_ENABLED = os.getenv('LLM_HEDGING_ENABLED', 'False') == 'True'
+LLM_HEDGE_DELAY_SECONDS = float(os.getenv('LLM_HEDGE_DELAY_SECONDS', '2.0'))
+LLM_CONCURRENCY_INITIAL = int(os.getenv('LLM_CONCURRENCY_INITIAL', '16'))
+LLM_CONCURRENCY_MIN = int(os.getenv('LLM_CONCURRENCY_MIN', '2'))
+LLM_CONCURRENCY_MAX = int(os.getenv('LLM_CONCURRENCY_MAX', '64'))
+LLM_BREAKER_FAILURE_THRESHOLD = int(os.getenv('LLM_BREAKER_FAILURE_THRESHOLD', '5'))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv('LLM_BREAKER_RESET_SECONDS', '30'))
+
+# --- Request Coalescing ---
+# Identical (session_id, user_message) classify requests that arrive while one is
+# already in flight share its result instead of calling Gemini and logging again.
+CLASSIFY_COALESCING_ENABLED = os.getenv('CLASSIFY_COALESCING_ENABLED', 'True') == 'True'
+
+# --- Batch Classification ---
+# /api/classify/batch/ accepts up to BATCH_MAX_ITEMS items and keeps at most
+# BATCH_LLM_CONCURRENCY Gemini calls in flight per request.
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', '1000'))
+BATCH_LLM_CONCURRENCY = int(os.getenv('BATCH_LLM_CONCURRENCY', '16'))
+
+# --- Worker Startup ---
+# The Gemini client, google.genai import, response schema and RAG artifacts are created on
+# first use. With WARMUP_ON_STARTUP each process builds them on a background thread as soon
+# as Django is ready (under gunicorn --preload, call chat.warmup.warm_up from post_fork
+# instead). `python manage.py warmup --benchmark 5` reports cold boot and warm-up times.
+WARMUP_ON_STARTUP = os.getenv('WARMUP_ON_STARTUP', 'False') == 'True'
+
+# --- Analytics Rollups ---
+# Hourly topic_category x status counts of AI replies (chat/analytics.py) behind /api/stats/.
+# Counted in memory as messages are logged and added to the rollup table every
+# ANALYTICS_FLUSH_INTERVAL seconds. Backfill, and make closed hours exact, with
+# `python manage.py rollup_analytics [--hours N]`; it leaves an hour alone until
+# ANALYTICS_FLUSH_INTERVAL (plus a margin) after it closed, so flushes are not double counted.
+ANALYTICS_ROLLUPS_ENABLED = os.getenv('ANALYTICS_ROLLUPS_ENABLED', 'False') == 'True'
+ANALYTICS_FLUSH_INTERVAL = float(os.getenv('ANALYTICS_FLUSH_INTERVAL', '10'))
+ANALYTICS_CACHE_ALIAS = os.getenv('ANALYTICS_CACHE_ALIAS', 'default')
+ANALYTICS_STATS_CACHE_TTL = int(os.getenv('ANALYTICS_STATS_CACHE_TTL', '30'))
+ANALYTICS_MAX_HOURS = int(os.getenv('ANALYTICS_MAX_HOURS', '744'))
+
+# --- Conversation Archival ---
+# `python manage.py archive_conversations` moves the messages of conversations idle for
+# ARCHIVE_INACTIVE_DAYS into one compressed blob per conversation (chat/archive.py); they
+# are moved back transparently the next time the session classifies a message.
+ARCHIVE_INACTIVE_DAYS = int(os.getenv('ARCHIVE_INACTIVE_DAYS', '30'))
+
+# --- Instrumentation ---
+# Per-stage latency histograms are always on and served at /metrics (chat/metrics.py).
+# A PROFILER_SAMPLE_RATE fraction of sync classify requests is run under cProfile, and
+# the profile is printed for any sampled request slower than PROFILER_SLOW_SECONDS.
+PROFILER_SAMPLE_RATE = float(os.getenv('PROFILER_SAMPLE_RATE', '0.0'))
+PROFILER_SLOW_SECONDS = float(os.getenv('PROFILER_SLOW_SECONDS', '2.0'))
+
 # --- Application Definition ---
 INSTALLED_APPS = [
     'django.contrib.admin',
@@ -80,6 +239,17 @@ DATABASES = {
     }
 }
 
+# --- Caches ---
+# LocMemCache is per-process. Point CACHE_BACKEND/CACHE_LOCATION at a shared backend
+# (e.g. django.core.cache.backends.redis.RedisCache, redis://...) so every gunicorn
+# worker sees the same history and response caches.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
 # --- Static Files ---
 STATIC_URL = 'static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
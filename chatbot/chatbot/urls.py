@@ -3,6 +3,8 @@
 from django.contrib import admin
 from django.urls import path, include
 
+from chat.views import metrics_endpoint
+
 urlpatterns = [
     # Optional: Keep the admin interface for managing models
     path('admin/', admin.site.urls),
@@ -15,4 +17,7 @@ urlpatterns = [
 
     # The standard, correct way to include app URLs:
     path('api/', include('chat.urls')),
+
+    # Prometheus scrape target for the classify-path metrics (chat/metrics.py)
+    path('metrics', metrics_endpoint, name='metrics'),
 ]